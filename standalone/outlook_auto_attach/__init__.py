@@ -0,0 +1,7 @@
+"""Outlook Auto Attach: watches the Downloads folder and opens Outlook drafts with matching files attached."""
+
+import time
+
+# Startup timings are measured from here (see StartupTimer). Submodules are imported where they are used,
+# so a process pool worker or the headless app only loads what it needs.
+_MODULE_START = time.perf_counter()
@@ -0,0 +1,484 @@
+"""Moving files into the archive folders, and the archive index and upkeep."""
+
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import contextlib
+import zipfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from .settings import JOURNAL_FILE
+from .rules import DEFAULT_OUTPUT_TEMPLATE, format_archive_name, get_rule_engine, is_temporary_file
+
+logger = logging.getLogger(__name__)
+
+
+# Subfolder of the archive each copy goes into, by archive date (archive_shard setting)
+ARCHIVE_SHARDS = {
+    'flat': None,
+    'month': os.path.join('%Y', '%m'),
+    'day': os.path.join('%Y', '%m', '%d'),
+}
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """Stream the file through SHA-256. Returns (hex digest, size in bytes)."""
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    size = 0
+    with open(file_path, 'rb', buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+            size += read
+    return digest.hexdigest(), size
+
+
+def get_archive_folder(archive_dir=None):
+    """Folder where processed files are kept (default: ~/Desktop/businessnxtdocs)."""
+    if archive_dir:
+        return os.path.expanduser(archive_dir)
+    return os.path.join(os.path.expanduser("~"), "Desktop", "businessnxtdocs")
+
+
+def _copy_with_hash(fsrc, fdst, chunk_size=1024 * 1024):
+    """Copy between open files in a single pass, hashing the data on the way. Returns (digest, size)."""
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    size = 0
+    while True:
+        read = fsrc.readinto(buffer)
+        if not read:
+            break
+        digest.update(view[:read])
+        fdst.write(view[:read])
+        size += read
+    return digest.hexdigest(), size
+
+
+def _kernel_copy(source_path, dest_path):
+    """Copy file contents without passing them through Python (copy_file_range, else the platform fast copy)."""
+    if hasattr(os, 'copy_file_range'):  # Linux - can also use reflinks on btrfs/xfs
+        with open(source_path, 'rb') as fsrc, open(dest_path, 'wb') as fdst:
+            try:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 64 * 1024 * 1024):
+                    pass
+                return
+            except OSError:
+                # Not supported for this pair of filesystems - fall back below
+                pass
+    # Uses sendfile on Linux, fcopyfile on macOS and large buffers on Windows
+    shutil.copyfile(source_path, dest_path)
+
+
+def transfer_file(source_path, dest_path, compute_hash=True, allow_rename=True):
+    """Move a file in one pass over its data (rename, or copy + fsync + rename); returns (hash, size, method)."""
+    dest_dir = os.path.dirname(dest_path)
+    size = os.stat(source_path).st_size
+    
+    if allow_rename and os.stat(source_path).st_dev == os.stat(dest_dir).st_dev:
+        digest = hash_file(source_path)[0] if compute_hash else None
+        try:
+            os.rename(source_path, dest_path)
+            return digest, size, 'rename'
+        except OSError as e:
+            # e.g. EXDEV on bind mounts that report the same device
+            logger.debug("Rename failed, copying instead: %s", e)
+    
+    temp_path = os.path.join(dest_dir, f".{os.path.basename(dest_path)}.part")
+    digest = None
+    try:
+        if compute_hash:
+            with open(source_path, 'rb', buffering=0) as fsrc, open(temp_path, 'wb', buffering=0) as fdst:
+                digest, size = _copy_with_hash(fsrc, fdst)
+                os.fsync(fdst.fileno())
+        else:
+            _kernel_copy(source_path, temp_path)
+            with open(temp_path, 'rb+') as fdst:
+                os.fsync(fdst.fileno())
+        shutil.copystat(source_path, temp_path)
+        os.replace(temp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    
+    try:
+        os.remove(source_path)
+    except OSError as e:
+        logger.warning("Could not delete original file %s: %s", os.path.basename(source_path), e)
+    return digest, size, 'copy'
+
+
+def archive_shard_folder(archive_root, shard='month', when=None):
+    """Folder inside the archive for a copy archived at `when` (datetime, default now)."""
+    shard_format = ARCHIVE_SHARDS.get(shard)
+    if not shard_format:
+        return archive_root
+    return os.path.join(archive_root, (when or datetime.now()).strftime(shard_format))
+
+
+def move_to_archive(original_path, archive_dir=None, compute_hash=True, rule=None, shard='month'):
+    """Move the file into its archive shard under a unique name; returns (path, content hash, size)."""
+    if not os.path.exists(original_path):
+        logger.error("File not found: %s", original_path)
+        return None, None, None
+    
+    try:
+        original_name = os.path.basename(original_path)
+        now = datetime.now()
+        businessnxtdocs_dir = archive_shard_folder(get_archive_folder(archive_dir), shard, now)
+        os.makedirs(businessnxtdocs_dir, exist_ok=True)
+        
+        if rule is None:
+            rule = get_rule_engine().classify(original_name)
+        if rule is not None:
+            unique_name = rule.format_name(original_name, now)
+        else:
+            unique_name = format_archive_name(DEFAULT_OUTPUT_TEMPLATE, "File", original_name, now)
+        unique_path = os.path.join(businessnxtdocs_dir, unique_name)
+        
+        try:
+            content_hash, size, method = transfer_file(original_path, unique_path, compute_hash=compute_hash)
+            logger.info("Moved to archive (%s): %s", method, unique_path)
+            return unique_path, content_hash, size
+        except (PermissionError, OSError) as e:
+            logger.warning("Could not move file, using original: %s", e)
+        
+    except Exception as e:
+        logger.error("Error moving file to archive: %s", e)
+    
+    # Fall back to attaching the file from Downloads
+    content_hash, size = hash_file(original_path) if compute_hash else (None, None)
+    return original_path, content_hash, size
+
+
+class ArchiveIndex:
+    """Where every archived copy lives (file or zip bundle member), stored in SQLite next to the journal."""
+    
+    COLUMNS = ('id', 'original_name', 'content_hash', 'size', 'archived_at', 'root', 'path', 'member')
+    
+    def __init__(self, db_path=JOURNAL_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS archive (
+                id INTEGER PRIMARY KEY,
+                original_name TEXT NOT NULL,
+                content_hash TEXT,
+                size INTEGER,
+                archived_at REAL NOT NULL,
+                root TEXT NOT NULL,
+                path TEXT NOT NULL,
+                member TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS archive_hash ON archive (content_hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS archive_name ON archive (original_name)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS archive_time ON archive (archived_at)")
+    
+    def _rows(self, sql, params=()):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+    
+    def add(self, original_name, content_hash, size, root, path, archived_at=None):
+        """Record an archived copy. Returns its id."""
+        with self._lock:
+            return self._conn.execute(
+                "INSERT INTO archive (original_name, content_hash, size, archived_at, root, path) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (original_name, content_hash, size, archived_at or time.time(), root, path)
+            ).lastrowid
+    
+    def find(self, content_hash=None, original_name=None, limit=100):
+        """Archived copies with this content and/or original name, newest first."""
+        conditions, params = [], []
+        if content_hash is not None:
+            conditions.append("content_hash = ?")
+            params.append(content_hash)
+        if original_name is not None:
+            conditions.append("original_name = ?")
+            params.append(original_name)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return self._rows(
+            "SELECT %s FROM archive%s ORDER BY archived_at DESC LIMIT ?" % (", ".join(self.COLUMNS), where),
+            params + [limit]
+        )
+    
+    def plain_files(self, before, after=0.0, limit=100):
+        """Copies archived in [after, before) that are still plain files, oldest first (limit None = all)."""
+        return self._rows(
+            "SELECT %s FROM archive WHERE member IS NULL AND archived_at >= ? AND archived_at < ? "
+            "ORDER BY archived_at LIMIT ?" % ", ".join(self.COLUMNS),
+            (after, before, -1 if limit is None else limit)
+        )
+    
+    def expired_bundles(self, before):
+        """Zip bundles whose newest member was archived before this time."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM archive WHERE member IS NOT NULL GROUP BY path HAVING MAX(archived_at) < ?",
+                (before,)
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def move_to_bundle(self, moves, bundle_path):
+        """Point the given {id: member name} copies at their member in a zip bundle (one transaction)."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "UPDATE archive SET path = ?, member = ? WHERE id = ?",
+                    [(bundle_path, member, entry_id) for entry_id, member in moves.items()]
+                )
+    
+    def remove(self, entry_ids):
+        """Forget the given copies."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM archive WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+    
+    def remove_bundle(self, bundle_path):
+        """Forget every copy in a zip bundle."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM archive WHERE path = ?", (bundle_path,)).rowcount
+    
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM archive").fetchone()[0]
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ArchiveMaintainer:
+    """Background upkeep of the archive: sharding flat files, retention and monthly zip bundles."""
+    
+    def __init__(self, index, roots, shard='month', retention_days=None, compact_after_months=None,
+                 interval=3600.0, files_per_second=20.0, busy=None, start_delay=60.0):
+        self.index = index
+        self.roots = list(dict.fromkeys(roots))
+        self.shard = shard
+        self.retention_days = retention_days
+        self.compact_after_months = compact_after_months
+        self.interval = interval
+        self.files_per_second = files_per_second
+        self.busy = busy
+        self.start_delay = start_delay
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.totals = {'migrated': 0, 'deleted': 0, 'bundled': 0, 'bundles_deleted': 0, 'passes': 0}
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="archive-maintainer", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self, timeout=5.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _run(self):
+        if self._stop_event.wait(self.start_delay):
+            return
+        while not self._stop_event.is_set():
+            try:
+                counts = self.run_once()
+                if any(counts.values()):
+                    logger.info("Archive cleanup: %s", counts)
+            except Exception as e:
+                logger.error("Archive cleanup failed: %s", e)
+            if self._stop_event.wait(self.interval):
+                return
+    
+    def _throttle(self):
+        """Pace the work and wait while live processing is busy. False once stopping."""
+        if self.files_per_second and self._stop_event.wait(1.0 / self.files_per_second):
+            return False
+        while self.busy is not None and self.busy():
+            if self._stop_event.wait(0.5):
+                return False
+        return True
+    
+    def run_once(self):
+        """One cleanup pass. Returns the number of files migrated, deleted and bundled."""
+        counts = {'migrated': 0, 'deleted': 0, 'bundled': 0, 'bundles_deleted': 0}
+        if ARCHIVE_SHARDS.get(self.shard):
+            for root in self.roots:
+                counts['migrated'] += self._migrate_flat(root)
+        if self.retention_days is not None:
+            cutoff = time.time() - self.retention_days * 86400
+            counts['deleted'], counts['bundles_deleted'] = self._delete_expired(cutoff)
+        if self.compact_after_months is not None and ARCHIVE_SHARDS.get(self.shard):
+            counts['bundled'] = self._compact(self._month_start(self.compact_after_months))
+        for key, value in counts.items():
+            self.totals[key] += value
+        self.totals['passes'] += 1
+        return counts
+    
+    @staticmethod
+    def _month_start(months_ago):
+        """Timestamp of the first day of the month `months_ago` months before the current one."""
+        now = datetime.now()
+        month_index = now.year * 12 + now.month - 1 - int(months_ago)
+        return datetime(month_index // 12, month_index % 12 + 1, 1).timestamp()
+    
+    def _migrate_flat(self, root):
+        """Move files lying directly in the archive folder into their shard (by modification time)."""
+        migrated = 0
+        try:
+            entries = [entry for entry in os.scandir(root) if entry.is_file(follow_symlinks=False)]
+        except OSError:
+            return 0
+        for entry in entries:
+            if is_temporary_file(entry.name):
+                continue
+            if not self._throttle():
+                break
+            try:
+                archived_at = entry.stat().st_mtime
+                shard_dir = archive_shard_folder(root, self.shard, datetime.fromtimestamp(archived_at))
+                dest = os.path.join(shard_dir, entry.name)
+                if os.path.exists(dest):
+                    continue
+                content_hash, size = hash_file(entry.path)
+                os.makedirs(shard_dir, exist_ok=True)
+                os.rename(entry.path, dest)
+                self.index.add(entry.name, content_hash, size, root, dest, archived_at)
+                migrated += 1
+            except OSError as e:
+                logger.warning("Could not move %s into the archive shards: %s", entry.name, e)
+        return migrated
+    
+    def _delete_expired(self, cutoff):
+        deleted = 0
+        while not self._stop_event.is_set():
+            entries = self.index.plain_files(cutoff, limit=100)
+            deleted_before = deleted
+            for entry in entries:
+                if not self._throttle():
+                    return deleted, 0
+                try:
+                    os.remove(entry['path'])
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning("Could not delete expired archive copy %s: %s", entry['path'], e)
+                    continue
+                self.index.remove([entry['id']])
+                deleted += 1
+                self._remove_empty_dirs(entry['root'], os.path.dirname(entry['path']))
+            if deleted == deleted_before:
+                break  # Nothing left, or only files that cannot be deleted right now
+        
+        bundles_deleted = 0
+        for bundle_path in self.index.expired_bundles(cutoff):
+            if not self._throttle():
+                break
+            try:
+                os.remove(bundle_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not delete expired archive bundle %s: %s", bundle_path, e)
+                continue
+            self.index.remove_bundle(bundle_path)
+            bundles_deleted += 1
+        return deleted, bundles_deleted
+    
+    def _compact(self, cutoff):
+        """Bundle plain copies archived before the cutoff into one zip per month."""
+        bundled = 0
+        while not self._stop_event.is_set():
+            oldest = self.index.plain_files(cutoff, limit=1)
+            if not oldest:
+                break
+            # Everything from the oldest copy's month goes into its bundle at once
+            month = datetime.fromtimestamp(oldest[0]['archived_at'])
+            month_start = datetime(month.year, month.month, 1).timestamp()
+            month_end = datetime(month.year + month.month // 12, month.month % 12 + 1, 1).timestamp()
+            by_root = OrderedDict()
+            for entry in self.index.plain_files(min(cutoff, month_end), after=month_start, limit=None):
+                by_root.setdefault(entry['root'], []).append(entry)
+            for root, entries in by_root.items():
+                count = self._write_bundle(root, month.year, month.month, entries)
+                if count is None:
+                    return bundled
+                bundled += count
+        return bundled
+    
+    def _write_bundle(self, root, year, month, entries):
+        """Bundle the entries into a new zip for their month; returns the number bundled, None if stopped."""
+        month_dir = os.path.join(root, '%04d' % year, '%02d' % month)
+        bundle_path = os.path.join(root, '%04d' % year, '%04d-%02d.zip' % (year, month))
+        suffix = 2
+        while os.path.exists(bundle_path):
+            # Copies archived into an already bundled month get a bundle of their own
+            bundle_path = os.path.join(root, '%04d' % year, '%04d-%02d-%d.zip' % (year, month, suffix))
+            suffix += 1
+        temp_path = bundle_path + '.tmp'
+        
+        moves = {}
+        try:
+            with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+                for entry in entries:
+                    if not self._throttle():
+                        raise InterruptedError
+                    if not os.path.exists(entry['path']):
+                        moves[entry['id']] = None
+                        continue
+                    member = os.path.relpath(entry['path'], month_dir)
+                    if member.startswith(os.pardir):
+                        member = os.path.basename(entry['path'])
+                    member = member.replace(os.sep, '/')
+                    if member in bundle.NameToInfo:
+                        member = '%d-%s' % (entry['id'], member)
+                    bundle.write(entry['path'], member)
+                    moves[entry['id']] = member
+            os.replace(temp_path, bundle_path)
+        except (InterruptedError, OSError, zipfile.BadZipFile) as e:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            if not isinstance(e, InterruptedError):
+                logger.error("Could not bundle archive month %04d-%02d: %s", year, month, e)
+            return None
+        
+        missing = [entry_id for entry_id, member in moves.items() if member is None]
+        bundled_moves = {entry_id: member for entry_id, member in moves.items() if member is not None}
+        self.index.remove(missing)
+        self.index.move_to_bundle(bundled_moves, bundle_path)
+        for entry in entries:
+            if entry['id'] in bundled_moves:
+                with contextlib.suppress(OSError):
+                    os.remove(entry['path'])
+                self._remove_empty_dirs(root, os.path.dirname(entry['path']))
+        logger.info("Bundled %d archived files into %s", len(bundled_moves), bundle_path)
+        return len(bundled_moves)
+    
+    @staticmethod
+    def _remove_empty_dirs(root, folder):
+        """Remove folder and its empty parents up to (not including) the archive root."""
+        root = os.path.normpath(root)
+        folder = os.path.normpath(folder)
+        while folder != root and folder.startswith(root + os.sep):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                return
+            folder = os.path.dirname(folder)
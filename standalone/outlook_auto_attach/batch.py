@@ -0,0 +1,184 @@
+"""Batch mode: existing files through the same pipeline as downloads."""
+
+import os
+import time
+import sqlite3
+import queue
+import logging
+import glob
+import csv
+from collections import Counter, OrderedDict
+
+from .settings import JOURNAL_FILE
+from .logs import log_context, new_correlation_id
+from .rules import is_temporary_file
+from .archive import ArchiveIndex, archive_shard_folder, get_archive_folder
+from .large_attachments import create_large_attachment_stage
+from .prefill import create_draft_prefill
+from .scheduler import WorkScheduler
+from .journal import DedupJournal
+from .drafts import DraftOutbox
+from .metrics import Metrics
+from .handler import DownloadsHandler
+
+logger = logging.getLogger(__name__)
+
+
+def expand_batch_inputs(inputs, recursive=False):
+    """Files named on the command line (paths, globs or folders), in order and without duplicates."""
+    files = OrderedDict()
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                candidates = [os.path.join(folder, name)
+                              for folder, _, names in sorted(os.walk(item)) for name in sorted(names)]
+            else:
+                candidates = sorted(entry.path for entry in os.scandir(item) if entry.is_file())
+        elif any(char in item for char in '*?['):
+            candidates = sorted(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+            if not candidates:
+                logger.warning("No files match %s", item)
+        else:
+            candidates = [item]
+        for path in candidates:
+            if not is_temporary_file(os.path.basename(path)):
+                files.setdefault(os.path.abspath(path), None)
+    return list(files)
+
+
+def run_batch(inputs, config, jobs=4, dry_run=False, coalesce=True, recursive=False):
+    """Push existing files through the same pipeline as downloads; returns a JSON-serializable summary."""
+    files = expand_batch_inputs(inputs, recursive)
+    logger.info("Batch: %s file(s), %s parallel job(s)%s", len(files), jobs, " (dry run)" if dry_run else "")
+    batch_start = time.perf_counter()
+    scheduler = WorkScheduler(workers=jobs, max_pending=config['queue_size'], name="Batch").start()
+    metrics = Metrics()
+    journal = None
+    try:
+        journal = DedupJournal()
+    except sqlite3.Error as e:
+        logger.error("Could not open duplicate journal, continuing without it: %s", e)
+    
+    draft_results = {}  # archived path -> 'drafted' or 'draft_queued'
+    
+    def on_result(items, success, message):
+        for item in items:
+            # Parts of a split attachment report on the archived file they came from
+            key = item.get('archived_path', item['path'])
+            if draft_results.get(key) != 'draft_queued':
+                draft_results[key] = 'drafted' if success else 'draft_queued'
+    
+    archive_index = outbox = large_attachments = extractor = recipients = None
+    if not dry_run:
+        try:
+            archive_index = ArchiveIndex()
+        except sqlite3.Error as e:
+            logger.error("Could not open archive index, continuing without it: %s", e)
+        outbox_options = dict(journal=journal, metrics=metrics, on_result=on_result,
+                              retry_base_delay=config['mail_retry_base_delay'],
+                              retry_max_delay=config['mail_retry_max_delay'])
+        try:
+            # Drafts that fail are left in the retry queue for the running app
+            outbox = DraftOutbox(scheduler, db_path=JOURNAL_FILE, **outbox_options)
+        except sqlite3.Error as e:
+            logger.error("Could not open the draft retry queue, failed drafts are not retried: %s", e)
+            outbox = DraftOutbox(scheduler, **outbox_options)
+        large_attachments = create_large_attachment_stage(config, scheduler, metrics)
+        extractor, recipients = create_draft_prefill(config, scheduler, metrics)
+        if recipients is not None:
+            try:
+                recipients.refresh()
+            except (OSError, sqlite3.Error, csv.Error, UnicodeError) as e:
+                logger.error("Could not read the recipient list %s: %s", recipients.source, e)
+    # A dry run only uses the handler's checks, nothing is moved or drafted
+    handler = DownloadsHandler(
+        os.getcwd(),
+        scheduler=scheduler,
+        journal=journal,
+        duplicate_policy=config['duplicate_policy'],
+        duplicate_window_days=config['duplicate_window_days'],
+        archive_dir=config['archive_dir'],
+        coalesce_window=None if coalesce else 0.0,
+        coalesce_max_attachments=config['coalesce_max_attachments'],
+        coalesce_max_bytes=config['coalesce_max_bytes'],
+        metrics=metrics,
+        archive_index=archive_index,
+        archive_shard=config['archive_shard'],
+        outbox=outbox,
+        large_attachments=large_attachments,
+        extractor=extractor,
+        recipients=recipients,
+        subject_template=config['prefill_subject_template']
+    )
+    
+    def classify_only(file_path):
+        """Dry run of DownloadsHandler.process_file: the outcome and where the file would go."""
+        check = handler.check_file(file_path)
+        if check['outcome'] is not None:
+            return check['outcome'], None
+        archive_folder = archive_shard_folder(get_archive_folder(handler.archive_dir), handler.archive_shard)
+        return 'would_archive', os.path.join(archive_folder, check['rule'].format_name(os.path.basename(file_path)))
+    
+    results = queue.Queue()
+    
+    def process(file_path):
+        start = time.perf_counter()
+        entry = {'path': file_path, 'size': None}
+        with log_context(new_correlation_id()):
+            try:
+                entry['size'] = os.path.getsize(file_path) if os.path.exists(file_path) else None
+                if dry_run:
+                    entry['outcome'], entry['archived'] = classify_only(file_path)
+                else:
+                    entry['outcome'], entry['archived'] = handler.process_file(file_path)
+            except Exception as e:
+                entry['outcome'], entry['archived'], entry['error'] = 'error', None, str(e)
+        entry['seconds'] = round(time.perf_counter() - start, 4)
+        results.put(entry)
+    
+    for file_path in files:
+        if not scheduler.submit(process, file_path, timeout=None):
+            results.put({'path': file_path, 'size': None, 'outcome': 'error', 'archived': None,
+                         'error': "Could not queue file", 'seconds': 0.0})
+    entries = [results.get() for _ in files]
+    
+    # Send the groups still open at the end of the batch (after the PDFs were read and the large files prepared)
+    if extractor is not None:
+        extractor.close()
+    if large_attachments is not None:
+        large_attachments.close()
+    if handler is not None:
+        handler.coalescer.flush_all()
+    scheduler.shutdown(drain=True, timeout=config['drain_timeout'])
+    elapsed = time.perf_counter() - batch_start
+    for entry in entries:
+        entry['outcome'] = draft_results.get(entry['archived'], entry['outcome'])
+    order = {file_path: index for index, file_path in enumerate(files)}
+    entries.sort(key=lambda entry: order[entry['path']])
+    
+    if outbox is not None:
+        outbox.close()
+    if archive_index is not None:
+        archive_index.close()
+    if journal is not None:
+        journal.close()
+    
+    outcomes = Counter(entry['outcome'] for entry in entries)
+    total_bytes = sum(entry['size'] or 0 for entry in entries if entry['outcome'] not in ('missing', 'no_match'))
+    return {
+        'dry_run': dry_run,
+        'jobs': jobs,
+        'files': len(entries),
+        'seconds': round(elapsed, 3),
+        'files_per_second': round(len(entries) / elapsed, 1) if elapsed > 0 else None,
+        'megabytes_per_second': round(total_bytes / elapsed / 1e6, 2) if elapsed > 0 else None,
+        'outcomes': dict(outcomes),
+        'failed': sum(outcomes[outcome] for outcome in BATCH_FAILED_OUTCOMES),
+        'drafts': handler.coalescer.groups_sent if handler is not None else 0,
+        'stages': metrics.snapshot()['stages'],
+        'results': entries,
+    }
+
+
+# Batch outcomes that make the batch command exit with status 1
+BATCH_FAILED_OUTCOMES = ('missing', 'failed_archive', 'draft_queued', 'error')
@@ -0,0 +1,145 @@
+"""Catch-up scan for files that arrived while nothing was watching."""
+
+import os
+import time
+import json
+import logging
+import threading
+
+from .settings import WATERMARK_FILE
+from .rules import get_rule_engine, is_temporary_file
+
+logger = logging.getLogger(__name__)
+
+
+class CatchUpScanner:
+    """Finds matching files that arrived while nothing was watching, using a persisted high-water mark."""
+    
+    def __init__(self, state_path=WATERMARK_FILE):
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._marks = self._load()  # folder -> [arrival time in ns, [file ids at that time]], as saved
+        # folder -> newest handled arrival, like a mark; the saved mark is capped below the open files
+        self._handled = {folder: [mark[0], list(mark[1])] for folder, mark in self._marks.items()}
+        self._open = {}  # folder -> {path: arrival} of files in flight or not handled (failed)
+    
+    @staticmethod
+    def arrival_time(stat):
+        """When a file showed up in the folder: the later of its mtime and ctime."""
+        return max(stat.st_mtime_ns, stat.st_ctime_ns)
+    
+    def scan(self, folder, rules=None, max_depth=0):
+        """Paths of matching files that arrived after the watermark, oldest first (none on the first run)."""
+        folder = os.path.normpath(folder)
+        rules = rules if rules is not None else get_rule_engine()
+        with self._lock:
+            mark = self._marks.get(folder)
+        if mark is None:
+            with self._lock:
+                self._handled[folder] = [time.time_ns(), []]
+                self._update(folder)
+            logger.info("No catch-up watermark for %s yet, starting from now", folder)
+            return []
+        
+        watermark, seen_ids = mark[0], set(mark[1])
+        found = []
+        directories = [(folder, 0)]
+        while directories:
+            directory, depth = directories.pop()
+            descend = max_depth is None or depth < max_depth
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                if directory == folder:
+                    raise
+                continue  # Subfolder removed or not readable
+            with entries:
+                for entry in entries:
+                    name = entry.name
+                    if is_temporary_file(name):
+                        continue
+                    try:
+                        if descend and entry.is_dir(follow_symlinks=False):
+                            directories.append((entry.path, depth + 1))
+                            continue
+                        if rules.classify(name) is None or not entry.is_file():
+                            continue
+                        # Cached from the directory listing on Windows, one stat call elsewhere
+                        arrival = self.arrival_time(entry.stat())
+                        if arrival < watermark or (arrival == watermark and entry.inode() in seen_ids):
+                            continue
+                    except OSError:
+                        continue  # Removed while scanning
+                    found.append((arrival, entry.path))
+        found.sort()
+        return [path for _, path in found]
+    
+    def track(self, folder, path, stat):
+        """A file of folder was picked up: the watermark stays below it until it is handled or gone."""
+        folder = os.path.normpath(folder)
+        arrival = self.arrival_time(stat)
+        with self._lock:
+            mark = self._marks.get(folder)
+            if mark is not None and (arrival < mark[0] or (arrival == mark[0] and stat.st_ino in mark[1])):
+                return  # Older than the watermark - a catch-up scan would not find it anyway
+            self._open.setdefault(folder, {})[path] = arrival
+            self._update(folder)
+    
+    def handled(self, folder, path, stat):
+        """path was drafted or rejected for good: advance past it, up to the oldest file still open."""
+        folder = os.path.normpath(folder)
+        arrival = self.arrival_time(stat)
+        with self._lock:
+            self._open.get(folder, {}).pop(path, None)
+            high = self._handled.get(folder)
+            if high is None or arrival > high[0]:
+                self._handled[folder] = [arrival, [stat.st_ino]]
+            elif arrival == high[0] and stat.st_ino not in high[1]:
+                high[1].append(stat.st_ino)
+            self._update(folder)
+    
+    def release(self, folder, path):
+        """path is gone before it was handled - nothing left to catch up."""
+        folder = os.path.normpath(folder)
+        with self._lock:
+            if self._open.get(folder, {}).pop(path, None) is not None:
+                self._update(folder)
+    
+    def watermark(self, folder):
+        """Arrival time (ns) up to which files in folder have been handled, or None."""
+        with self._lock:
+            mark = self._marks.get(os.path.normpath(folder))
+            return mark[0] if mark is not None else None
+    
+    def _update(self, folder):
+        """Save the newest handled arrival, capped below the oldest open file (runs under _lock)."""
+        mark = self._handled.get(folder)
+        open_arrivals = self._open.get(folder)
+        if open_arrivals:
+            oldest = min(open_arrivals.values())
+            if mark is None or oldest <= mark[0]:
+                mark = [oldest, []]  # Files that arrived at `oldest` are found again
+        if mark is not None and mark != self._marks.get(folder):
+            self._marks[folder] = [mark[0], list(mark[1])]
+            self._save()
+    
+    def _load(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                marks = json.load(f)
+            return {folder: [int(mark[0]), [int(i) for i in mark[1]]] for folder, mark in marks.items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+            logger.warning("Could not read catch-up watermark %s, starting over: %s", self.state_path, e)
+            return {}
+    
+    def _save(self):
+        """Write the watermarks atomically (temp file + rename) so a crash never leaves a torn file."""
+        temp_path = self.state_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._marks, f)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            logger.warning("Could not save catch-up watermark: %s", e)
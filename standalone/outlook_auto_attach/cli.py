@@ -0,0 +1,398 @@
+"""Command line and application entry point."""
+
+import os
+import sys
+import time
+import json
+import sqlite3
+import logging
+import argparse
+import signal
+import threading
+from datetime import datetime
+
+from .settings import JOURNAL_FILE, LOG_DIR, load_config
+from .logs import setup_logging
+from .rules import get_rule_engine, load_rule_engine, set_rule_engine
+from .archive import ArchiveIndex, ArchiveMaintainer, get_archive_folder
+from .large_attachments import create_large_attachment_stage
+from .prefill import create_draft_prefill
+from .mail import create_mail_backend, get_mail_backend, set_mail_backend
+from .scheduler import WorkScheduler
+from .completion import DownloadCompletionDetector
+from .journal import DedupJournal, ProcessedFileIndex
+from .drafts import CircuitBreaker, DraftOutbox
+from .catchup import CatchUpScanner
+from .metrics import Metrics, StartupTimer
+from .diagnostics import Diagnostics
+from .handler import DownloadsHandler
+from .observer import ObserverSupervisor, create_observer
+from .tray import setup_tray_icon
+from .folders import load_watch_roots
+from .batch import expand_batch_inputs, run_batch
+from .instance import InstanceLock, InstanceServer, forward_to_instance
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv=None):
+    """Command line options (unknown ones are ignored, e.g. -psn_* added by older macOS launchers)."""
+    parser = argparse.ArgumentParser(description="Auto attach order documents from Downloads to Outlook drafts")
+    parser.add_argument('--headless', action='store_true',
+                        help="Run without the tray icon (no GUI libraries are loaded)")
+    subparsers = parser.add_subparsers(dest='command')
+    batch = subparsers.add_parser('batch', help="Process existing files and exit with a JSON summary")
+    batch.add_argument('inputs', nargs='+', help="Files, glob patterns (quoted) or folders")
+    batch.add_argument('--jobs', type=int, default=4, help="Files processed in parallel (default: 4)")
+    batch.add_argument('--dry-run', action='store_true', help="Only report what would be done")
+    batch.add_argument('--recursive', action='store_true', help="Include files in subfolders of given folders")
+    batch.add_argument('--no-coalesce', dest='coalesce', action='store_false', help="Open one draft per file")
+    batch.add_argument('--output', help="Write the summary to this file instead of stdout")
+    # Handed over to the running instance (process also starts one if none is running)
+    process = subparsers.add_parser('process', help="Have the running instance process these files")
+    process.add_argument('inputs', nargs='+', help="Files, glob patterns (quoted) or folders")
+    subparsers.add_parser('stats', help="Print the counters and latencies of the running instance")
+    subparsers.add_parser('quit', help="Stop the running instance")
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
+def batch_main(args, config):
+    """The batch subcommand: run the files through the pipeline and write the summary. Returns the exit status."""
+    set_rule_engine(load_rule_engine(config['rules']))
+    set_mail_backend(create_mail_backend(timeout=config['mail_timeout'],
+                                         mac_script_bridge=config['mac_script_bridge']))
+    try:
+        summary = run_batch(args.inputs, config, jobs=max(1, args.jobs), dry_run=args.dry_run,
+                            coalesce=args.coalesce, recursive=args.recursive)
+    finally:
+        get_mail_backend().close()
+    
+    output = args.output
+    if output is None and sys.stdout is None:
+        # Windowed build without a console
+        output = os.path.join(LOG_DIR, datetime.now().strftime("batch-%Y%m%d-%H%M%S.json"))
+    if output is None:
+        json.dump(summary, sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write("\n")
+    else:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        logger.info("Batch summary written to %s", output)
+    logger.info("Batch done: %s file(s) in %.1f s, %s", summary['files'], summary['seconds'], summary['outcomes'])
+    return 1 if summary['failed'] else 0
+
+
+def main(argv=None):
+    """Main application entry point."""
+    startup = StartupTimer()
+    args = parse_args(argv)
+    config = load_config()
+    log_listener = setup_logging(
+        level=config['log_level'],
+        log_format=config['log_format'],
+        max_bytes=config['log_max_bytes'],
+        backup_count=config['log_backup_count'],
+        rotate_when=config['log_rotate_when']
+    )
+    if args.command == 'batch':
+        # A batch moves and drafts files like the watcher: next to a running one, hand the files to it
+        instance_lock = InstanceLock() if config['single_instance'] and not args.dry_run else None
+        try:
+            if instance_lock is not None and not instance_lock.acquire():
+                return forward_to_instance(args, config)
+            return batch_main(args, config)
+        finally:
+            if instance_lock is not None:
+                instance_lock.release()
+            log_listener.stop()
+    
+    # One watcher per user - a second launch hands its command to the running instance instead
+    # of starting another observer on the same folders (duplicate drafts and archive copies)
+    instance_lock = None
+    if config['single_instance']:
+        instance_lock = InstanceLock()
+        if not instance_lock.acquire():
+            try:
+                return forward_to_instance(args, config)
+            finally:
+                log_listener.stop()
+    if args.command in ('stats', 'quit'):
+        logger.error("No running instance to send %r to", args.command)
+        if instance_lock is not None:
+            instance_lock.release()
+        log_listener.stop()
+        return 1
+    logger.info("Starting CT Food Outlook Application%s", " (headless)" if args.headless else "")
+    startup.mark('imported')
+    
+    # Downloads folder(s) and any extra folders from the config
+    watch_roots = load_watch_roots(config)
+    for root in watch_roots:
+        logger.info("Monitoring folder: %r", root)
+    
+    # Shared worker pool for processing files
+    scheduler = WorkScheduler(workers=config['workers'], max_pending=config['queue_size']).start()
+    logger.info("Worker pool started (%s workers, queue size %s)", scheduler.workers, scheduler.max_pending)
+    
+    # Detects when a browser has finished writing a download
+    detector = DownloadCompletionDetector(
+        first_delay=config['completion_first_delay'],
+        max_delay=config['completion_max_delay'],
+        deadline=config['completion_deadline']
+    )
+    
+    # Persistent duplicate journal - the app still works without it
+    journal = None
+    try:
+        journal = DedupJournal()
+        removed = journal.prune(config['journal_retention_days'])
+        logger.info("Duplicate journal: %s (%s old entries pruned)", journal.db_path, removed)
+    except sqlite3.Error as e:
+        logger.error("Could not open duplicate journal, continuing without it: %s", e)
+    
+    # Index of archived copies and background archive cleanup (retention, monthly zip bundles)
+    archive_index = None
+    try:
+        archive_index = ArchiveIndex()
+    except sqlite3.Error as e:
+        logger.error("Could not open archive index, continuing without it: %s", e)
+    
+    # Filename rules from the config file
+    set_rule_engine(load_rule_engine(config['rules']))
+    logger.info("Filename rules: %s", ', '.join(rule.name for rule in get_rule_engine().rules))
+    
+    # Mail client automation (long-lived Outlook session on Windows)
+    set_mail_backend(create_mail_backend(timeout=config['mail_timeout'],
+                                         mac_script_bridge=config['mac_script_bridge']))
+    
+    # Per-stage counters and latencies, written to the log folder
+    metrics = Metrics()
+    metrics.register_gauges('scheduler', scheduler.stats)
+    metrics.register_gauges('startup_ms', startup.as_dict)
+    
+    # Opens drafts; failed ones are kept in the journal database and retried
+    breaker = CircuitBreaker("Outlook", failure_threshold=config['mail_breaker_threshold'],
+                             reset_timeout=config['mail_breaker_reset'],
+                             max_reset_timeout=config['mail_retry_max_delay'])
+    outbox_options = dict(journal=journal, metrics=metrics, breaker=breaker,
+                          retry_base_delay=config['mail_retry_base_delay'],
+                          retry_max_delay=config['mail_retry_max_delay'])
+    try:
+        outbox = DraftOutbox(scheduler, db_path=JOURNAL_FILE, **outbox_options)
+    except sqlite3.Error as e:
+        logger.error("Could not open the draft retry queue, failed drafts are kept in memory only: %s", e)
+        outbox = DraftOutbox(scheduler, **outbox_options)
+    metrics.register_gauges('mail', outbox.stats)
+    
+    # Zips/splits attachments over the size limit in worker processes (started on first use)
+    large_attachments = create_large_attachment_stage(config, scheduler, metrics)
+    if large_attachments is not None:
+        metrics.register_gauges('large_attachments', large_attachments.stats)
+        large_attachments.prune(config['large_attachment_retention_days'])
+    
+    # Order/customer number -> recipient and subject of the draft (recipient list re-read when it changes)
+    extractor, recipients = create_draft_prefill(config, scheduler, metrics)
+    if recipients is not None:
+        recipients.watch(scheduler, config['recipients_refresh_interval'])
+        metrics.register_gauges('recipients', recipients.stats)
+    
+    # Setup file system watcher - one observer and one handler per folder, all sharing the
+    # worker pool, completion detector, dedup index and journal
+    processed_files = ProcessedFileIndex(
+        max_entries=config['processed_index_size'],
+        ttl=config['processed_index_ttl']
+    )
+    metrics.register_gauges('processed_index', lambda: {'entries': len(processed_files)})
+    catch_up_scanner = CatchUpScanner() if config['catch_up'] else None
+    watches = []
+    event_handlers = []
+    for root in watch_roots:
+        event_handler = DownloadsHandler(
+            root.path,
+            scheduler=scheduler,
+            detector=detector,
+            queue_block_timeout=config['queue_block_timeout'],
+            processed_files=processed_files,
+            journal=journal,
+            duplicate_policy=config['duplicate_policy'],
+            duplicate_window_days=config['duplicate_window_days'],
+            archive_dir=root.archive_dir,
+            coalesce_window=config['coalesce_window'],
+            coalesce_max_attachments=config['coalesce_max_attachments'],
+            coalesce_max_bytes=config['coalesce_max_bytes'],
+            rules=root.rules,
+            catch_up_scanner=catch_up_scanner,
+            metrics=metrics,
+            max_depth=root.max_depth,
+            archive_index=archive_index,
+            archive_shard=config['archive_shard'],
+            outbox=outbox,
+            large_attachments=large_attachments,
+            extractor=extractor,
+            recipients=recipients,
+            subject_template=config['prefill_subject_template']
+        )
+        watches.append((event_handler, root.path, root.recursive))
+        event_handlers.append(event_handler)
+    
+    def catch_up_all():
+        if catch_up_scanner is not None:
+            for event_handler in event_handlers:
+                scheduler.submit(event_handler.catch_up, block=False)
+    
+    # Restarts the observer if it dies (catching up on what it missed), polling as a fallback
+    supervisor = ObserverSupervisor(
+        watches,
+        observer_factory=lambda polling: create_observer(polling, fast_interval=config['polling_fast_interval'],
+                                                         slow_interval=config['polling_slow_interval']),
+        on_restart=catch_up_all,
+        mode=config['watch_mode'],
+        backoff_max=config['observer_restart_max_delay']
+    ).start()
+    metrics.register_gauges('observer', supervisor.stats)
+    
+    logger.info("File system watcher started")
+    startup.mark('watcher_ready')
+    
+    # Commands handed over by later launches (process/stats/quit)
+    def process_command(paths=()):
+        files = {}
+        for path in paths:
+            # The handler of the folder the file is in, else the first one (its archive is used)
+            event_handler = event_handlers[0]
+            for candidate in event_handlers:
+                try:
+                    if os.path.commonpath([candidate.downloads_folder, path]) == candidate.downloads_folder:
+                        event_handler = candidate
+                        break
+                except ValueError:
+                    continue  # Another drive on Windows
+            files[path] = event_handler.submit_path(path)
+        return {'ok': True, 'files': files}
+    
+    def quit_command():
+        supervisor.request_stop()
+        return {'ok': True}
+    
+    instance_server = None
+    if instance_lock is not None:
+        try:
+            instance_server = InstanceServer({
+                'ping': lambda: {'ok': True, 'pid': os.getpid()},
+                'process': process_command,
+                'stats': lambda: {'ok': True, 'stats': metrics.snapshot()},
+                'quit': quit_command,
+            }).start()
+        except OSError as e:
+            logger.error("Could not open the IPC channel, other launches cannot reach this one: %s", e)
+    if args.command == 'process':
+        logger.info("Processing %s", process_command(expand_batch_inputs(args.inputs))['files'])
+    
+    # Pick up downloads that arrived while the app was not running (after the observer
+    # is started, so nothing falls in between)
+    catch_up_all()
+    outbox.resume()
+    if config['mail_warm_up']:
+        outbox.warm_up(probe_interval=config['mail_probe_interval'])
+    
+    archive_maintainer = None
+    if archive_index is not None:
+        archive_maintainer = ArchiveMaintainer(
+            archive_index,
+            [get_archive_folder(root.archive_dir) for root in watch_roots],
+            shard=config['archive_shard'],
+            retention_days=config['archive_retention_days'],
+            compact_after_months=config['archive_compact_after_months'],
+            interval=config['archive_cleanup_interval'],
+            files_per_second=config['archive_cleanup_rate'],
+            busy=scheduler.busy
+        ).start()
+        metrics.register_gauges('archive', lambda: archive_maintainer.totals)
+    
+    # Stop cleanly on SIGTERM too (e.g. a service manager in headless mode)
+    signal.signal(signal.SIGTERM, lambda signum, frame: supervisor.request_stop())
+    
+    # Opt-in profiling hooks - nothing is set up unless enabled
+    diagnostics = None
+    if Diagnostics.enabled(config):
+        diagnostics = Diagnostics(metrics=metrics)
+        logger.info("Diagnostics enabled, reports go to %s", diagnostics.output_dir)
+        if hasattr(signal, 'SIGUSR1'):
+            # Headless: SIGUSR1 writes a thread dump and memory snapshot, SIGUSR2 a CPU profile
+            def on_dump_signal(signum, frame):
+                threading.Thread(target=lambda: (diagnostics.thread_dump(), diagnostics.memory_snapshot()),
+                                 name="diagnostics", daemon=True).start()
+            signal.signal(signal.SIGUSR1, on_dump_signal)
+            signal.signal(signal.SIGUSR2, lambda signum, frame: diagnostics.cpu_profile(
+                config['diagnostics_profile_seconds']))
+    
+    # Setup system tray icon - after the watcher, so GUI imports and icon rendering don't delay it
+    icon = None
+    if not args.headless:
+        try:
+            icon = setup_tray_icon(supervisor, metrics=metrics, diagnostics=diagnostics,
+                                   profile_seconds=config['diagnostics_profile_seconds'])
+        except Exception as e:
+            logger.error("Could not create tray icon, continuing without it: %s", e, exc_info=True)
+    
+    if icon is not None:
+        def on_tray_ready(icon):
+            icon.visible = True
+            startup.mark('tray_ready')
+        
+        # Run icon in a separate thread
+        icon_thread = threading.Thread(target=icon.run, kwargs={'setup': on_tray_ready}, daemon=True)
+        icon_thread.start()
+    
+    try:
+        # Keep the main thread alive and the observer healthy
+        last_observer_check = time.time()
+        last_stats_write = time.time()
+        while not supervisor.stopped():
+            time.sleep(1)
+            healthy = supervisor.check()
+            
+            # Log observer status periodically (for debugging)
+            current_time = time.time()
+            if current_time - last_observer_check > 30.0:
+                if healthy:
+                    # Processed file entries are cleaned up by delete/move events and TTL eviction
+                    logger.debug("Observer is running. Processed files count: %s, queue: %s, events: %s",
+                                 len(processed_files), scheduler.stats(), metrics.counts())
+                last_observer_check = current_time
+            
+            if config['stats_interval'] and current_time - last_stats_write > config['stats_interval']:
+                metrics.write()
+                last_stats_write = current_time
+    except KeyboardInterrupt:
+        logger.info("Interrupted by user")
+    finally:
+        if instance_server is not None:
+            instance_server.stop()
+        supervisor.stop()
+        # Both hand their results to the scheduler, so they finish before it stops
+        if extractor is not None:
+            extractor.close()
+        if large_attachments is not None:
+            large_attachments.close(timeout=config['drain_timeout'])
+        scheduler.shutdown(drain=True, timeout=config['drain_timeout'])
+        # Files still waiting for their coalescing window get their draft now
+        for event_handler in event_handlers:
+            event_handler.coalescer.flush_all()
+        if archive_maintainer is not None:
+            archive_maintainer.stop()
+        if archive_index is not None:
+            archive_index.close()
+        if journal is not None:
+            journal.close()
+        get_mail_backend().close()
+        metrics.write()
+        outbox.close()
+        if icon is not None:
+            icon.stop()
+        logger.info("Application stopped")
+        if instance_lock is not None:
+            instance_lock.release()
+        # Flush what is still queued for the log file
+        log_listener.stop()
@@ -0,0 +1,112 @@
+"""Detecting when a download has finished being written."""
+
+import os
+import time
+import threading
+
+
+class DownloadCompletionDetector:
+    """Decides when a download has finished being written (stable size/mtime, with backoff and a deadline)."""
+    
+    READY = 'ready'
+    PENDING = 'pending'
+    GONE = 'gone'
+    TIMED_OUT = 'timed_out'
+    
+    def __init__(self, first_delay=0.05, max_delay=2.0, deadline=1800.0, backoff=2.0):
+        self.first_delay = first_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.backoff = backoff
+        self._closed = {}  # file_path -> mtime_ns when a close-after-write event was seen
+        self._tracked = set()
+        self._lock = threading.Lock()
+    
+    def start(self, file_path):
+        """Begin tracking a file; returns the state object to pass to check()."""
+        with self._lock:
+            self._tracked.add(file_path)
+            self._closed.pop(file_path, None)
+        return {
+            'path': file_path,
+            'started': time.monotonic(),
+            'signature': None,
+            'delay': self.first_delay,
+            'checks': 0,
+        }
+    
+    def finish(self, state):
+        """Stop tracking a file (called once check() returned a final status)."""
+        with self._lock:
+            self._tracked.discard(state['path'])
+            self._closed.pop(state['path'], None)
+    
+    def mark_closed(self, file_path):
+        """Record that a writer closed the file. Ignored for files that are not being tracked."""
+        with self._lock:
+            if file_path not in self._tracked:
+                return
+        try:
+            mtime_ns = os.stat(file_path).st_mtime_ns
+        except OSError:
+            return
+        with self._lock:
+            if file_path in self._tracked:
+                self._closed[file_path] = mtime_ns
+    
+    def check(self, state):
+        """Check a tracked file once; returns (status, delay before the next check)."""
+        file_path = state['path']
+        state['checks'] += 1
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return self.GONE, None
+        except OSError:
+            stat = None
+        
+        if stat is not None:
+            signature = (stat.st_size, stat.st_mtime_ns)
+            with self._lock:
+                closed_mtime = self._closed.get(file_path)
+            # Closed by its writer and not modified since - no need to wait for a second check
+            closed = closed_mtime is not None and closed_mtime == stat.st_mtime_ns
+            stable = signature == state['signature']
+            state['signature'] = signature
+            
+            # Empty files are usually placeholders the browser is about to fill
+            if stat.st_size > 0 and (closed or stable) and self._can_open(file_path):
+                return self.READY, None
+        
+        if time.monotonic() - state['started'] > self.deadline:
+            return self.TIMED_OUT, None
+        
+        delay = state['delay']
+        state['delay'] = min(delay * self.backoff, self.max_delay)
+        return self.PENDING, delay
+    
+    def wait(self, file_path, timeout=None):
+        """Block until the file is complete, gone or past its deadline. Returns the final status."""
+        state = self.start(file_path)
+        give_up = None if timeout is None else time.monotonic() + timeout
+        try:
+            delay = self.first_delay
+            while True:
+                time.sleep(delay)
+                status, delay = self.check(state)
+                if status != self.PENDING:
+                    return status
+                if give_up is not None and time.monotonic() >= give_up:
+                    return self.TIMED_OUT
+        finally:
+            self.finish(state)
+    
+    @staticmethod
+    def _can_open(file_path):
+        """The browser may still hold the file locked (Windows) even though its size is stable."""
+        try:
+            with open(file_path, 'rb'):
+                pass
+            return True
+        except OSError:
+            return False
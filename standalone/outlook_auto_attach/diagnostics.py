@@ -0,0 +1,159 @@
+"""Opt-in profiling and thread dumps of a running install."""
+
+import os
+import sys
+import time
+import json
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+from .settings import LOG_DIR
+
+logger = logging.getLogger(__name__)
+
+
+DIAGNOSTICS_DIR = os.path.join(LOG_DIR, "diagnostics")
+DIAGNOSTICS_ENV = 'OUTLOOK_AUTO_ATTACH_DIAGNOSTICS'
+
+
+class Diagnostics:
+    """Opt-in sampling profiles, tracemalloc snapshots and thread dumps, written to DIAGNOSTICS_DIR."""
+    
+    # Leaf frames in these modules mean the thread is waiting, not running
+    IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py', 'connection.py', 'subprocess.py')
+    
+    def __init__(self, output_dir=DIAGNOSTICS_DIR, metrics=None, sample_interval=0.01, traceback_frames=10):
+        self.output_dir = output_dir
+        self.metrics = metrics
+        self.sample_interval = sample_interval
+        self.traceback_frames = traceback_frames
+        self._profile_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._last_snapshot = None
+    
+    @staticmethod
+    def enabled(config):
+        return bool(config.get('diagnostics')) or os.environ.get(DIAGNOSTICS_ENV, '') not in ('', '0')
+    
+    def _write(self, kind, text, extension='txt', stamp=None):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = stamp or datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.output_dir, f"{kind}-{stamp}.{extension}")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        logger.info("Diagnostics: %s written to %s", kind, path)
+        return path
+    
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    
+    def thread_dump(self):
+        """Write the stack of every live thread (plus the current statistics). Returns the report path."""
+        import traceback
+        frames = sys._current_frames()
+        threads = sorted(threading.enumerate(), key=lambda thread: thread.name)
+        lines = [f"Thread dump {datetime.now().isoformat(timespec='seconds')}, pid {os.getpid()}, "
+                 f"{len(threads)} threads", ""]
+        for thread in threads:
+            lines.append(f"--- {thread.name} (ident {thread.ident}, daemon={thread.daemon})")
+            frame = frames.get(thread.ident)
+            lines.append("".join(traceback.format_stack(frame)).rstrip() if frame is not None else "  (no frame)")
+            lines.append("")
+        if self.metrics is not None:
+            lines.append("--- Statistics")
+            lines.append(json.dumps(self.metrics.snapshot(), indent=2, ensure_ascii=False))
+        return self._write("threads", "\n".join(lines) + "\n")
+    
+    def memory_snapshot(self, limit=30):
+        """Write the top allocations and the growth since the previous snapshot; returns the report path."""
+        import gc
+        import tracemalloc
+        with self._snapshot_lock:
+            lines = [f"Memory snapshot {datetime.now().isoformat(timespec='seconds')}, pid {os.getpid()}"]
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.traceback_frames)
+                lines.append("tracemalloc was not running and has been started: this snapshot is the baseline, "
+                             "take another one later to see what grew.")
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            traced, peak = tracemalloc.get_traced_memory()
+            lines.append(f"Traced: {traced / 1e6:.2f} MB (peak {peak / 1e6:.2f} MB), "
+                         f"gc objects: {len(gc.get_objects())}, gc counts: {gc.get_count()}")
+            if self._last_snapshot is not None:
+                lines += ["", f"Top {limit} growth since the previous snapshot:"]
+                lines += [f"  {stat}" for stat in snapshot.compare_to(self._last_snapshot, 'lineno')[:limit]]
+            lines += ["", f"Top {limit} allocations:"]
+            lines += [f"  {stat}" for stat in snapshot.statistics('lineno')[:limit]]
+            largest = snapshot.statistics('traceback')[:3]
+            for stat in largest:
+                lines += ["", f"Traceback of {stat.size / 1024:.1f} KiB in {stat.count} blocks:"]
+                lines += [f"  {line}" for line in stat.traceback.format()]
+            self._last_snapshot = snapshot
+        return self._write("memory", "\n".join(lines) + "\n")
+    
+    def cpu_profile(self, seconds=30.0, wait=False):
+        """Sample all threads for `seconds` and write a summary plus collapsed stacks."""
+        if not self._profile_lock.acquire(blocking=False):
+            logger.warning("Diagnostics: a CPU profile is already running")
+            return None
+        if not wait:
+            threading.Thread(target=self._profile, args=(seconds,), name="diagnostics-profiler",
+                             daemon=True).start()
+            return None
+        return self._profile(seconds)
+    
+    def _profile(self, seconds):
+        try:
+            logger.info("Diagnostics: sampling all threads for %.0f s", seconds)
+            own = threading.get_ident()
+            stacks = Counter()
+            busy_self = Counter()
+            busy_inclusive = Counter()
+            samples = busy_samples = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    idle = os.path.basename(frame.f_code.co_filename) in self.IDLE_MODULES
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._frame_label(frame))
+                        frame = frame.f_back
+                    stack.reverse()
+                    stacks[';'.join([names.get(ident, str(ident))] + stack)] += 1
+                    samples += 1
+                    if not idle:
+                        busy_samples += 1
+                        busy_self[stack[-1]] += 1
+                        for label in set(stack):
+                            busy_inclusive[label] += 1
+                time.sleep(self.sample_interval)
+            elapsed = time.perf_counter() - start
+            
+            lines = [f"Sampling profile {datetime.now().isoformat(timespec='seconds')}, pid {os.getpid()}: "
+                     f"{elapsed:.1f} s, {samples} thread samples, {busy_samples} busy "
+                     f"(threads waiting in {', '.join(self.IDLE_MODULES)} count as idle)", ""]
+            for title, counts in (("Top functions (self, busy samples)", busy_self),
+                                  ("Top functions (inclusive, busy samples)", busy_inclusive)):
+                lines.append(f"{title}:")
+                for label, count in counts.most_common(30):
+                    lines.append(f"  {count:7d} {100.0 * count / max(1, busy_samples):5.1f}%  {label}")
+                lines.append("")
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            path = self._write("profile", "\n".join(lines), stamp=stamp)
+            self._write("profile", "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+                        extension="collapsed", stamp=stamp)
+            return path
+        except Exception as e:
+            logger.error("Diagnostics: CPU profile failed: %s", e, exc_info=True)
+            return None
+        finally:
+            self._profile_lock.release()
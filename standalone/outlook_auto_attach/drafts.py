@@ -0,0 +1,455 @@
+"""Opening drafts: coalescing related files, retrying failed drafts and the circuit breaker."""
+
+import os
+import time
+import json
+import random
+import sqlite3
+import logging
+import itertools
+import threading
+from functools import partial
+from collections import OrderedDict
+
+from .logs import log_context
+from .mail import PENDING, get_mail_backend
+from .journal import DedupJournal
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Refuses calls to a dependency after repeated failures, letting one trial call through after a timeout."""
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0, max_reset_timeout=600.0):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max(reset_timeout, max_reset_timeout)
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._timeout = reset_timeout
+        self._open_until = 0.0
+        self.opened = 0
+        self.refused = 0
+    
+    def allow(self):
+        """True if a call may be made now (the half-open trial call included)."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() >= self._open_until:
+                self.state = self.HALF_OPEN
+                return True
+            self.refused += 1
+            return False
+    
+    def record_success(self):
+        """Close the circuit. Returns True if it was open before (the dependency recovered)."""
+        with self._lock:
+            recovered = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self._failures = 0
+            self._timeout = self.reset_timeout
+        if recovered:
+            logger.info("%s is reachable again", self.name)
+        return recovered
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN:
+                self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+            elif self.state == self.OPEN or self._failures < self.failure_threshold:
+                return
+            self.state = self.OPEN
+            self._open_until = time.monotonic() + self._timeout
+            self.opened += 1
+            timeout = self._timeout
+        logger.warning("%s keeps failing, pausing calls for %.0f s", self.name, timeout)
+    
+    def retry_in(self):
+        """Seconds until a call will be allowed again (0 unless open)."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self._open_until - time.monotonic())
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'open': int(self.state != self.CLOSED),
+                'consecutive_failures': self._failures,
+                'opened': self.opened,
+                'refused': self.refused,
+            }
+
+
+class DraftOutbox:
+    """Opens drafts through the mail backend, persisting failed ones and retrying them with backoff."""
+    
+    def __init__(self, scheduler, journal=None, metrics=None, mail_backend=None, db_path=':memory:',
+                 breaker=None, retry_base_delay=5.0, retry_max_delay=600.0, batch_size=10, on_result=None):
+        self.scheduler = scheduler
+        self.journal = journal
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._mail_backend = mail_backend
+        self.breaker = breaker if breaker is not None else CircuitBreaker("Mail backend")
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = max(retry_base_delay, retry_max_delay)
+        self.batch_size = batch_size
+        # Called as on_result(items, success, message) once the result of each send() is known
+        self.on_result = on_result
+        self.probe_interval = 0.0
+        # Cold vs. warm start: latency of the first draft, and whether warm_up() had finished by then
+        self.warm_up_ms = None
+        self.first_draft_ms = None
+        self.first_draft_warm = None
+        self._scheduled_at = None  # Wall-clock time of the earliest scheduled retry run
+        self._run_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS mail_retry (
+                id INTEGER PRIMARY KEY,
+                document_type TEXT NOT NULL,
+                items TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                created REAL NOT NULL,
+                next_attempt REAL NOT NULL,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mail_retry_next ON mail_retry (next_attempt)")
+    
+    @property
+    def mail_backend(self):
+        """Backend used to open drafts (the shared platform backend unless one was passed in)."""
+        return self._mail_backend if self._mail_backend is not None else get_mail_backend()
+    
+    def send(self, document_type, items):
+        """Open one draft with all items attached; queue it for retry if that fails. Returns success or PENDING."""
+        success, message = self._attempt(document_type, items, partial(self._sent, document_type, items))
+        if success is not PENDING:
+            self._sent(document_type, items, success, message)
+        return success
+    
+    def _sent(self, document_type, items, success, message):
+        if not success:
+            self._enqueue(document_type, items, message)
+        if self.on_result is not None:
+            self.on_result(items, success, message)
+    
+    def warm_up(self, probe_interval=300.0):
+        """Connect to the mail client in the background now, then probe it every probe_interval seconds."""
+        self.probe_interval = probe_interval
+        self.scheduler.submit(self._warm_up, block=False, background=True)
+    
+    def resume(self):
+        """Retry the drafts left queued by a previous run straight away. Returns how many there are."""
+        return self._retry_all_now()
+    
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM mail_retry").fetchone()[0]
+    
+    def stats(self):
+        return dict(self.breaker.stats(), queued=self.pending(), warm_up_ms=self.warm_up_ms,
+                    first_draft_ms=self.first_draft_ms, first_draft_warm=self.first_draft_warm)
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+    
+    def _attempt(self, document_type, items, on_done):
+        """One draft attempt through the circuit breaker; a PENDING draft calls on_done(success, message) later."""
+        if not self.breaker.allow():
+            self.metrics.increment('draft_refused', len(items))
+            return False, "Mail backend unavailable, retry later"
+        
+        paths = [item['path'] for item in items]
+        if len(items) > 1:
+            logger.info("Opening one draft for %s %s files", len(items), document_type)
+        # Prefilled by the handler (draft_prefill); files of one draft share the recipient
+        to = next((item['to'] for item in items if item.get('to')), None)
+        subjects = list(OrderedDict.fromkeys(item['subject'] for item in items if item.get('subject')))
+        draft_start = time.perf_counter()
+        late = partial(self._late_result, items, draft_start, on_done)
+        try:
+            success, message = self.mail_backend.open_draft(paths, to=to, subject=', '.join(subjects) or None,
+                                                            on_done=late)
+        except Exception as e:
+            success, message = False, f"Error: {e}"
+        if success is PENDING:
+            # Neither drafted nor failed yet - the journal, breaker and retry queue wait for the result
+            logger.warning("Draft not open yet, waiting for the mail client: %s", message)
+            self.metrics.increment('draft_pending', len(items))
+        else:
+            self._record(items, draft_start, success, message)
+        return success, message
+    
+    def _late_result(self, items, draft_start, on_done, success, message):
+        """Mail client thread: the final result of a draft that was PENDING."""
+        with log_context('+'.join(item.get('correlation_id', '-') for item in items)):
+            self._record(items, draft_start, success, message)
+            on_done(success, message)
+    
+    def _record(self, items, draft_start, success, message):
+        """Journal, metrics and circuit breaker bookkeeping for the result of one draft."""
+        elapsed = time.perf_counter() - draft_start
+        self.metrics.observe('draft', elapsed)
+        recovered = self.breaker.record_success() if success else self.breaker.record_failure()
+        if success and self.first_draft_ms is None:
+            self.first_draft_ms = round(elapsed * 1000, 1)
+            self.first_draft_warm = int(self.warm_up_ms is not None)
+            logger.info("First draft took %.0f ms (%s start)", self.first_draft_ms,
+                        'warm' if self.first_draft_warm else 'cold')
+        
+        now = time.monotonic()
+        for item in items:
+            if success and item.get('received') is not None:
+                self.metrics.observe('end_to_end', now - item['received'])
+            if item.get('content_hash') is not None and self.journal is not None:
+                self.journal.set_outcome(item['content_hash'],
+                                         DedupJournal.DRAFTED if success else DedupJournal.DRAFT_FAILED)
+            if success:
+                logger.info("Successfully processed: %s", item['filename'])
+        if success:
+            self.metrics.increment('drafted', len(items))
+            if recovered:
+                self._retry_all_now()
+        else:
+            logger.error("Failed to open Outlook: %s", message)
+            self.metrics.increment('failed_draft', len(items))
+    
+    def _warm_up(self):
+        start = time.perf_counter()
+        try:
+            success, message = self.mail_backend.warm_up()
+        except Exception as e:
+            success, message = False, f"Error: {str(e)}"
+        elapsed = time.perf_counter() - start
+        self.metrics.observe('warm_up', elapsed)
+        if success:
+            self.warm_up_ms = round(elapsed * 1000, 1)
+            logger.info("Mail client ready after %.0f ms: %s", self.warm_up_ms, message)
+            self._reachable()
+        else:
+            logger.warning("Could not warm up the mail client: %s", message)
+            self.metrics.increment('warm_up_failed')
+        self._schedule_probe()
+    
+    def _probe(self):
+        start = time.perf_counter()
+        try:
+            success, message = self.mail_backend.probe()
+        except Exception as e:
+            success, message = False, f"Error: {str(e)}"
+        self.metrics.observe('probe', time.perf_counter() - start)
+        if success:
+            self._reachable()
+        else:
+            logger.debug("Mail client probe failed: %s", message)
+            self.metrics.increment('probe_failed')
+        self._schedule_probe()
+    
+    def _schedule_probe(self):
+        if self.probe_interval > 0:
+            self.scheduler.submit(self._probe, delay=self.probe_interval, block=False, background=True,
+                                  reschedule=True)
+    
+    def _reachable(self):
+        """A warm-up or probe succeeded: if drafts were paused, close the circuit and retry them."""
+        if self.breaker.state != CircuitBreaker.CLOSED and self.breaker.record_success():
+            self._retry_all_now()
+    
+    def _backoff(self, attempts):
+        """Exponential backoff with jitter (a random delay in the upper half of the current step)."""
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempts - 1))
+        return random.uniform(delay / 2, delay)
+    
+    def _enqueue(self, document_type, items, error):
+        # Arrival times are monotonic clock values, meaningless after a restart
+        stored = [{key: value for key, value in item.items() if key != 'received'} for item in items]
+        now = time.time()
+        next_attempt = now + max(self._backoff(1), self.breaker.retry_in())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO mail_retry (document_type, items, attempts, created, next_attempt, last_error) "
+                "VALUES (?, ?, 1, ?, ?, ?)",
+                (document_type, json.dumps(stored), now, next_attempt, error)
+            )
+        self.metrics.increment('draft_queued', len(items))
+        logger.warning("Draft queued for retry in %.0f s: %s",
+                       next_attempt - now, ', '.join(item['filename'] for item in items))
+        self._schedule(next_attempt)
+    
+    def _schedule(self, at):
+        """Make sure a retry run happens at wall-clock time `at` (or earlier)."""
+        if at is None:
+            return
+        with self._lock:
+            if self._scheduled_at is not None and self._scheduled_at <= at:
+                return
+            self._scheduled_at = at
+        if not self.scheduler.submit(self._run_due, delay=at - time.time(), block=False, background=True):
+            # Queue full or shutting down - the next failure or resume() schedules it again
+            with self._lock:
+                self._scheduled_at = None
+    
+    def _next_due(self):
+        with self._lock:
+            return self._conn.execute("SELECT MIN(next_attempt) FROM mail_retry").fetchone()[0]
+    
+    def _retry_all_now(self):
+        with self._lock:
+            queued = self._conn.execute("UPDATE mail_retry SET next_attempt = ?", (time.time(),)).rowcount
+        if queued:
+            logger.info("Retrying %s queued draft(s) now", queued)
+            self._schedule(time.time())
+        return queued
+    
+    def _run_due(self):
+        """Retry the drafts that are due, then schedule the next run."""
+        with self._lock:
+            self._scheduled_at = None
+        if not self._run_lock.acquire(blocking=False):
+            return  # Another run is in progress and keeps going until nothing is due
+        try:
+            while self.breaker.retry_in() == 0:
+                with self._lock:
+                    rows = self._conn.execute(
+                        "SELECT id, document_type, items, attempts FROM mail_retry WHERE next_attempt <= ? "
+                        "ORDER BY next_attempt LIMIT ?", (time.time(), self.batch_size)
+                    ).fetchall()
+                if not rows:
+                    break
+                for entry_id, document_type, items_json, attempts in rows:
+                    if self.breaker.retry_in() > 0:
+                        break
+                    self._retry(entry_id, document_type, json.loads(items_json), attempts)
+        finally:
+            self._run_lock.release()
+        
+        next_due = self._next_due()
+        if next_due is not None:
+            self._schedule(max(next_due, time.time() + self.breaker.retry_in()))
+    
+    def _retry(self, entry_id, document_type, items, attempts):
+        present = [item for item in items if os.path.exists(item['path'])]
+        if len(present) < len(items):
+            logger.error("Archived copies are gone, dropping them from the queued draft: %s",
+                         ', '.join(item['path'] for item in items if item not in present))
+        if not present:
+            with self._lock:
+                self._conn.execute("DELETE FROM mail_retry WHERE id = ?", (entry_id,))
+            return
+        with log_context('+'.join(item.get('correlation_id', '-') for item in items)):
+            success, message = self._attempt(document_type, present,
+                                             partial(self._retried, entry_id, present, attempts))
+        if success is not PENDING:
+            self._retried(entry_id, present, attempts, success, message)
+            return
+        # Keep this run from picking it up again; the result deletes or reschedules it
+        with self._lock:
+            self._conn.execute("UPDATE mail_retry SET next_attempt = ? WHERE id = ?",
+                               (time.time() + self._backoff(attempts + 1), entry_id))
+    
+    def _retried(self, entry_id, items, attempts, success, message):
+        if success:
+            with self._lock:
+                self._conn.execute("DELETE FROM mail_retry WHERE id = ?", (entry_id,))
+            self.metrics.increment('draft_retried', len(items))
+            return
+        
+        next_attempt = time.time() + max(self._backoff(attempts + 1), self.breaker.retry_in())
+        with self._lock:
+            self._conn.execute(
+                "UPDATE mail_retry SET items = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (json.dumps(items), attempts + 1, next_attempt, message, entry_id)
+            )
+
+
+class DraftCoalescer:
+    """Collects files of one document type arriving within `window` seconds into one draft."""
+    
+    def __init__(self, send, scheduler=None, window=1.0, max_attachments=10, max_total_bytes=20 * 1024 * 1024):
+        self.send = send
+        self.scheduler = scheduler
+        self.window = window if scheduler is not None or window is None else 0.0
+        self.max_attachments = max(1, int(max_attachments))
+        self.max_total_bytes = max_total_bytes
+        self._groups = {}  # group_key -> {'id', 'items', 'bytes'}
+        self._group_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.groups_sent = 0
+        self.files_sent = 0
+    
+    def add(self, group_key, path, size=0, **extra):
+        """Add a file to the open group of its type (or a new one)."""
+        item = dict(extra, path=path, size=size or 0)
+        if self.window is not None and self.window <= 0:
+            self._send(group_key, [item])
+            return
+        
+        ready = []
+        start_timer = None
+        with self._lock:
+            group = self._groups.get(group_key)
+            if group is not None and (len(group['items']) >= self.max_attachments or
+                                      group['bytes'] + item['size'] > self.max_total_bytes):
+                # Full - send it and start a new group with this file
+                ready.append(self._groups.pop(group_key)['items'])
+                group = None
+            if group is None:
+                group = {'id': next(self._group_ids), 'items': [], 'bytes': 0}
+                self._groups[group_key] = group
+                start_timer = group['id']
+            group['items'].append(item)
+            group['bytes'] += item['size']
+            if len(group['items']) >= self.max_attachments:
+                ready.append(self._groups.pop(group_key)['items'])
+                start_timer = None
+        
+        for items in ready:
+            self._send(group_key, items)
+        if start_timer is not None and self.window is not None:
+            if not self.scheduler.submit(self._flush_group, group_key, start_timer, delay=self.window, block=False):
+                # Could not schedule the window timer - don't hold the file back
+                self._flush_group(group_key, start_timer)
+    
+    def flush_all(self):
+        """Send every open group now (e.g. on shutdown)."""
+        with self._lock:
+            groups, self._groups = self._groups, {}
+        for group_key, group in groups.items():
+            self._send(group_key, group['items'])
+    
+    def pending(self):
+        """Number of files waiting in open groups."""
+        with self._lock:
+            return sum(len(group['items']) for group in self._groups.values())
+    
+    def _flush_group(self, group_key, group_id):
+        """End of window: send the group if it is still the open one for this key."""
+        with self._lock:
+            group = self._groups.get(group_key)
+            if group is None or group['id'] != group_id:
+                return
+            del self._groups[group_key]
+        self._send(group_key, group['items'])
+    
+    def _send(self, group_key, items):
+        # Flushes run on scheduler workers and the caller's thread at once
+        with self._lock:
+            self.groups_sent += 1
+            self.files_sent += len(items)
+        self.send(group_key, items)
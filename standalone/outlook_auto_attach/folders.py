@@ -0,0 +1,164 @@
+"""Which folders are watched: the user's Downloads folder(s) and configured watch roots."""
+
+import os
+import logging
+
+from .settings import SYSTEM
+from .rules import RuleEngine
+
+logger = logging.getLogger(__name__)
+
+
+def get_downloads_folder():
+    """Get the user's Downloads folder path - platform-specific. Gets actual logged-in user's folder, not Administrator."""
+    if SYSTEM == 'Windows':
+        # First, try to get Downloads folder using standard method
+        downloads = None
+        try:
+            import win32com.client
+            shell = win32com.client.Dispatch("WScript.Shell")
+            downloads = shell.SpecialFolders("Downloads")
+            if downloads and os.path.exists(downloads):
+                # Check if we're running as Administrator and found Administrator's folder
+                # If so, try to find the actual logged-in user's folder
+                if "Administrator" in downloads:
+                    logger.debug("Running as Administrator, looking for actual user's Downloads folder...")
+                    downloads = None  # Continue to find actual user's folder
+                else:
+                    logger.info("Found Downloads folder: %s", downloads)
+                    return downloads
+        except:
+            pass
+        
+        # If we didn't find a good folder (or we're Administrator), scan C:\Users for actual user folders
+        if downloads is None or "Administrator" in str(downloads):
+            try:
+                system_drive = os.environ.get('SystemDrive', 'C:')
+                users_dir = os.path.join(system_drive, 'Users')
+                if os.path.exists(users_dir):
+                    # Try to find user folders with Downloads
+                    user_folders = get_profile_downloads_folders(users_dir)
+                    
+                    # If we found user folders, prefer the one that's not Administrator
+                    for user_dl in user_folders:
+                        if "Administrator" not in user_dl:
+                            logger.info("Found Downloads folder (actual user): %s", user_dl)
+                            return user_dl
+                    
+                    # If only Administrator found, use it
+                    if user_folders:
+                        logger.info("Found Downloads folder: %s", user_folders[0])
+                        return user_folders[0]
+            except Exception as e:
+                logger.debug("Could not scan user profiles: %s", e)
+        
+        # Fallback: Use current process user's Downloads
+        downloads = os.path.join(os.path.expanduser("~"), "Downloads")
+        if not os.path.exists(downloads):
+            downloads = os.path.join(os.path.expanduser("~"), "Hämtade filer")  # Swedish Windows
+    else:  # macOS
+        downloads = os.path.join(os.path.expanduser("~"), "Downloads")
+    
+    # Ensure it exists
+    if not os.path.exists(downloads):
+        logger.warning("Downloads folder not found at %s, creating it", downloads)
+        os.makedirs(downloads, exist_ok=True)
+    
+    return downloads
+
+
+# Profile folders under C:\\Users that are not real users
+EXCLUDED_PROFILES = {'Administrator', 'Default', 'Default User', 'Public', 'All Users', '.NET v4.5', '.NET v4.5 Classic'}
+
+
+def get_profile_downloads_folders(users_dir):
+    """Downloads folder of every user profile in users_dir (English "Downloads", else Swedish "Hämtade filer")."""
+    user_folders = []
+    for folder in os.listdir(users_dir):
+        if folder in EXCLUDED_PROFILES:
+            continue
+        user_path = os.path.join(users_dir, folder)
+        if not os.path.isdir(user_path):
+            continue
+        
+        # Try English "Downloads"
+        user_downloads = os.path.join(user_path, "Downloads")
+        if os.path.exists(user_downloads):
+            user_folders.append(user_downloads)
+            continue
+        
+        # Try Swedish "Hämtade filer"
+        user_downloads_sv = os.path.join(user_path, "Hämtade filer")
+        if os.path.exists(user_downloads_sv):
+            user_folders.append(user_downloads_sv)
+    return user_folders
+
+
+def get_downloads_folders(all_profiles=False):
+    """Downloads folders to watch: the user's, plus every profile's on Windows with all_profiles."""
+    folders = [get_downloads_folder()]
+    if all_profiles and SYSTEM == 'Windows':
+        users_dir = os.path.join(os.environ.get('SystemDrive', 'C:'), 'Users')
+        try:
+            folders.extend(get_profile_downloads_folders(users_dir))
+        except OSError as e:
+            logger.warning("Could not scan user profiles in %s: %s", users_dir, e)
+    return folders
+
+
+class WatchRoot:
+    """A watched folder with its own filename rules (None = the shared rules) and archive folder."""
+    
+    def __init__(self, path, recursive=False, max_depth=None, rules=None, archive_dir=None):
+        self.path = os.path.normpath(os.path.abspath(path))
+        self.recursive = recursive
+        self.max_depth = max_depth if recursive else 0
+        self.rules = rules
+        self.archive_dir = archive_dir
+    
+    def __repr__(self):
+        if not self.recursive:
+            return self.path
+        return f"{self.path} (recursive, {'any depth' if self.max_depth is None else f'depth {self.max_depth}'})"
+
+
+def load_watch_roots(config):
+    """WatchRoots from the 'watch_roots' config, falling back to the Downloads folder."""
+    downloads = []
+    
+    def downloads_folders():
+        if not downloads:
+            downloads.extend(get_downloads_folders(config['watch_all_profiles']))
+        return downloads
+    
+    roots = []
+    seen = set()
+    for entry in config['watch_roots'] or [{'path': 'downloads'}]:
+        if isinstance(entry, str):
+            entry = {'path': entry}
+        try:
+            path = entry['path']
+            if path.lower() == 'downloads':
+                paths = downloads_folders()
+            else:
+                paths = [os.path.expandvars(os.path.expanduser(path))]
+            rules = RuleEngine.from_config(entry['rules']) if entry.get('rules') else None
+            max_depth = entry.get('max_depth')
+            for folder in paths:
+                if not os.path.isdir(folder):
+                    logger.warning("Watch folder does not exist, skipping: %s", folder)
+                    continue
+                root = WatchRoot(folder, recursive=bool(entry.get('recursive', False)),
+                                 max_depth=int(max_depth) if max_depth is not None else None,
+                                 rules=rules, archive_dir=entry.get('archive_dir', config['archive_dir']))
+                key = os.path.normcase(os.path.realpath(root.path))
+                if key not in seen:
+                    seen.add(key)
+                    roots.append(root)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.error("Ignoring invalid watch root %r: %s", entry, e)
+    
+    if not roots:
+        logger.warning("No usable watch folders configured, watching Downloads")
+        roots = [WatchRoot(folder, archive_dir=config['archive_dir']) for folder in downloads_folders()]
+    return roots
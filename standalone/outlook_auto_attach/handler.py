@@ -0,0 +1,457 @@
+"""Watcher callbacks and the per-file pipeline for the Downloads folder."""
+
+import os
+import time
+import sqlite3
+import logging
+from datetime import datetime
+
+from watchdog.events import FileSystemEventHandler
+
+from .logs import correlation_id, log_context, new_correlation_id
+from .rules import get_rule_engine, is_temporary_file
+from .archive import get_archive_folder, hash_file, move_to_archive
+from .prefill import draft_prefill
+from .scheduler import WorkScheduler
+from .completion import DownloadCompletionDetector
+from .journal import DedupJournal, ProcessedFileIndex
+from .drafts import DraftCoalescer, DraftOutbox
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadsHandler(FileSystemEventHandler):
+    """Handle file system events in Downloads folder."""
+    
+    def __init__(self, downloads_folder, scheduler=None, detector=None, queue_block_timeout=5.0,
+                 processed_files=None, journal=None, duplicate_policy='skip', duplicate_window_days=30,
+                 archive_dir=None, mail_backend=None, coalesce_window=0.0, coalesce_max_attachments=10,
+                 coalesce_max_bytes=20 * 1024 * 1024, rules=None, catch_up_scanner=None, metrics=None,
+                 max_depth=0, archive_index=None, archive_shard='month', outbox=None, large_attachments=None,
+                 extractor=None, recipients=None, subject_template="{document_type} {order}"):
+        super().__init__()
+        # Recently picked up files (path -> mtime), invalidated by delete/move events
+        self.processed_files = processed_files if processed_files is not None else ProcessedFileIndex()
+        self.downloads_folder = os.path.normpath(downloads_folder)
+        # Subfolder levels below downloads_folder whose files are processed (None = any depth)
+        self.max_depth = max_depth
+        # Shared worker pool - events are queued instead of each getting its own thread
+        self.scheduler = scheduler if scheduler is not None else WorkScheduler().start()
+        self.detector = detector if detector is not None else DownloadCompletionDetector()
+        self.queue_block_timeout = queue_block_timeout
+        # Optional persistent content-hash journal for duplicate detection across restarts
+        self.journal = journal
+        self.duplicate_policy = duplicate_policy
+        self.duplicate_window = duplicate_window_days * 86400
+        self.archive_dir = archive_dir
+        self.archive_shard = archive_shard
+        # Optional index of archived copies (name, hash, time -> location)
+        self.archive_index = archive_index
+        self._rules = rules
+        # Optional watermark of handled files, used to find downloads missed while not watching
+        self.catch_up_scanner = catch_up_scanner
+        # Counters by outcome and latency per stage (completion, classify, archive, draft, end to end)
+        self.metrics = metrics if metrics is not None else Metrics()
+        # Opens the drafts, retrying failed ones (shared by all handlers in the app)
+        self.outbox = outbox if outbox is not None else DraftOutbox(
+            self.scheduler, journal=journal, metrics=self.metrics, mail_backend=mail_backend
+        )
+        # Optional zip/split of files over the attachment size limit (LargeAttachmentStage)
+        self.large_attachments = large_attachments
+        # Optional draft prefill: order/customer number (OrderExtractor) -> recipient (RecipientIndex)
+        self.extractor = extractor
+        self.recipients = recipients
+        self.subject_template = subject_template
+        # Related files arriving close together become one draft
+        self.coalescer = DraftCoalescer(
+            self._send_draft,
+            scheduler=self.scheduler,
+            window=coalesce_window,
+            max_attachments=coalesce_max_attachments,
+            max_total_bytes=coalesce_max_bytes
+        )
+    
+    def _get_file_signature(self, file_path):
+        """Get a unique signature for a file (path + modification time)."""
+        try:
+            if os.path.exists(file_path):
+                mtime = os.path.getmtime(file_path)
+                return (file_path, mtime)
+        except:
+            pass
+        return (file_path, None)
+    
+    def _should_process(self, file_path):
+        """Check if file should be processed (not already processed or pending). Uses file signature (path + mtime)."""
+        # Same path with a different mtime means it's a new file with the same name
+        _, mtime = self._get_file_signature(file_path)
+        return self.processed_files.claim(file_path, mtime)
+    
+    def _mark_as_not_processed(self, file_path):
+        """Remove file from processed set (in case processing failed)."""
+        self.processed_files.discard(file_path)
+    
+    @property
+    def rules(self):
+        """Filename rule engine (the shared one unless one was passed in)."""
+        return self._rules if self._rules is not None else get_rule_engine()
+    
+    @property
+    def mail_backend(self):
+        """Backend used to open drafts (the shared platform backend unless one was passed in)."""
+        return self.outbox.mail_backend
+    
+    def on_created(self, event):
+        """Called when a file is created."""
+        try:
+            if event.is_directory:
+                return
+            
+            file_path = event.src_path
+            if not self._accept_event(file_path):
+                return
+            
+            # Queue for processing on the worker pool to avoid blocking
+            with log_context(new_correlation_id()):
+                logger.info("File created event: %s", os.path.basename(file_path))
+                self._enqueue(file_path)
+        except Exception as e:
+            logger.error("Error in on_created: %s", e, exc_info=True)
+    
+    def on_moved(self, event):
+        """Called when a file is moved/renamed (browsers often rename temp files)."""
+        try:
+            if event.is_directory:
+                return
+            
+            # The old path no longer exists
+            self.processed_files.discard(event.src_path)
+            
+            dest_path = event.dest_path
+            if not self._accept_event(dest_path):
+                return
+            
+            # Process the renamed file
+            with log_context(new_correlation_id()):
+                logger.info("File moved/renamed event: %s", os.path.basename(dest_path))
+                self._enqueue(dest_path)
+        except Exception as e:
+            logger.error("Error in on_moved: %s", e, exc_info=True)
+    
+    def _accept_event(self, file_path):
+        """Cheap filtering in the watcher callback, before any work is queued."""
+        directory, filename = os.path.split(file_path)
+        
+        # Skip temporary files (browsers often create .tmp files first)
+        if is_temporary_file(filename):
+            self.metrics.increment('rejected_temporary')
+            return False
+        
+        if self.rules.classify(filename) is None:
+            self.metrics.increment('rejected_name')
+            return False
+        
+        # Recursive watches report the whole tree - skip files nested deeper than allowed
+        if self.max_depth is not None and directory != self.downloads_folder:
+            depth = len(os.path.relpath(directory, self.downloads_folder).split(os.sep))
+            if depth > self.max_depth:
+                self.metrics.increment('rejected_depth')
+                return False
+        
+        # Skip if already processed
+        if not self._should_process(file_path):
+            self.metrics.increment('rejected_duplicate_event')
+            return False
+        
+        self.metrics.increment('accepted')
+        return True
+    
+    def submit_path(self, file_path):
+        """Queue a file handed over by another launch; returns the outcome."""
+        file_path = os.path.normpath(os.path.abspath(file_path))
+        filename = os.path.basename(file_path)
+        if not os.path.isfile(file_path):
+            return 'missing'
+        if is_temporary_file(filename) or self.rules.classify(filename) is None:
+            self.metrics.increment('rejected_name')
+            return 'no_match'
+        if not self._should_process(file_path):
+            self.metrics.increment('rejected_duplicate_event')
+            return 'duplicate'
+        with log_context(new_correlation_id()):
+            logger.info("Handed over: %s", filename)
+            if not self._enqueue(file_path):
+                return 'queue_full'
+        self.metrics.increment('handed_over')
+        return 'queued'
+    
+    def catch_up(self, folder=None):
+        """Queue matching files that arrived while nothing was watching; returns the number queued."""
+        if self.catch_up_scanner is None:
+            return 0
+        folder = folder or self.downloads_folder
+        start = time.perf_counter()
+        try:
+            paths = self.catch_up_scanner.scan(folder, self.rules, max_depth=self.max_depth)
+        except OSError as e:
+            logger.error("Catch-up scan of %s failed: %s", folder, e)
+            return 0
+        
+        queued = 0
+        for file_path in paths:
+            # Files the observer already reported are filtered by the dedup index
+            if not self._accept_event(file_path):
+                continue
+            with log_context(new_correlation_id()):
+                logger.info("Catch-up found: %s", os.path.basename(file_path))
+                if self._enqueue(file_path):
+                    queued += 1
+        self.metrics.increment('catch_up_queued', queued)
+        logger.info("Catch-up scan of %s: %s new file(s) in %.3fs", folder, queued, time.perf_counter() - start)
+        return queued
+    
+    def on_deleted(self, event):
+        """Called when a file is deleted - forget it so a new download with the same name is processed."""
+        if not event.is_directory:
+            self.processed_files.discard(event.src_path)
+    
+    def on_modified(self, event):
+        """Called when a file is modified (sometimes triggered on download completion)."""
+        # DISABLED: on_modified causes duplicates - it fires multiple times during download
+        # We rely on on_created and on_moved only
+        return
+    
+    def on_closed(self, event):
+        """Called when a writer closes a file (only on backends that report it, e.g. inotify)."""
+        if not event.is_directory:
+            self.detector.mark_closed(event.src_path)
+    
+    def _enqueue(self, file_path):
+        """Start watching a file for download completion on the worker pool."""
+        if self._in_catch_up_folder(file_path):
+            try:
+                # Open until handled: a file that is never handled (queue full, failure) is caught up after a restart
+                self.catch_up_scanner.track(self.downloads_folder, file_path, os.stat(file_path))
+            except OSError:
+                pass
+        state = self.detector.start(file_path)
+        queued = self.scheduler.submit(
+            self._check_completion, state,
+            delay=self.detector.first_delay, timeout=self.queue_block_timeout
+        )
+        if not queued:
+            logger.warning("Work queue full or shutting down, skipping: %s", os.path.basename(file_path))
+            self.metrics.increment('rejected_queue_full')
+            self.detector.finish(state)
+            self._mark_as_not_processed(file_path)
+        return queued
+    
+    def _check_completion(self, state):
+        """Poll a file until the browser has finished writing it, then process it."""
+        file_path = state['path']
+        status, delay = self.detector.check(state)
+        if status == DownloadCompletionDetector.PENDING:
+            # Re-check later without holding a worker thread while waiting
+            if self.scheduler.submit(self._check_completion, state, delay=delay, reschedule=True):
+                return
+            logger.warning("Could not reschedule completion check, skipping: %s", os.path.basename(file_path))
+        
+        self.detector.finish(state)
+        if status == DownloadCompletionDetector.READY:
+            logger.debug("Download complete after %s check(s): %s", state['checks'], os.path.basename(file_path))
+            self.metrics.observe('completion', time.monotonic() - state['started'])
+            self._process_file_delayed(file_path, received=state['started'])
+            return
+        
+        if status == DownloadCompletionDetector.GONE:
+            logger.debug("File no longer exists: %s", os.path.basename(file_path))
+            self.metrics.increment('gone_before_complete')
+            if self._in_catch_up_folder(file_path):
+                self.catch_up_scanner.release(self.downloads_folder, file_path)
+        elif status == DownloadCompletionDetector.TIMED_OUT:
+            logger.warning("File still being written after %.0fs, skipping: %s",
+                           self.detector.deadline, os.path.basename(file_path))
+            self.metrics.increment('failed_completion_timeout')
+        else:
+            self.metrics.increment('failed_reschedule')
+        self._mark_as_not_processed(file_path)
+    
+    def _process_file_delayed(self, file_path, received=None):
+        """Process file once the download is complete (runs on a worker thread)."""
+        # Stat before processing - the file is moved away by then
+        stat = None
+        if self._in_catch_up_folder(file_path):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                pass
+        
+        # Process the file
+        try:
+            outcome, _ = self.process_file(file_path, received=received)
+        except Exception as e:
+            logger.error("Error in process_file for %s: %s", os.path.basename(file_path), e, exc_info=True)
+            self.metrics.increment('failed_processing')
+            # Remove from processed set so it can be retried
+            self._mark_as_not_processed(file_path)
+            return  # Still open for the catch-up scan
+        
+        if not self._in_catch_up_folder(file_path) or outcome == 'failed_archive':
+            return
+        if stat is None or outcome == 'missing':
+            self.catch_up_scanner.release(self.downloads_folder, file_path)
+        else:
+            # Handled (drafted or rejected) - a later catch-up scan skips it
+            self.catch_up_scanner.handled(self.downloads_folder, file_path, stat)
+    
+    def _in_catch_up_folder(self, file_path):
+        """Whether file_path is covered by the catch-up scan of this handler's folder."""
+        if self.catch_up_scanner is None:
+            return False
+        try:
+            return os.path.commonpath([self.downloads_folder, file_path]) == self.downloads_folder
+        except ValueError:  # Different drives on Windows
+            return False
+    
+    def check_file(self, file_path):
+        """Checks made before a file is archived (also the batch dry run); 'outcome' is None if it is to be archived."""
+        filename = os.path.basename(file_path)
+        check = {'outcome': None, 'rule': None, 'content_hash': None, 'size': None, 'duplicate_of': None}
+        # Double-check file still exists
+        if not os.path.exists(file_path):
+            logger.warning("File no longer exists: %s", filename)
+            return dict(check, outcome='missing')
+        
+        classify_start = time.perf_counter()
+        rule = self.rules.classify(filename, size=os.path.getsize(file_path))
+        matches = rule is not None and rule.matches_content(file_path)
+        self.metrics.observe('classify', time.perf_counter() - classify_start)
+        if rule is None:
+            logger.debug("File does not match criteria: %s", filename)
+            self.metrics.increment('rejected_size')
+            return dict(check, outcome='no_match')
+        check['rule'] = rule
+        
+        if not matches:
+            logger.info("File content does not match %s, skipping: %s", rule.name, filename)
+            self.metrics.increment('rejected_content')
+            return dict(check, outcome='content_mismatch')
+        
+        if self.journal is not None and self.duplicate_policy != 'allow':
+            # Identical content already drafted (e.g. re-download as "name (1).pdf")? Checked before
+            # the move, so a skipped duplicate stays in Downloads
+            check['content_hash'], check['size'] = hash_file(file_path)
+            check['duplicate_of'] = self._find_duplicate(check['content_hash'])
+            if check['duplicate_of'] is not None:
+                check['outcome'] = 'duplicate'
+        return check
+    
+    def process_file(self, file_path, received=None):
+        """Process a downloaded file; returns (outcome, archived path)."""
+        filename = os.path.basename(file_path)
+        logger.info("Processing file: %s", filename)
+        
+        try:
+            check = self.check_file(file_path)
+            if check['outcome'] == 'duplicate':
+                self._handle_duplicate(file_path, check['content_hash'], check['duplicate_of'])
+            if check['outcome'] is not None:
+                return check['outcome'], None
+            rule, content_hash, size = check['rule'], check['content_hash'], check['size']
+            logger.info("File matches rule %s, processing: %s", rule.name, filename)
+            
+            # Move into businessnxtdocs (hashing the content on the way when the journal needs it)
+            archive_start = time.perf_counter()
+            unique_file_path, moved_hash, moved_size = move_to_archive(
+                file_path, self.archive_dir, compute_hash=self.journal is not None and content_hash is None,
+                rule=rule, shard=self.archive_shard
+            )
+            self.metrics.observe('archive', time.perf_counter() - archive_start)
+            if not unique_file_path:
+                logger.error("Failed to move file to archive: %s", file_path)
+                self.metrics.increment('failed_archive')
+                return 'failed_archive', None
+            content_hash = content_hash or moved_hash
+            size = size if size is not None else moved_size
+            
+            if content_hash is not None:
+                self.journal.record(content_hash, size, file_path, unique_file_path, DedupJournal.PENDING)
+            
+            if size is None:
+                size = os.path.getsize(unique_file_path)
+            if self.archive_index is not None and unique_file_path != file_path:
+                try:
+                    self.archive_index.add(filename, content_hash, size,
+                                           get_archive_folder(self.archive_dir), unique_file_path)
+                except sqlite3.Error as e:
+                    logger.warning("Could not index archived copy %s: %s", unique_file_path, e)
+            
+            # Open Outlook with file attached (possibly together with related files)
+            self._prepare_draft(rule.name, unique_file_path, size,
+                                filename=filename, content_hash=content_hash, received=received,
+                                correlation_id=correlation_id.get())
+            return 'archived', unique_file_path
+            
+        except Exception as e:
+            logger.error("Error processing file %s: %s", file_path, e, exc_info=True)
+            raise  # Re-raise so caller can handle it
+    
+    def _find_duplicate(self, content_hash):
+        """Journal entry of the draft this content duplicates under the duplicate policy, or None."""
+        previous = self.journal.find_duplicate(content_hash, self.duplicate_window)
+        if previous is None:
+            return None
+        archived_copy = previous['copy_path']
+        if self.duplicate_policy == 'reuse' and not (archived_copy and os.path.exists(archived_copy)):
+            # Archived copy is gone - process as a new file
+            return None
+        return previous
+    
+    def _handle_duplicate(self, file_path, content_hash, previous):
+        """Apply the duplicate policy to a file whose content was already drafted."""
+        filename = os.path.basename(file_path)
+        archived_copy = previous['copy_path']
+        logger.info("Duplicate of %s (already drafted %s), leaving it in place: %s",
+                    os.path.basename(previous['source_path'] or ''),
+                    datetime.fromtimestamp(previous['drafted_at'] or previous['first_seen']).strftime("%Y-%m-%d %H:%M"),
+                    filename)
+        self.journal.record_duplicate(content_hash)
+        self.metrics.increment('duplicate_content')
+        if self.duplicate_policy == 'reuse':
+            # Same way as a new file, only from the copy already in businessnxtdocs
+            rule = self.rules.classify(filename)
+            self._prepare_draft(rule.name if rule else None, archived_copy, previous['size'],
+                                filename=filename, content_hash=None, correlation_id=correlation_id.get())
+    
+    def _prepare_draft(self, document_type, path, size, **extra):
+        """Find the recipient and subject (if the order/customer number can be found), then add the file to a draft."""
+        if self.extractor is None:
+            self._add_to_draft(document_type, path, size, **extra)
+            return
+        
+        def prefilled(fields):
+            prefill = draft_prefill(document_type, fields, self.recipients, self.subject_template)
+            self._add_to_draft(document_type, path, size, **extra, **prefill)
+        self.extractor.extract(path, extra.get('filename'), prefilled)
+    
+    def _add_to_draft(self, document_type, path, size, **extra):
+        """Hand a file to the draft coalescer - oversized ones after they were zipped or split."""
+        # Files only share a draft if they go to the same recipient
+        group = (document_type, extra.get('to'))
+        if self.large_attachments is None or not self.large_attachments.needed(size):
+            self.coalescer.add(group, path, size, **extra)
+            return
+        
+        def add_parts(parts):
+            for part in parts:
+                self.coalescer.add(group, part['path'], part['size'],
+                                   **dict(extra, filename=part['filename'], archived_path=path))
+        self.large_attachments.submit(path, extra.get('filename') or os.path.basename(path), add_parts)
+    
+    def _send_draft(self, group, items):
+        """Open one Outlook draft with all files of a coalesced group (document type, recipient) attached."""
+        document_type, _ = group
+        # Log lines about the draft carry the ids of all files in it
+        with log_context('+'.join(item.get('correlation_id', '-') for item in items)):
+            self.outbox.send(document_type, items)
@@ -0,0 +1,203 @@
+"""Single-instance lock and the IPC channel to the running instance."""
+
+import os
+import sys
+import time
+import json
+import logging
+import re
+import getpass
+import threading
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+from .settings import LOG_DIR, SYSTEM
+from .batch import expand_batch_inputs
+
+logger = logging.getLogger(__name__)
+
+
+INSTANCE_LOCK_FILE = os.path.join(LOG_DIR, "instance.lock")
+# Address and key of the running instance's IPC channel (readable by the user only)
+INSTANCE_INFO_FILE = os.path.join(LOG_DIR, "instance.json")
+# Commands a second launch can hand over to the running instance
+INSTANCE_COMMANDS = ('process', 'stats', 'quit')
+
+
+def instance_address():
+    """Per-user IPC address: a named pipe on Windows, a Unix socket in the log folder elsewhere."""
+    if SYSTEM == 'Windows':
+        return r'\\.\pipe\OutlookAutoAttach-' + re.sub(r'\W', '_', getpass.getuser())
+    return os.path.join(LOG_DIR, "instance.sock")
+
+
+class InstanceLock:
+    """Per-user single-instance lock on INSTANCE_LOCK_FILE, released by the OS when the process exits."""
+    
+    def __init__(self, path=INSTANCE_LOCK_FILE):
+        self.path = path
+        self._file = None
+    
+    def acquire(self):
+        """Take the lock without waiting. Returns False if another process holds it."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        lock_file = open(self.path, 'a+')
+        try:
+            if SYSTEM == 'Windows':
+                import msvcrt
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # The pid is informational only - the OS lock is what counts
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._file = lock_file
+        return True
+    
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if SYSTEM == 'Windows':
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        except OSError as e:
+            logger.debug("Could not unlock %s: %s", self.path, e)
+        self._file.close()
+        self._file = None
+
+
+class InstanceServer:
+    """Authenticated IPC channel of the running instance, so another launch hands over its command."""
+    
+    def __init__(self, commands, address=None, info_path=INSTANCE_INFO_FILE, request_timeout=5.0):
+        self.commands = commands  # name -> callable(**args) returning the reply dict
+        self.address = address or instance_address()
+        self.info_path = info_path
+        self.request_timeout = request_timeout
+        self.handled = 0
+        self._authkey = os.urandom(32)
+        self._listener = None
+        self._thread = None
+        self._stopped = threading.Event()
+    
+    def start(self):
+        """Start listening. Raises OSError if the channel cannot be opened."""
+        if SYSTEM != 'Windows' and os.path.exists(self.address):
+            # Left behind by an instance that crashed - we hold the lock, so nobody else uses it
+            os.unlink(self.address)
+        self._listener = Listener(self.address, authkey=self._authkey)
+        temp_path = self.info_path + ".tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'pid': os.getpid(), 'address': self.address, 'authkey': self._authkey.hex()}, f)
+        os.replace(temp_path, self.info_path)
+        self._thread = threading.Thread(target=self._serve, name="InstanceServer", daemon=True)
+        self._thread.start()
+        logger.info("Listening for commands from other launches on %s", self.address)
+        return self
+    
+    def _serve(self):
+        # Always back to accept(): stop() wakes it with a connection that waits for the handshake
+        while True:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                if self._stopped.is_set():
+                    break
+                logger.warning("Rejected IPC connection: %s", e)
+                continue
+            with conn:
+                if self._stopped.is_set():
+                    break
+                self._handle(conn)
+    
+    def _handle(self, conn):
+        try:
+            if not conn.poll(self.request_timeout):
+                return
+            request = conn.recv()
+            command = request.get('command')
+            handler = self.commands.get(command)
+            if handler is None:
+                reply = {'ok': False, 'error': f"unknown command {command!r}"}
+            else:
+                logger.info("Command from another launch: %s", command)
+                reply = handler(**request.get('args', {}))
+            self.handled += 1
+        except Exception as e:
+            logger.error("IPC command failed: %s", e, exc_info=True)
+            reply = {'ok': False, 'error': str(e)}
+        try:
+            conn.send(reply)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not answer IPC command: %s", e)
+    
+    def stop(self):
+        if self._listener is None:
+            return
+        self._stopped.set()
+        try:
+            # Wake up accept()
+            Client(self.address, authkey=self._authkey).close()
+        except (OSError, EOFError, AuthenticationError):
+            pass
+        self._thread.join(timeout=2.0)
+        self._listener.close()
+        self._listener = None
+        try:
+            os.remove(self.info_path)
+        except OSError:
+            pass
+
+
+def send_instance_command(command, args=None, timeout=5.0, info_path=INSTANCE_INFO_FILE):
+    """Send a command to the running instance and return its reply; OSError if nothing answers."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with open(info_path, encoding='utf-8') as f:
+                info = json.load(f)
+            conn = Client(info['address'], authkey=bytes.fromhex(info['authkey']))
+            break
+        except (OSError, ValueError, KeyError, EOFError, AuthenticationError) as e:
+            # Not listening yet, or the info file of an earlier instance
+            if time.monotonic() >= deadline:
+                raise OSError(f"the running instance did not answer: {e}") from e
+            time.sleep(0.02)
+    with conn:
+        conn.send({'command': command, 'args': args or {}})
+        if not conn.poll(max(0.1, deadline - time.monotonic())):
+            raise OSError(f"the running instance did not answer {command!r} in time")
+        return conn.recv()
+
+
+def forward_to_instance(args, config):
+    """A second launch: hand the command to the running instance. Returns the exit status."""
+    # A batch run while the app is running is processed by it like `process`
+    command = 'process' if args.command == 'batch' else args.command
+    command = command if command in INSTANCE_COMMANDS else 'ping'
+    command_args = {}
+    if command == 'process':
+        command_args['paths'] = expand_batch_inputs(args.inputs, getattr(args, 'recursive', False))
+    try:
+        reply = send_instance_command(command, command_args, timeout=config['instance_connect_timeout'])
+    except OSError as e:
+        logger.error("Another instance holds %s, but %s", INSTANCE_LOCK_FILE, e)
+        return 1
+    if command == 'ping':
+        logger.info("Already running (pid %s), not starting a second instance", reply.get('pid'))
+    elif sys.stdout is not None:
+        json.dump(reply, sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write("\n")
+    return 0 if reply.get('ok') else 1
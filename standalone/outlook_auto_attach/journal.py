@@ -0,0 +1,155 @@
+"""Duplicate detection: recently seen files and the persistent content-hash journal."""
+
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .settings import JOURNAL_FILE
+
+
+class ProcessedFileIndex:
+    """Bounded LRU + TTL index of files already picked up, used to ignore duplicate events."""
+    
+    def __init__(self, max_entries=10000, ttl=86400.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._entries = OrderedDict()  # file_path -> (mtime, last_seen) - oldest first
+        self._lock = threading.Lock()
+    
+    def claim(self, file_path, mtime):
+        """Record a file as being processed; False if the same path and mtime was already claimed."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(file_path)
+            duplicate = entry is not None and entry[0] == mtime and now - entry[1] < self.ttl
+            # (Re)insert at the most-recently-used end
+            self._entries[file_path] = (mtime, now)
+            self._entries.move_to_end(file_path)
+            self._evict(now)
+        return not duplicate
+    
+    def discard(self, file_path):
+        """Forget a file (deleted, moved away, or processing failed)."""
+        with self._lock:
+            self._entries.pop(file_path, None)
+    
+    def __contains__(self, file_path):
+        with self._lock:
+            entry = self._entries.get(file_path)
+            return entry is not None and time.monotonic() - entry[1] < self.ttl
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+    
+    def _evict(self, now):
+        """Drop least recently used entries beyond the size limit and expired entries (oldest first)."""
+        entries = self._entries
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        while entries:
+            oldest_path, (_, last_seen) = next(iter(entries.items()))
+            if now - last_seen < self.ttl:
+                break
+            del entries[oldest_path]
+
+
+class DedupJournal:
+    """Persistent record of processed files keyed by content hash (SQLite, WAL mode)."""
+    
+    PENDING = 'pending'  # Copied to businessnxtdocs, draft not opened yet
+    DRAFTED = 'drafted'
+    DRAFT_FAILED = 'draft_failed'
+    
+    def __init__(self, db_path=JOURNAL_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is crash-safe in WAL mode; a power loss can only lose the latest commits
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed (
+                content_hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                source_path TEXT,
+                copy_path TEXT,
+                outcome TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                seen_count INTEGER NOT NULL DEFAULT 1,
+                drafted_at REAL
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(processed)")}
+        if 'drafted_at' not in columns:
+            # Journals from before drafted_at: their window starts at first_seen
+            self._conn.execute("ALTER TABLE processed ADD COLUMN drafted_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS processed_last_seen ON processed (last_seen)")
+    
+    def lookup(self, content_hash):
+        """Return the journal entry for this content as a dict, or None."""
+        keys = ('content_hash', 'size', 'source_path', 'copy_path', 'outcome', 'first_seen', 'last_seen',
+                'seen_count', 'drafted_at')
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT %s FROM processed WHERE content_hash = ?" % ", ".join(keys), (content_hash,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(keys, row))
+    
+    def find_duplicate(self, content_hash, window_seconds):
+        """Return the entry if this content was drafted within the window (counted from that draft), else None."""
+        entry = self.lookup(content_hash)
+        if entry is None or entry['outcome'] != self.DRAFTED:
+            return None
+        if time.time() - (entry['drafted_at'] or entry['first_seen']) > window_seconds:
+            return None
+        return entry
+    
+    def record(self, content_hash, size, source_path, copy_path, outcome):
+        """Insert or update the entry for this content."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO processed (content_hash, size, source_path, copy_path, outcome, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(content_hash) DO UPDATE SET
+                    source_path = excluded.source_path,
+                    copy_path = excluded.copy_path,
+                    outcome = excluded.outcome,
+                    last_seen = excluded.last_seen,
+                    seen_count = seen_count + 1
+            """, (content_hash, size, source_path, copy_path, outcome, now, now))
+    
+    def record_duplicate(self, content_hash):
+        """Count another sighting of drafted content; the duplicate window keeps running from the draft."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE processed SET last_seen = ?, seen_count = seen_count + 1 WHERE content_hash = ?",
+                (time.time(), content_hash)
+            )
+    
+    def set_outcome(self, content_hash, outcome):
+        """Update the outcome of an existing entry (a draft also restarts its duplicate window)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE processed SET outcome = ?, last_seen = ?, "
+                "drafted_at = CASE WHEN ? = ? THEN ? ELSE drafted_at END WHERE content_hash = ?",
+                (outcome, now, outcome, self.DRAFTED, now, content_hash)
+            )
+    
+    def prune(self, max_age_days):
+        """Delete entries not seen for max_age_days and checkpoint the WAL. Returns the number removed."""
+        cutoff = time.time() - max_age_days * 86400
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM processed WHERE last_seen < ?", (cutoff,)).rowcount
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,204 @@
+"""Zipping or splitting attachments that are too large for the mail server."""
+
+import os
+import time
+import shutil
+import logging
+import contextvars
+import zipfile
+import threading
+import concurrent.futures
+from collections import Counter
+from functools import partial
+
+from .settings import LOG_DIR
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Zips and parts of oversized attachments (large_attachment_* settings), removed after a few days
+LARGE_ATTACHMENT_DIR = os.path.join(LOG_DIR, "large-attachments")
+
+
+def _split_file(source_path, part_prefix, part_bytes, chunk_size=1024 * 1024):
+    """Copy a file into numbered parts (<part_prefix>.001, .002, ...) of at most part_bytes. Returns their paths."""
+    parts = []
+    with open(source_path, 'rb') as fsrc:
+        while True:
+            chunk = fsrc.read(min(chunk_size, part_bytes))
+            if not chunk:
+                break
+            part_path = f"{part_prefix}.{len(parts) + 1:03d}"
+            with open(part_path, 'wb') as fdst:
+                written = 0
+                while chunk:
+                    fdst.write(chunk)
+                    written += len(chunk)
+                    if written >= part_bytes:
+                        break
+                    chunk = fsrc.read(min(chunk_size, part_bytes - written))
+            parts.append(part_path)
+    return parts
+
+
+def prepare_large_attachment(source_path, output_dir, arcname, mode='zip', max_bytes=0, compresslevel=6,
+                             chunk_size=1024 * 1024):
+    """Zip or split an oversized file to fit max_bytes (runs in a worker process); returns its parts."""
+    start = time.perf_counter()
+    base = os.path.join(output_dir, os.path.basename(source_path))
+    zipped = None
+    if mode == 'zip':
+        target = os.path.splitext(base)[0] + ".zip"
+        with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as bundle:
+            with open(source_path, 'rb') as fsrc, bundle.open(arcname, 'w', force_zip64=True) as fdst:
+                shutil.copyfileobj(fsrc, fdst, chunk_size)
+        zipped = os.path.getsize(target)
+        if max_bytes and zipped > max_bytes:
+            # Already compressed content (scans are mostly JPEG) - split the zip
+            paths = _split_file(target, target, max_bytes, chunk_size)
+            os.remove(target)
+        else:
+            paths = [target]
+    else:
+        paths = _split_file(source_path, base, max_bytes or os.path.getsize(source_path) or 1, chunk_size)
+    return {'parts': [(path, os.path.getsize(path)) for path in paths], 'zipped': zipped,
+            'seconds': time.perf_counter() - start}
+
+
+class LargeAttachmentStage:
+    """Zips or splits archived files over max_bytes in a process pool before they go to the draft."""
+    
+    def __init__(self, max_bytes, mode='zip', output_dir=LARGE_ATTACHMENT_DIR, workers=1, compresslevel=6,
+                 scheduler=None, metrics=None):
+        self.max_bytes = int(max_bytes or 0)
+        self.mode = mode if mode in ('zip', 'split') else 'zip'
+        self.output_dir = output_dir
+        self.workers = max(1, int(workers))
+        self.compresslevel = compresslevel
+        self.scheduler = scheduler
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        self._totals = Counter()
+    
+    def needed(self, size):
+        return 0 < self.max_bytes < (size or 0)
+    
+    def submit(self, path, filename, on_done):
+        """Prepare `path` in the pool; on_done(parts) gets the parts, or the original file if preparing fails."""
+        size = os.path.getsize(path)
+        with self._lock:
+            if self._executor is None:
+                # Started on the first large file - most runs never need it
+                os.makedirs(self.output_dir, exist_ok=True)
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            self._pending += 1
+        logger.info("Attachment over %s MB, %s it in the background: %s", self.max_bytes // (1024 * 1024),
+                    "zipping" if self.mode == 'zip' else "splitting", filename)
+        context = contextvars.copy_context()
+        try:
+            future = self._executor.submit(prepare_large_attachment, path, self.output_dir, filename,
+                                           mode=self.mode, max_bytes=self.max_bytes,
+                                           compresslevel=self.compresslevel)
+        except RuntimeError as e:
+            # Shutting down, or a worker process died
+            future = concurrent.futures.Future()
+            future.set_exception(e)
+        future.add_done_callback(lambda f: context.run(self._done, f, path, filename, size, on_done))
+    
+    def _done(self, future, path, filename, size, on_done):
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error("Could not prepare large attachment %s, attaching it as is: %s", filename, e)
+            self.metrics.increment('large_attachment_failed')
+            parts = [{'path': path, 'filename': filename, 'size': size}]
+        else:
+            output = sum(part_size for _, part_size in result['parts'])
+            self.metrics.observe('large_attachment', result['seconds'])
+            with self._lock:
+                self._totals['files'] += 1
+                self._totals['bytes_in'] += size
+                self._totals['bytes_out'] += output
+                self._totals['parts'] += len(result['parts'])
+                self._totals['seconds'] += result['seconds']
+            logger.info("Prepared %s: %.1f MB -> %s part(s), %.1f MB (ratio %.2f) in %.2fs", filename,
+                        size / 1e6, len(result['parts']), output / 1e6, output / max(1, size), result['seconds'])
+            parts = [{'path': part_path, 'filename': os.path.basename(part_path), 'size': part_size}
+                     for part_path, part_size in result['parts']]
+        # on_done ends up in the mail backend - not on the pool's management thread
+        hand_on = partial(self._hand_on, on_done, parts, filename)
+        if self.scheduler is None or not self.scheduler.submit(hand_on, block=False):
+            hand_on()
+    
+    def _hand_on(self, on_done, parts, filename):
+        try:
+            on_done(parts)
+        except Exception as e:
+            logger.error("Error handing on prepared attachment %s: %s", filename, e, exc_info=True)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._idle.notify_all()
+    
+    def wait(self, timeout=None):
+        """Wait until every submitted file has been handed on. Returns False on timeout."""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+    
+    def close(self, timeout=None):
+        """Finish the files in progress and stop the worker processes."""
+        self.wait(timeout)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def prune(self, max_age_days=7):
+        """Delete prepared files older than max_age_days (the drafts have long been opened). Returns the count."""
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        try:
+            entries = list(os.scandir(self.output_dir))
+        except OSError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError as e:
+                logger.warning("Could not delete old prepared attachment %s: %s", entry.name, e)
+        return removed
+    
+    def stats(self):
+        with self._lock:
+            totals = dict(self._totals)
+            pending = self._pending
+        bytes_in = totals.get('bytes_in', 0)
+        return {
+            'pending': pending,
+            'files': totals.get('files', 0),
+            'parts': totals.get('parts', 0),
+            'bytes_in': bytes_in,
+            'bytes_out': totals.get('bytes_out', 0),
+            'compression_ratio': round(totals.get('bytes_out', 0) / bytes_in, 3) if bytes_in else None,
+            'seconds': round(totals.get('seconds', 0.0), 3),
+        }
+
+
+def create_large_attachment_stage(config, scheduler=None, metrics=None):
+    """The large-attachment stage from the config, or None if it is off."""
+    if not config['large_attachment_max_bytes']:
+        return None
+    return LargeAttachmentStage(
+        config['large_attachment_max_bytes'],
+        mode=config['large_attachment_mode'],
+        workers=config['large_attachment_workers'],
+        compresslevel=config['large_attachment_compress_level'],
+        scheduler=scheduler,
+        metrics=metrics
+    )
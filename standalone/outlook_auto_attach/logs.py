@@ -0,0 +1,107 @@
+"""Logging through a background queue listener, with correlation ids per download."""
+
+import sys
+import json
+import queue
+import logging
+import logging.handlers
+import contextlib
+import contextvars
+import uuid
+from datetime import datetime
+
+from .settings import LOG_FILE
+
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - [%(correlation_id)s] %(message)s'
+
+
+# Id of the download being handled, attached to every log record (see log_context)
+correlation_id = contextvars.ContextVar('correlation_id', default='-')
+
+
+def new_correlation_id():
+    """Short random id tying together the log lines of one download across threads and stages."""
+    return uuid.uuid4().hex[:8]
+
+
+@contextlib.contextmanager
+def log_context(value):
+    """Tag log records (and work submitted to a WorkScheduler) in this block with a correlation id."""
+    token = correlation_id.set(value)
+    try:
+        yield value
+    finally:
+        correlation_id.reset(token)
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Adds the current correlation id to the record (runs in the logging thread, before queueing)."""
+    
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line, for grepping and for log tooling."""
+    
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'correlation_id': getattr(record, 'correlation_id', '-'),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class JsonQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler for JSON lines that keeps the traceback out of the message, in its own field."""
+    
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level='INFO', log_format='text', max_bytes=5 * 1024 * 1024, backup_count=5,
+                  rotate_when=None, log_file=LOG_FILE):
+    """Log through a queue to a background listener (rotating file + stderr); returns the started QueueListener."""
+    if rotate_when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            log_file, when=rotate_when, backupCount=backup_count, encoding='utf-8')
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    handlers = [file_handler]
+    if sys.stderr is not None:  # None in a windowed PyInstaller build
+        handlers.append(logging.StreamHandler())
+    formatter = JsonLinesFormatter() if log_format == 'json' else logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = (JsonQueueHandler if log_format == 'json' else logging.handlers.QueueHandler)(log_queue)
+    queue_handler.addFilter(CorrelationIdFilter())
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    try:
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+    except (ValueError, TypeError):
+        root.setLevel(logging.INFO)
+    
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,656 @@
+"""Mail client backends: Outlook COM on Windows, AppleScript/osascript on macOS."""
+
+import os
+import time
+import json
+import queue
+import logging
+import subprocess
+import threading
+from functools import partial
+
+from .settings import SYSTEM
+
+logger = logging.getLogger(__name__)
+
+# open_draft() success value for a draft the mail client is still opening when the call times out;
+# the final result is passed to on_done(success, message) once it is known. Falsy, like a failure.
+PENDING = None
+
+
+class MailBackend:
+    """Interface to the mail client used to open draft emails; methods return (success, message)."""
+    
+    name = 'none'
+    
+    def open_draft(self, attachments, to=None, subject=None, body=None, on_done=None):
+        """Open a new draft with the given files attached (success may be PENDING, see on_done)."""
+        raise NotImplementedError
+    
+    def warm_up(self):
+        """Start or attach to the mail client ahead of the first draft. Returns (success, message)."""
+        return self.probe()
+    
+    def probe(self):
+        """Cheap check that the mail client is reachable, without starting it. Returns (success, message)."""
+        return True, "Nothing to check"
+    
+    def close(self):
+        """Release any resources held by the backend."""
+        pass
+
+
+class UnsupportedMailBackend(MailBackend):
+    """Used on platforms without Outlook automation."""
+    
+    name = 'unsupported'
+    
+    def open_draft(self, attachments, to=None, subject=None, body=None, on_done=None):
+        return False, f"Unsupported platform: {SYSTEM}"
+    
+    def probe(self):
+        return False, f"Unsupported platform: {SYSTEM}"
+
+
+def _attach_outlook_com():
+    """Attach to a running Outlook instance (raises if Outlook is not running)."""
+    import win32com.client
+    return win32com.client.GetActiveObject("Outlook.Application")
+
+
+def _connect_outlook_com():
+    """Attach to a running Outlook instance, or start one."""
+    import win32com.client
+    try:
+        outlook = win32com.client.GetActiveObject("Outlook.Application")
+        logger.info("Using existing Outlook instance")
+    except Exception:
+        outlook = win32com.client.Dispatch("Outlook.Application")
+        logger.info("Created new Outlook instance")
+    return outlook
+
+
+def _com_initialize():
+    import pythoncom
+    pythoncom.CoInitialize()
+
+
+def _com_uninitialize():
+    import pythoncom
+    pythoncom.CoUninitialize()
+
+
+class OutlookComSession(MailBackend):
+    """Outlook COM automation (Windows) on one dedicated STA thread with a cached Outlook.Application."""
+    
+    name = 'outlook-com'
+    
+    def __init__(self, connect=None, com_init=None, com_uninit=None, timeout=30.0, attach=None):
+        self._connect = connect or _connect_outlook_com
+        self._attach = attach or (_attach_outlook_com if connect is None else connect)
+        if com_init is None and SYSTEM == 'Windows':
+            # Apartment-threaded model is required for Outlook automation
+            com_init, com_uninit = _com_initialize, _com_uninitialize
+        self._com_init = com_init
+        self._com_uninit = com_uninit
+        self.timeout = timeout
+        self._jobs = queue.Queue()
+        self._outlook = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._job_lock = threading.Lock()  # Guards job['on_done'] and job['state'] (queued, started, done or cancelled)
+        # Counters for latency and reconnect behaviour
+        self.drafts = 0
+        self.failures = 0
+        self.connects = 0
+        self.last_latency = None
+    
+    def open_draft(self, attachments, to=None, subject=None, body=None, on_done=None):
+        """Queue a draft for the COM thread and wait for the result (PENDING if it started but is not done)."""
+        for path in attachments:
+            if not os.path.exists(path):
+                logger.error("File not found: %s", path)
+                return False, f"File not found: {path}"
+        
+        self._ensure_thread()
+        job = {
+            'attachments': [os.path.abspath(path).replace('/', '\\') for path in attachments],
+            'to': to,
+            'subject': subject,
+            'body': body,
+            'queued': time.perf_counter(),
+            'state': 'queued',
+            'done': threading.Event(),
+            'result': None,
+        }
+        self._jobs.put(job)
+        if not job['done'].wait(self.timeout):
+            state = self._cancel(job, on_done)
+            if state == 'started':
+                logger.warning("Outlook is taking more than %.0fs to open the draft, leaving it to finish",
+                               self.timeout)
+                return PENDING, "Draft still opening in Outlook"
+            if state == 'cancelled':
+                logger.error("Timed out after %.0fs waiting for Outlook", self.timeout)
+                return False, "Timeout opening Outlook"
+        return job['result']
+    
+    def warm_up(self):
+        """Connect to Outlook (starting it if needed) on the COM thread and check the proxy."""
+        return self._call(partial(self._check_proxy, self._connect))
+    
+    def probe(self):
+        """Check the cached proxy, or attach to an Outlook that is already running (never starts it)."""
+        return self._call(partial(self._check_proxy, self._attach))
+    
+    def _call(self, func):
+        """Run func() on the COM thread and wait for its (success, message) result."""
+        self._ensure_thread()
+        job = {'call': func, 'state': 'queued', 'done': threading.Event(), 'result': None}
+        self._jobs.put(job)
+        if not job['done'].wait(self.timeout) and self._cancel(job) != 'done':
+            return False, "Timeout waiting for Outlook"
+        return job['result']
+    
+    def _cancel(self, job, on_done=None):
+        """The caller gave up waiting: a job that has not started is skipped, a started one reports to on_done."""
+        with self._job_lock:
+            if job['state'] == 'queued':
+                job['state'] = 'cancelled'
+            elif job['state'] == 'started':
+                job['on_done'] = on_done
+            return job['state']
+    
+    def _check_proxy(self, connect):
+        """COM thread: make sure a live proxy is cached; a cheap property read detects a dead one."""
+        try:
+            if self._outlook is None:
+                self._outlook = connect()
+                self.connects += 1
+            return True, f"Outlook {self._outlook.Version}"
+        except Exception as e:
+            self._outlook = None
+            return False, f"Error: {str(e)}"
+    
+    def close(self):
+        """Stop the COM thread and release the Outlook proxy."""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._jobs.put(None)
+            thread.join(timeout=5.0)
+    
+    def _ensure_thread(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="OutlookCOM", daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        """COM apartment thread: owns the Outlook proxy and runs queued draft jobs in order."""
+        if self._com_init is not None:
+            self._com_init()
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                with self._job_lock:
+                    if job['state'] == 'cancelled':
+                        # Timed out while queued - the outbox retries it, don't open it twice
+                        continue
+                    job['state'] = 'started'
+                try:
+                    if job.get('call') is not None:
+                        job['result'] = job['call']()
+                    else:
+                        job['result'] = self._create_draft(job)
+                except Exception as e:
+                    job['result'] = (False, f"Error: {str(e)}")
+                with self._job_lock:
+                    job['state'] = 'done'
+                    on_done = job.get('on_done')
+                job['done'].set()
+                if on_done is not None:
+                    # The caller timed out while this draft was opening - hand it the final result
+                    try:
+                        on_done(*job['result'])
+                    except Exception:
+                        logger.exception("Error handling the late result of a draft")
+        finally:
+            self._outlook = None
+            if self._com_uninit is not None:
+                self._com_uninit()
+    
+    def _create_draft(self, job):
+        """Create and display the mail item, reconnecting once if the cached proxy is dead."""
+        last_error = None
+        for attempt in range(2):
+            try:
+                if self._outlook is None:
+                    self._outlook = self._connect()
+                    self.connects += 1
+                mail_item = self._outlook.CreateItem(0)  # 0 = olMailItem
+                for path in job['attachments']:
+                    mail_item.Attachments.Add(path)
+                if job['to']:
+                    mail_item.To = job['to']
+                if job['subject']:
+                    mail_item.Subject = job['subject']
+                if job['body']:
+                    mail_item.Body = job['body']
+                mail_item.Display()
+                self.drafts += 1
+                self.last_latency = time.perf_counter() - job['queued']
+                logger.info("Successfully opened Outlook with %s file(s): %s",
+                            len(job['attachments']), ', '.join(job['attachments']))
+                return True, "Outlook opened successfully"
+            except Exception as e:
+                # Outlook was closed or restarted - drop the cached proxy and reconnect
+                last_error = e
+                self._outlook = None
+                if attempt == 0:
+                    logger.warning("Outlook call failed, reconnecting: %s", e)
+        self.failures += 1
+        logger.error("Error opening Outlook: %s", last_error)
+        return False, f"Error: {str(last_error)}"
+
+
+def applescript_string(value):
+    """Quote a Python string as an AppleScript string literal (handles quotes and backslashes in paths)."""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class AppleScriptMailBackend(MailBackend):
+    """Outlook automation on macOS by running an AppleScript through osascript (one process per draft)."""
+    
+    name = 'applescript'
+    
+    def __init__(self, timeout=10.0):
+        self.timeout = timeout
+    
+    def warm_up(self):
+        """Launch Outlook in the background (the first draft then skips the app start)."""
+        return self._run_script('tell application "Microsoft Outlook" to launch')
+    
+    def probe(self):
+        ok, output = self._run_script('application "Microsoft Outlook" is running')
+        if ok and output != 'true':
+            return False, "Outlook is not running"
+        return ok, output
+    
+    def _run_script(self, script):
+        try:
+            result = subprocess.run(['osascript', '-e', script], capture_output=True, text=True,
+                                    timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return False, f"Error: {str(e)}"
+        if result.returncode != 0:
+            return False, f"AppleScript error: {result.stderr.strip() or 'Unknown error'}"
+        return True, result.stdout.strip()
+    
+    def open_draft(self, attachments, to=None, subject=None, body=None, on_done=None):
+        for path in attachments:
+            if not os.path.exists(path):
+                logger.error("File not found: %s", path)
+                return False, f"File not found: {path}"
+        
+        try:
+            properties = []
+            if subject:
+                properties.append(f"subject:{applescript_string(subject)}")
+            if body:
+                properties.append(f"plain text content:{applescript_string(body)}")
+            with_properties = f" with properties {{{', '.join(properties)}}}" if properties else ""
+            message_lines = [
+                f"make new attachment with properties {{file:POSIX file {applescript_string(os.path.abspath(path))}}}"
+                for path in attachments
+            ]
+            if to:
+                message_lines.append(
+                    f"make new to recipient with properties {{email address:{{address:{applescript_string(to)}}}}}"
+                )
+            message_lines = "\n".join(message_lines)
+            script = f'''
+            tell application "Microsoft Outlook"
+                activate
+                set newMessage to make new outgoing message{with_properties}
+                tell newMessage
+                    {message_lines}
+                end tell
+                open newMessage
+            end tell
+            '''
+            
+            result = subprocess.run(
+                ['osascript', '-e', script],
+                capture_output=True,
+                text=True,
+                timeout=self.timeout
+            )
+            
+            if result.returncode == 0:
+                logger.info("Successfully opened Outlook with file(s): %s", ', '.join(attachments))
+                return True, "Outlook opened successfully"
+            else:
+                error_msg = result.stderr.strip() if result.stderr else "Unknown error"
+                logger.error("AppleScript error: %s", error_msg)
+                return False, f"AppleScript error: {error_msg}"
+                
+        except subprocess.TimeoutExpired:
+            logger.error("Timeout opening Outlook")
+            return False, "Timeout opening Outlook"
+        except Exception as e:
+            logger.error("Error opening Outlook: %s", e)
+            return False, f"Error: {str(e)}"
+
+
+# Long-lived JXA helper run by OsascriptBridge. It is compiled once when osascript starts,
+# then reads one JSON request per line from stdin and answers with one JSON line on stdout.
+# Request:  {"id": 1, "attachments": ["/path/a.pdf"], "to": null, "subject": null, "body": null}
+#       or  {"id": 2, "probe": true, "launch": false} (is Outlook running; launch=true starts it first)
+# Response: {"id": 1, "ok": true} or {"id": 1, "ok": false, "error": "..."}
+# On startup it prints {"ready": true}.
+OSASCRIPT_BRIDGE_SCRIPT = r'''
+ObjC.import('Foundation');
+
+function writeLine(obj) {
+    var line = $(JSON.stringify(obj) + "\n");
+    $.NSFileHandle.fileHandleWithStandardOutput.writeData(line.dataUsingEncoding($.NSUTF8StringEncoding));
+}
+
+function openDraft(request) {
+    var outlook = Application('Microsoft Outlook');
+    var properties = {};
+    if (request.subject) { properties.subject = request.subject; }
+    if (request.body) { properties.plainTextContent = request.body; }
+    var message = outlook.make({new: 'outgoingMessage', withProperties: properties});
+    request.attachments.forEach(function (path) {
+        outlook.make({new: 'attachment', at: message, withProperties: {file: Path(path)}});
+    });
+    if (request.to) {
+        outlook.make({new: 'toRecipient', at: message, withProperties: {emailAddress: {address: request.to}}});
+    }
+    outlook.activate();
+    outlook.open(message);
+}
+
+function probe(request) {
+    var outlook = Application('Microsoft Outlook');
+    if (request.launch) { outlook.launch(); }
+    if (!outlook.running()) { throw new Error("Outlook is not running"); }
+}
+
+var stdin = $.NSFileHandle.fileHandleWithStandardInput;
+var pending = $.NSMutableData.alloc.init;
+var newline = $("\n").dataUsingEncoding($.NSUTF8StringEncoding);
+writeLine({ready: true});
+while (true) {
+    var chunk = stdin.availableData;
+    if (chunk.length === 0) { break; }
+    pending.appendData(chunk);
+    while (true) {
+        var found = pending.rangeOfDataOptionsRange(newline, 0, $.NSMakeRange(0, pending.length));
+        if (found.length === 0) { break; }
+        var lineData = pending.subdataWithRange($.NSMakeRange(0, found.location));
+        pending.replaceBytesInRangeWithBytesLength($.NSMakeRange(0, found.location + 1), null, 0);
+        var text = $.NSString.alloc.initWithDataEncoding(lineData, $.NSUTF8StringEncoding).js;
+        var request;
+        try { request = JSON.parse(text); } catch (e) { continue; }
+        try {
+            if (request.probe) { probe(request); } else { openDraft(request); }
+            writeLine({id: request.id, ok: true});
+        } catch (e) {
+            writeLine({id: request.id, ok: false, error: String(e)});
+        }
+    }
+}
+'''
+
+
+class OsascriptBridge(MailBackend):
+    """Outlook automation on macOS through one long-lived osascript helper speaking JSON lines."""
+    
+    name = 'osascript-bridge'
+    
+    def __init__(self, command=None, timeout=10.0, startup_timeout=10.0):
+        self.command = command or ['osascript', '-l', 'JavaScript', '-e', OSASCRIPT_BRIDGE_SCRIPT]
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self._lock = threading.Lock()  # One request in flight at a time
+        self._late_lock = threading.Lock()  # Guards _late against the stdout reader
+        self._process = None
+        self._responses = None
+        self._late = None  # request id -> on_done for drafts that timed out but may still be answered
+        self._next_id = 0
+        self.starts = 0
+        self.drafts = 0
+        self.failures = 0
+    
+    def open_draft(self, attachments, to=None, subject=None, body=None, on_done=None):
+        for path in attachments:
+            if not os.path.exists(path):
+                logger.error("File not found: %s", path)
+                return False, f"File not found: {path}"
+        
+        request = {
+            'attachments': [os.path.abspath(path) for path in attachments],
+            'to': to,
+            'subject': subject,
+            'body': body,
+        }
+        
+        def late(success, message):
+            self._draft_result(attachments, success, message)
+            if on_done is not None:
+                on_done(success, message)
+        with self._lock:
+            result = self._send(request, on_late=late)
+        if result[0] is PENDING:
+            logger.warning("osascript helper is taking more than %gs to open the draft, leaving it to finish",
+                           self.timeout)
+        else:
+            self._draft_result(attachments, *result)
+        return result
+    
+    def _draft_result(self, attachments, success, message):
+        if success:
+            self.drafts += 1
+            logger.info("Successfully opened Outlook with file(s): %s", ', '.join(attachments))
+        else:
+            self.failures += 1
+            logger.error("Failed to open Outlook through osascript helper: %s", message)
+    
+    def warm_up(self):
+        """Start the helper and launch Outlook, so the first draft pays for neither."""
+        with self._lock:
+            return self._send({'probe': True, 'launch': True})
+    
+    def probe(self):
+        with self._lock:
+            return self._send({'probe': True, 'launch': False})
+    
+    def close(self):
+        with self._lock:
+            self._stop()
+    
+    def _send(self, request, on_late=None):
+        """Send one request and wait for its response (caller holds the lock)."""
+        for attempt in range(2):
+            try:
+                self._ensure_started()
+            except (OSError, RuntimeError) as e:
+                self._stop()
+                return False, f"Could not start osascript helper: {e}"
+            
+            self._next_id += 1
+            request['id'] = self._next_id
+            try:
+                self._process.stdin.write(json.dumps(request) + "\n")
+                self._process.stdin.flush()
+            except (OSError, ValueError):
+                # Helper died while idle - nothing was sent, so restarting and resending is safe
+                logger.warning("osascript helper is not running, restarting")
+                self._stop()
+                continue
+            
+            deadline = time.monotonic() + self.timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    response = self._responses.get(timeout=max(0.0, remaining))
+                except queue.Empty:
+                    with self._late_lock:
+                        answered, response = self._take_response(request['id'])
+                        if not answered and on_late is not None and not self._late:
+                            # Written, so the helper will still open it: the reader hands its answer to on_late.
+                            # A second timeout behind a late request means the helper is hung.
+                            self._late[request['id']] = partial(self._answer_late, request, on_late)
+                            return PENDING, "Draft still opening in Outlook"
+                    if not answered:
+                        logger.error("osascript helper did not answer within %gs, restarting it", self.timeout)
+                        self._stop(kill=True)
+                        return False, "Timeout opening Outlook"
+                if response is None:
+                    self._stop()
+                    return False, "osascript helper exited"
+                if response.get('id') == request['id']:
+                    return self._result(request, response)
+        return False, "osascript helper could not be restarted"
+    
+    def _take_response(self, request_id):
+        """(True, answer or None at exit) if queued by now, else (False, None); caller holds _late_lock."""
+        while True:
+            try:
+                response = self._responses.get_nowait()
+            except queue.Empty:
+                return False, None
+            if response is None or response.get('id') == request_id:
+                return True, response
+    
+    @staticmethod
+    def _result(request, response):
+        if response.get('ok'):
+            return True, "Outlook is running" if request.get('probe') else "Outlook opened successfully"
+        return False, f"AppleScript error: {response.get('error') or 'Unknown error'}"
+    
+    def _answer_late(self, request, on_late, response):
+        """Stdout reader: the answer to a request that timed out (None if the helper exited first)."""
+        try:
+            on_late(*(self._result(request, response) if response is not None else (False, "osascript helper exited")))
+        except Exception:
+            logger.exception("Error handling the late answer of the osascript helper")
+    
+    def _ensure_started(self):
+        """Start the helper if it is not running and wait for its ready line."""
+        if self._process is not None and self._process.poll() is None:
+            return
+        self._stop()
+        self._responses = queue.Queue()
+        self._late = {}
+        self._process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            bufsize=1
+        )
+        self.starts += 1
+        threading.Thread(target=self._read_stdout, args=(self._process, self._responses, self._late),
+                         name="osascript-stdout", daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self._process,),
+                         name="osascript-stderr", daemon=True).start()
+        try:
+            ready = self._responses.get(timeout=self.startup_timeout)
+        except queue.Empty:
+            ready = None
+        if not ready or not ready.get('ready'):
+            raise RuntimeError("helper did not report ready")
+        logger.info("osascript helper started (pid %s)", self._process.pid)
+    
+    def _stop(self, kill=False):
+        """Stop the helper: close its stdin so it exits on its own, or kill it if it is hung."""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        if kill:
+            process.kill()
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    
+    def _read_stdout(self, process, responses, late):
+        """Parse JSON response lines from the helper (late answers go to their callback); None marks the end."""
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                response = json.loads(line)
+            except ValueError:
+                logger.debug("Ignoring output from osascript helper: %s", line)
+                continue
+            with self._late_lock:
+                answer = late.pop(response.get('id'), None)
+                if answer is None:
+                    responses.put(response)
+            if answer is not None:
+                answer(response)
+        with self._late_lock:
+            answers = list(late.values())
+            late.clear()
+            responses.put(None)
+        for answer in answers:
+            answer(None)
+    
+    @staticmethod
+    def _read_stderr(process):
+        for line in process.stderr:
+            if line.strip():
+                logger.debug("osascript helper: %s", line.strip())
+
+
+_mail_backend = None
+_mail_backend_lock = threading.Lock()
+
+
+def create_mail_backend(timeout=30.0, mac_script_bridge=True):
+    """Create the mail backend for this platform."""
+    if SYSTEM == 'Windows':
+        return OutlookComSession(timeout=timeout)
+    elif SYSTEM == 'Darwin':
+        if mac_script_bridge:
+            return OsascriptBridge(timeout=timeout)
+        return AppleScriptMailBackend(timeout=timeout)
+    return UnsupportedMailBackend()
+
+
+def get_mail_backend():
+    """Return the shared mail backend, creating the platform default on first use."""
+    global _mail_backend
+    with _mail_backend_lock:
+        if _mail_backend is None:
+            _mail_backend = create_mail_backend()
+        return _mail_backend
+
+
+def set_mail_backend(backend):
+    """Replace the shared mail backend (e.g. with one built from the config, or a fake)."""
+    global _mail_backend
+    with _mail_backend_lock:
+        previous, _mail_backend = _mail_backend, backend
+    if previous is not None and previous is not backend:
+        previous.close()
+
+
+def open_outlook(file_path):
+    """Open Outlook with file attached - platform-specific."""
+    return get_mail_backend().open_draft([file_path])
@@ -0,0 +1,156 @@
+"""Counters, latency histograms and startup timings."""
+
+import os
+import time
+import json
+import bisect
+import logging
+import threading
+from datetime import datetime
+
+from . import _MODULE_START
+from .settings import STATS_FILE, STATS_PROMETHEUS_FILE
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Thread-safe counters and per-stage latency histograms, written to STATS_FILE and STATS_PROMETHEUS_FILE."""
+    
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+               1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+    
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.started = time.time()
+        self._counts = {}
+        self._histograms = {}  # name -> [bucket counts (last one is +Inf), sum, count, max]
+        self._gauges = {}  # prefix -> callable returning a dict of numbers
+        self._lock = threading.Lock()
+    
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+    
+    def observe(self, name, seconds):
+        """Record one duration (in seconds) of a stage."""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            if seconds > histogram[3]:
+                histogram[3] = seconds
+    
+    def register_gauges(self, prefix, source):
+        """Include the numeric values of source() (e.g. scheduler.stats) in every snapshot."""
+        self._gauges[prefix] = source
+    
+    def counts(self):
+        with self._lock:
+            return dict(self._counts)
+    
+    def snapshot(self):
+        """Counters, stage summaries (milliseconds) and gauges as a JSON-serializable dict."""
+        with self._lock:
+            counts = dict(self._counts)
+            histograms = {name: (list(h[0]), h[1], h[2], h[3]) for name, h in self._histograms.items()}
+        stages = {}
+        for name, (buckets, total, count, maximum) in sorted(histograms.items()):
+            stages[name] = {
+                'count': count,
+                'mean_ms': round(total / count * 1000, 2) if count else None,
+                'p50_ms': self._percentile_ms(buckets, count, maximum, 0.50),
+                'p95_ms': self._percentile_ms(buckets, count, maximum, 0.95),
+                'p99_ms': self._percentile_ms(buckets, count, maximum, 0.99),
+                'max_ms': round(maximum * 1000, 2),
+            }
+        return {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'uptime_seconds': round(time.time() - self.started),
+            'counters': counts,
+            'stages': stages,
+            'gauges': self._read_gauges(),
+        }
+    
+    def to_prometheus(self, namespace='outlook_auto_attach'):
+        """Prometheus text exposition format (counters, histograms and gauges)."""
+        with self._lock:
+            counts = dict(self._counts)
+            histograms = {name: (list(h[0]), h[1], h[2]) for name, h in self._histograms.items()}
+        lines = [f'# TYPE {namespace}_events_total counter']
+        for name, value in sorted(counts.items()):
+            lines.append(f'{namespace}_events_total{{event="{name}"}} {value}')
+        lines.append(f'# TYPE {namespace}_stage_seconds histogram')
+        for name, (buckets, total, count) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), buckets):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{namespace}_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{namespace}_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{namespace}_stage_seconds_count{{stage="{name}"}} {count}')
+        lines.append(f'# TYPE {namespace}_gauge gauge')
+        for name, value in sorted(self._read_gauges().items()):
+            lines.append(f'{namespace}_gauge{{name="{name}"}} {value}')
+        lines.append(f'# TYPE {namespace}_uptime_seconds gauge')
+        lines.append(f'{namespace}_uptime_seconds {time.time() - self.started:.0f}')
+        return '\n'.join(lines) + '\n'
+    
+    def write(self, json_path=STATS_FILE, prometheus_path=STATS_PROMETHEUS_FILE):
+        """Write both stats files (atomically, so a reader never sees a partial file)."""
+        for path, text in ((json_path, json.dumps(self.snapshot(), indent=2)),
+                           (prometheus_path, self.to_prometheus())):
+            temp_path = path + '.tmp'
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(temp_path, path)
+            except OSError as e:
+                logger.warning("Could not write stats file %s: %s", path, e)
+    
+    def _read_gauges(self):
+        gauges = {}
+        for prefix, source in list(self._gauges.items()):
+            try:
+                values = source()
+            except Exception as e:
+                logger.debug("Could not read %s stats: %s", prefix, e)
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[f'{prefix}_{key}'] = value
+        return gauges
+    
+    def _percentile_ms(self, buckets, count, maximum, quantile):
+        if not count:
+            return None
+        target = quantile * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, buckets):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return round(min(bound, maximum) * 1000, 2)
+        return round(maximum * 1000, 2)
+
+
+class StartupTimer:
+    """Milliseconds from module import to the startup milestones (watcher ready, tray ready, ...)."""
+    
+    def __init__(self, start=_MODULE_START):
+        self.start = start
+        self._marks = {}
+        self._lock = threading.Lock()
+    
+    def mark(self, name):
+        elapsed = round((time.perf_counter() - self.start) * 1000, 1)
+        with self._lock:
+            self._marks[name] = elapsed
+        logger.info("Startup: %s after %.0f ms", name, elapsed)
+    
+    def as_dict(self):
+        with self._lock:
+            return dict(self._marks)
@@ -0,0 +1,174 @@
+"""File system observers and the supervisor that keeps them running."""
+
+import time
+import logging
+import threading
+from functools import partial
+
+from watchdog.observers.api import BaseObserver
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingEmitter
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptivePollingEmitter(PollingEmitter):
+    """Polling emitter that slows down from fast_interval to slow_interval while the folder is idle."""
+    
+    def __init__(self, event_queue, watch, *, timeout=1.0, event_filter=None,
+                 fast_interval=1.0, slow_interval=10.0, idle_after=30.0):
+        super().__init__(event_queue, watch, timeout=timeout, event_filter=event_filter)
+        self.fast_interval = fast_interval
+        self.slow_interval = max(fast_interval, slow_interval)
+        self.idle_after = idle_after
+        self._last_activity = time.monotonic()
+    
+    @property
+    def timeout(self):
+        """Seconds until the next scan (read by the emitter loop before each scan)."""
+        idle = time.monotonic() - self._last_activity
+        if idle < self.idle_after:
+            return self.fast_interval
+        return min(self.slow_interval, self.fast_interval * 2 ** ((idle - self.idle_after) / self.idle_after + 1))
+    
+    def queue_event(self, event):
+        self._last_activity = time.monotonic()
+        super().queue_event(event)
+
+
+class AdaptivePollingObserver(BaseObserver):
+    """PollingObserver using AdaptivePollingEmitter - for folders where native events are unreliable."""
+    
+    def __init__(self, fast_interval=1.0, slow_interval=10.0, idle_after=30.0):
+        emitter_class = partial(AdaptivePollingEmitter, fast_interval=fast_interval,
+                                slow_interval=slow_interval, idle_after=idle_after)
+        super().__init__(emitter_class, timeout=fast_interval)
+
+
+def create_observer(polling=False, fast_interval=1.0, slow_interval=10.0):
+    """Native observer for this platform (inotify/FSEvents/ReadDirectoryChangesW), or the adaptive poller."""
+    if polling:
+        return AdaptivePollingObserver(fast_interval=fast_interval, slow_interval=slow_interval)
+    return Observer()
+
+
+class ObserverSupervisor:
+    """Keeps the file system watcher running, restarting it (or falling back to polling) when it dies."""
+    
+    def __init__(self, watches, observer_factory=None, on_restart=None, mode='auto',
+                 backoff_initial=1.0, backoff_max=60.0, max_failures=3, failure_window=600.0):
+        self.watches = list(watches)
+        self.observer_factory = observer_factory or create_observer
+        self.on_restart = on_restart
+        self.mode = mode
+        self.polling = mode == 'polling'
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.max_failures = max_failures
+        self.failure_window = failure_window
+        self.observer = None
+        self.restarts = 0
+        self._failures = []  # time.monotonic() of recent failures
+        self._backoff = backoff_initial
+        self._next_attempt = 0.0
+        self._started_at = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """Start watching. A failure here is retried by check(), like a later crash."""
+        with self._lock:
+            self._start_observer(time.monotonic())
+        return self
+    
+    def check(self):
+        """Restart the observer if it is not running (and its backoff has passed). Returns True if it is healthy."""
+        with self._lock:
+            if self._stopped.is_set():
+                return False
+            now = time.monotonic()
+            if self.observer is not None:
+                if self._healthy(self.observer):
+                    if now - self._started_at > self.backoff_max:
+                        self._backoff = self.backoff_initial  # Stable again
+                    return True
+                logger.error("Observer stopped unexpectedly!")
+                self._discard(self.observer)
+                self.observer = None
+                self._failed(now)
+            if now < self._next_attempt:
+                return False
+            
+            if not self._start_observer(now):
+                return False
+            self.restarts += 1
+            logger.info("Observer restarted (%s, restart %s)", 'polling' if self.polling else 'native', self.restarts)
+        if self.on_restart is not None:
+            try:
+                self.on_restart()
+            except Exception as e:
+                logger.error("Error after observer restart: %s", e, exc_info=True)
+        return True
+    
+    def request_stop(self):
+        """Ask the main loop to quit; safe in a signal handler (no locks, the loop calls stop())."""
+        self._stopped.set()
+    
+    def stop(self):
+        """Stop watching for good (quit)."""
+        self._stopped.set()
+        with self._lock:
+            if self.observer is not None:
+                self.observer.stop()
+                self.observer.join(timeout=5.0)
+    
+    def stopped(self):
+        return self._stopped.is_set()
+    
+    def stats(self):
+        with self._lock:
+            return {'running': int(self.observer is not None and self._healthy(self.observer)),
+                    'polling': int(self.polling), 'restarts': self.restarts}
+    
+    def _start_observer(self, now):
+        observer = None
+        try:
+            observer = self.observer_factory(self.polling)
+            for handler, path, recursive in self.watches:
+                observer.schedule(handler, path, recursive=recursive)
+            observer.start()
+        except Exception as e:
+            logger.error("Could not start %s observer: %s", 'polling' if self.polling else 'native', e)
+            if observer is not None:
+                self._discard(observer)
+            self._failed(now)
+            return False
+        self.observer = observer
+        self._started_at = now
+        return True
+    
+    def _failed(self, now):
+        """Schedule the next attempt with backoff; switch to polling if the native observer keeps failing."""
+        self._failures = [t for t in self._failures if now - t < self.failure_window] + [now]
+        if self.mode == 'auto' and not self.polling and len(self._failures) >= self.max_failures:
+            logger.warning("Native file system events failed %s times in %.0fs, switching to polling",
+                           len(self._failures), self.failure_window)
+            self.polling = True
+            self._failures = []
+            self._backoff = self.backoff_initial
+        self._next_attempt = now + self._backoff
+        self._backoff = min(self._backoff * 2, self.backoff_max)
+    
+    @staticmethod
+    def _healthy(observer):
+        # An emitter stops on its own when its folder disappears, leaving the observer thread running
+        return observer.is_alive() and all(emitter.is_alive() for emitter in observer.emitters)
+    
+    @staticmethod
+    def _discard(observer):
+        try:
+            observer.stop()
+            if observer.is_alive():
+                observer.join(timeout=1.0)
+        except Exception as e:
+            logger.debug("Error stopping observer: %s", e)
@@ -0,0 +1,417 @@
+"""Order numbers from filenames and PDF text, and the recipients they map to."""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import contextvars
+import re
+import zlib
+import csv
+import io
+import threading
+import concurrent.futures
+from functools import partial
+
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+# PDF content streams: the dictionary in front of "stream" tells whether it is deflated
+_PDF_STREAM = re.compile(rb'<<((?:[^<>]|<<(?:[^<>]|<<[^<>]*>>)*>>|<[^<>]*>)*)>>\s*stream\r?\n')
+_PDF_TEXT_OPERATOR = re.compile(rb'\((?:\\.|[^\\)])*\)\s*(?:Tj|\'|")|\[(?:[^\]\\]|\\.)*\]\s*TJ|T\*|Td|TD|ET', re.S)
+_PDF_STRING = re.compile(rb'\(((?:\\.|[^\\)])*)\)', re.S)
+_PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+
+def _pdf_literal(raw):
+    """Decode the escapes of a PDF literal string (without the parentheses)."""
+    def unescape(match):
+        escaped = match.group(1)
+        if escaped[:1].isdigit():
+            return bytes([int(escaped, 8) & 0xFF])
+        return _PDF_ESCAPES.get(escaped, escaped if escaped not in (b'\n', b'\r') else b'')
+    return re.sub(rb'\\([0-7]{1,3}|.)', unescape, raw, flags=re.S)
+
+
+def pdf_text_layer(data, max_pages=2, max_output=1024 * 1024, deadline=None):
+    """Literal text shown by Tj/TJ/'/" in the first max_pages content streams of a PDF (not a full parser)."""
+    pages = []
+    position = 0
+    while len(pages) < max_pages:
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        match = _PDF_STREAM.search(data, position)
+        if match is None:
+            break
+        start = match.end()
+        end = data.find(b'endstream', start)
+        if end < 0:
+            end = len(data)
+        position = end
+        dictionary = match.group(1)
+        content = data[start:end]
+        if b'/FlateDecode' in dictionary:
+            try:
+                # Bounded, so a deflate bomb cannot blow up memory
+                content = zlib.decompressobj().decompress(content, max_output)
+            except zlib.error:
+                continue
+        elif b'/Filter' in dictionary:
+            continue  # Images (DCT, JBIG2, ...) and filters not worth supporting
+        if b'BT' not in content:
+            continue
+        parts = []
+        for operator in _PDF_TEXT_OPERATOR.finditer(content):
+            token = operator.group(0)
+            if token in (b'T*', b'Td', b'TD', b'ET'):
+                parts.append(b' ')
+                continue
+            parts.extend(_pdf_literal(string) for string in _PDF_STRING.findall(token))
+        pages.append(b''.join(parts).decode('latin-1'))
+    return "\n".join(pages)
+
+
+def match_order_fields(text, patterns):
+    """First 'order' and 'customer' named groups found by the regex patterns in text."""
+    fields = {}
+    for pattern in patterns:
+        for match in re.finditer(pattern, text):
+            for name, value in match.groupdict().items():
+                if value and name in ('order', 'customer'):
+                    fields.setdefault(name, value.strip())
+            if len(fields) == 2:
+                return fields
+    return fields
+
+
+def extract_order_fields(path, patterns, max_pages=2, max_bytes=4 * 1024 * 1024, budget=2.0):
+    """Order and customer number from the text of the first pages of a PDF (runs in a worker process)."""
+    start = time.monotonic()
+    with open(path, 'rb') as f:
+        data = f.read(max_bytes)
+    text = pdf_text_layer(data, max_pages=max_pages, deadline=start + budget)
+    fields = match_order_fields(text, patterns)
+    fields['pages_chars'] = len(text)
+    fields['seconds'] = time.monotonic() - start
+    return fields
+
+
+class OrderExtractor:
+    """Order and customer number from the filename or the PDF text, delivered to a callback within `budget` seconds."""
+    
+    def __init__(self, patterns, scheduler=None, budget=2.0, max_pages=2, max_bytes=4 * 1024 * 1024,
+                 pdf_text=True, workers=1, max_in_flight=4, metrics=None):
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        self.scheduler = scheduler
+        self.budget = budget
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.pdf_text = pdf_text
+        self.workers = max(1, int(workers))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0  # PDFs being read by the pool (until the worker returns, even after a timeout)
+        self._undelivered = {}  # ticket -> delivery still owed to the caller
+    
+    def extract(self, path, filename, on_done):
+        """Call on_done(fields) with the 'order' and/or 'customer' found (an empty dict if none)."""
+        start = time.perf_counter()
+        fields = match_order_fields(filename or os.path.basename(path), self.patterns)
+        if len(fields) == 2 or not self.pdf_text or not path.lower().endswith('.pdf'):
+            self._found(start, fields, 'filename' if fields else None)
+            on_done(fields)
+            return
+        
+        with self._lock:
+            busy = self._in_flight >= self.max_in_flight
+            if not busy:
+                self._in_flight += 1
+                if self._executor is None:
+                    # Started on the first PDF that needs it
+                    self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        if busy:
+            logger.warning("Already reading %s PDFs, drafting without the text of %s",
+                           self.max_in_flight, os.path.basename(path))
+            self.metrics.increment('extract_busy')
+            self._found(start, fields, 'filename' if fields else None)
+            on_done(fields)
+            return
+        
+        ticket = object()
+        deliver = partial(self._deliver, ticket, contextvars.copy_context(), start, fields, on_done, path)
+        with self._lock:
+            self._undelivered[ticket] = deliver
+        try:
+            future = self._executor.submit(extract_order_fields, path,
+                                           [pattern.pattern for pattern in self.patterns],
+                                           max_pages=self.max_pages, max_bytes=self.max_bytes, budget=self.budget)
+        except RuntimeError as e:
+            # Shutting down, or a worker process died
+            future = concurrent.futures.Future()
+            future.set_exception(e)
+        future.add_done_callback(partial(self._completed, deliver, path))
+        if self.scheduler is not None:
+            # Draft without the text if the worker has not answered within the budget
+            self.scheduler.submit(deliver, None, delay=self.budget, block=False, background=True)
+    
+    def _completed(self, deliver, path, future):
+        """Pool callback thread: free the slot and hand the result to the scheduler."""
+        with self._lock:
+            self._in_flight -= 1
+        try:
+            found = future.result()
+        except Exception as e:
+            logger.warning("Could not read the PDF text of %s: %s", os.path.basename(path), e)
+            self.metrics.increment('extract_failed')
+            found = {}
+        else:
+            self.metrics.observe('extract_pdf', found.pop('seconds'))
+            found.pop('pages_chars', None)
+        if self.scheduler is None or not self.scheduler.submit(deliver, found, block=False):
+            deliver(found)
+    
+    def _deliver(self, ticket, context, start, fields, on_done, path, found):
+        """Call on_done once: with the PDF fields, or without them (found=None) when the budget ran out."""
+        with self._lock:
+            if self._undelivered.pop(ticket, None) is None:
+                return
+        source = 'filename' if fields else None
+        if found is None:
+            logger.warning("Reading the order number from %s took longer than %.1f s, drafting without it",
+                           os.path.basename(path), self.budget)
+            self.metrics.increment('extract_timeout')
+        elif found:
+            # The filename wins where both have a value
+            fields = dict(found, **fields)
+            source = 'text' if source is None else 'both'
+        try:
+            self._found(start, fields, source)
+            context.run(on_done, fields)
+        finally:
+            with self._lock:
+                self._idle.notify_all()
+    
+    def _found(self, start, fields, source):
+        self.metrics.observe('extract', time.perf_counter() - start)
+        self.metrics.increment(f"extract_{source or 'none'}")
+        if fields:
+            logger.info("Found %s in %s", ', '.join(f"{name} {value}" for name, value in sorted(fields.items())),
+                        source)
+    
+    def wait(self, timeout=None):
+        """Wait until every callback has been delivered. Returns False on timeout."""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._undelivered, timeout)
+    
+    def close(self):
+        """Deliver what is in progress (without the text once the budget is up) and stop the worker."""
+        if not self.wait(self.budget):
+            # No scheduler left to run the budget timers
+            with self._lock:
+                late = list(self._undelivered.values())
+            for deliver in late:
+                deliver(None)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RecipientIndex:
+    """Customer number -> recipient, loaded from a CSV or SQLite export and refreshed when it changes."""
+    
+    COLUMNS = ('customer', 'email', 'subject', 'name')
+    
+    def __init__(self, source, metrics=None):
+        self.source = source
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._entries = {}
+        self._signature = None  # (mtime, size) of the source (and its SQLite -wal file) when last read
+        self._offset = 0  # CSV: bytes read so far (complete lines)
+        self._digest = None  # CSV: hash of those bytes, to recognise an append
+        self._fields = None  # CSV: column names from the header
+        self._delimiter = ','
+        self._lock = threading.Lock()
+        self._scheduler = None
+        self._interval = 0.0
+        self.reloads = 0
+        self.incremental_updates = 0
+    
+    @staticmethod
+    def _key(customer):
+        return str(customer).strip().casefold()
+    
+    def lookup(self, customer):
+        """The recipient of a customer number: {'email', 'subject', 'name'} or None."""
+        if customer is None:
+            return None
+        return self._entries.get(self._key(customer))
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def refresh(self):
+        """Re-read the source if it changed. Returns 'unchanged', 'incremental', 'reloaded' or 'missing'."""
+        with self._lock:
+            try:
+                stat = os.stat(self.source)
+            except OSError:
+                return 'missing'
+            signature = (stat.st_mtime_ns, stat.st_size)
+            sqlite = self.source.lower().endswith(('.sqlite', '.sqlite3', '.db'))
+            if sqlite:
+                # In WAL mode, commits land in the -wal file and the database file itself is left alone
+                try:
+                    wal = os.stat(self.source + '-wal')
+                    signature += (wal.st_mtime_ns, wal.st_size)
+                except OSError:
+                    pass
+            if signature == self._signature:
+                return 'unchanged'
+            start = time.perf_counter()
+            if sqlite:
+                result = self._refresh_sqlite()
+            else:
+                result = self._refresh_csv(stat.st_size)
+            self._signature = signature
+            if result == 'reloaded':
+                self.reloads += 1
+            else:
+                self.incremental_updates += 1
+            self.metrics.observe('recipients_refresh', time.perf_counter() - start)
+            logger.info("Recipient index %s (%s entries) from %s", result, len(self._entries), self.source)
+            return result
+    
+    def _add(self, entries, row):
+        customer = (row.get('customer') or '').strip()
+        email = (row.get('email') or '').strip()
+        if customer and email:
+            entries[self._key(customer)] = {'email': email, 'subject': (row.get('subject') or '').strip() or None,
+                                            'name': (row.get('name') or '').strip() or None}
+    
+    def _parse_csv_lines(self, data, entries):
+        reader = csv.DictReader(io.StringIO(data.decode('utf-8-sig', errors='replace')),
+                                fieldnames=self._fields, delimiter=self._delimiter)
+        for row in reader:
+            self._add(entries, row)
+    
+    def _refresh_csv(self, size):
+        with open(self.source, 'rb') as f:
+            if self._digest is not None and size >= self._offset:
+                # Hashing what was read before is much cheaper than parsing it again
+                prefix = hashlib.blake2b()
+                remaining = self._offset
+                while remaining:
+                    chunk = f.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    prefix.update(chunk)
+                    remaining -= len(chunk)
+                if not remaining and prefix.digest() == self._digest.digest():
+                    # Rows were appended - parse only those (up to the last complete line)
+                    appended = f.read()
+                    complete = appended[:appended.rfind(b'\n') + 1]
+                    self._parse_csv_lines(complete, self._entries)
+                    self._digest.update(complete)
+                    self._offset += len(complete)
+                    return 'incremental'
+            f.seek(0)
+            data = f.read()
+        header_end = data.find(b'\n') + 1 or len(data)
+        header = data[:header_end].decode('utf-8-sig', errors='replace')
+        self._delimiter = max(',;\t', key=header.count)
+        self._fields = [column.strip().lower() for column in next(csv.reader([header], delimiter=self._delimiter))]
+        complete = data[:data.rfind(b'\n') + 1]
+        entries = {}
+        self._parse_csv_lines(complete[header_end:], entries)
+        self._entries = entries  # Swapped in one step - lookups never see a half-loaded index
+        self._digest = hashlib.blake2b(complete)
+        self._offset = len(complete)
+        return 'reloaded'
+    
+    def _refresh_sqlite(self):
+        # An `updated` column cannot tell which customers were deleted - the index is rebuilt instead
+        conn = sqlite3.connect(f"file:{self.source}?mode=ro", uri=True)
+        try:
+            columns = {row[1].lower() for row in conn.execute("PRAGMA table_info(recipients)")}
+            selected = ', '.join(column if column in columns else f"NULL AS {column}" for column in self.COLUMNS)
+            entries = {}
+            for row in conn.execute(f"SELECT {selected} FROM recipients"):
+                self._add(entries, dict(zip(self.COLUMNS, row)))
+        finally:
+            conn.close()
+        self._entries = entries
+        return 'reloaded'
+    
+    def watch(self, scheduler, interval=60.0):
+        """Load the index on the scheduler, then check the source for changes every `interval` seconds."""
+        self._scheduler = scheduler
+        self._interval = interval
+        scheduler.submit(self._refresh_periodically, block=False, background=True)
+    
+    def _refresh_periodically(self):
+        try:
+            self.refresh()
+        except (OSError, sqlite3.Error, csv.Error, UnicodeError) as e:
+            logger.error("Could not read the recipient list %s: %s", self.source, e)
+        if self._interval > 0:
+            self._scheduler.submit(self._refresh_periodically, delay=self._interval, block=False, background=True,
+                                   reschedule=True)
+    
+    def stats(self):
+        return {'entries': len(self._entries), 'reloads': self.reloads,
+                'incremental_updates': self.incremental_updates}
+
+
+class _TemplateFields(dict):
+    """str.format_map() fields where unknown names are left empty."""
+    
+    def __missing__(self, key):
+        return ''
+
+
+def draft_prefill(document_type, fields, recipients=None, subject_template="{document_type} {order}"):
+    """Recipient and subject of the draft for a document with the extracted fields ({} without any)."""
+    if not fields:
+        return {}
+    start = time.perf_counter()
+    recipient = recipients.lookup(fields.get('customer')) if recipients is not None else None
+    if recipients is not None:
+        recipients.metrics.observe('recipient_lookup', time.perf_counter() - start)
+        recipients.metrics.increment('recipient_found' if recipient else 'recipient_unknown')
+    values = _TemplateFields(fields, document_type=document_type or '')
+    prefill = {}
+    if recipient is not None:
+        prefill['to'] = recipient['email']
+        values['name'] = recipient['name'] or ''
+    template = (recipient or {}).get('subject') or subject_template
+    subject = ' '.join(template.format_map(values).split())
+    if subject and (fields.get('order') or recipient is not None):
+        prefill['subject'] = subject
+    return prefill
+
+
+def create_draft_prefill(config, scheduler=None, metrics=None):
+    """(OrderExtractor, RecipientIndex) from the config; either is None if it is not configured."""
+    if not config['prefill_drafts']:
+        return None, None
+    extractor = OrderExtractor(
+        config['prefill_patterns'],
+        scheduler=scheduler,
+        budget=config['prefill_time_budget'],
+        max_pages=config['prefill_pdf_pages'],
+        max_bytes=config['prefill_pdf_max_bytes'],
+        pdf_text=config['prefill_pdf_text'],
+        max_in_flight=config['prefill_max_in_flight'],
+        metrics=metrics
+    )
+    recipients = None
+    if config['recipients_file']:
+        recipients = RecipientIndex(os.path.expanduser(config['recipients_file']), metrics=metrics)
+    return extractor, recipients
@@ -0,0 +1,194 @@
+"""Filename rules: which downloads are processed and how their archive copies are named."""
+
+import os
+import logging
+import re
+import fnmatch
+import unicodedata
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_OUTPUT_TEMPLATE = "{rule}-{timestamp}-{microseconds}{ext}"
+
+
+# Which downloads are processed and how their archive copies are named.
+# Checked in order - the first matching rule wins. Patterns are case-insensitive substrings,
+# globs (case-insensitive) match the whole filename; both are matched against the NFC-normalized name.
+# Optional keys: 'extensions', 'min_size'/'max_size' (bytes) and 'magic' - accepted file signatures,
+# e.g. ["%PDF-"], checked against the first bytes of the file to reject mislabeled downloads.
+DEFAULT_RULES = [
+    {
+        'name': 'Inköpsorder',
+        'patterns': ['inköpsorder', 'inkopsorder'],
+        'output_template': DEFAULT_OUTPUT_TEMPLATE,
+    },
+    {
+        'name': 'Orderbekräftelse',
+        # 'orderbekr' also catches truncated names
+        'patterns': ['orderbekräftelse', 'orderbekr'],
+        'output_template': DEFAULT_OUTPUT_TEMPLATE,
+    },
+]
+
+
+class FilenameRule:
+    """One entry of the filename rule engine (see DEFAULT_RULES)."""
+    
+    def __init__(self, name, patterns=(), globs=(), extensions=(), min_size=None, max_size=None,
+                 output_template=DEFAULT_OUTPUT_TEMPLATE, magic=()):
+        if not patterns and not globs:
+            raise ValueError(f"Rule {name!r} needs at least one pattern or glob")
+        self.name = name
+        self.patterns = [unicodedata.normalize('NFC', p) for p in patterns]
+        self.globs = [unicodedata.normalize('NFC', g) for g in globs]
+        self.extensions = {e.lower() if e.startswith('.') else '.' + e.lower() for e in extensions}
+        self.min_size = min_size
+        self.max_size = max_size
+        self.output_template = output_template
+        self.magic = tuple(m.encode('latin-1') if isinstance(m, str) else bytes(m) for m in magic)
+        self._sniff_bytes = max((len(m) for m in self.magic), default=0)
+    
+    @classmethod
+    def from_config(cls, entry):
+        return cls(
+            entry['name'],
+            patterns=entry.get('patterns', ()),
+            globs=entry.get('globs', ()),
+            extensions=entry.get('extensions', ()),
+            min_size=entry.get('min_size'),
+            max_size=entry.get('max_size'),
+            output_template=entry.get('output_template', DEFAULT_OUTPUT_TEMPLATE),
+            magic=entry.get('magic', ())
+        )
+    
+    def accepts(self, extension, size=None):
+        """Check the extension and (when known) the size limits."""
+        if self.extensions and extension not in self.extensions:
+            return False
+        if size is not None:
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        return True
+    
+    def matches_content(self, file_path):
+        """Check the file signature against 'magic' by reading only the first few bytes."""
+        if not self.magic:
+            return True
+        try:
+            with open(file_path, 'rb') as f:
+                head = f.read(self._sniff_bytes)
+        except OSError:
+            return False
+        return head.startswith(self.magic)
+    
+    def format_name(self, original_name, now=None):
+        """Archive file name for a file matched by this rule."""
+        return format_archive_name(self.output_template, self.name, original_name, now)
+
+
+def format_archive_name(template, rule_name, original_name, now=None):
+    """Fill in an output naming template: {rule}, {stem}, {ext}, {date}, {timestamp}, {microseconds}."""
+    now = now or datetime.now()
+    stem, ext = os.path.splitext(original_name)
+    return template.format(
+        rule=rule_name,
+        stem=stem,
+        ext=ext,
+        date=now.strftime("%Y%m%d"),
+        timestamp=now.strftime("%Y%m%d-%H%M%S"),
+        microseconds=now.strftime("%f")
+    )
+
+
+class RuleEngine:
+    """Classifies filenames against FilenameRules, compiled once into a flat list of checks in priority order."""
+    
+    def __init__(self, rules):
+        self.rules = list(rules)
+        if not self.rules:
+            raise ValueError("At least one filename rule is required")
+        checks = []  # (case-folded substring or None, glob regex or None, rule index)
+        for index, rule in enumerate(self.rules):
+            literals = []
+            for pattern in sorted({p.casefold() for p in rule.patterns}, key=len):
+                if not any(shorter in pattern for shorter in literals):
+                    literals.append(pattern)
+            checks.extend((literal, None, index) for literal in literals)
+            if rule.globs:
+                glob_matcher = re.compile('|'.join(fnmatch.translate(g.casefold()) for g in rule.globs))
+                checks.append((None, glob_matcher, index))
+        self._checks = tuple(checks)
+    
+    @classmethod
+    def from_config(cls, entries):
+        return cls(FilenameRule.from_config(entry) for entry in entries)
+    
+    def classify(self, filename, size=None):
+        """Return the first rule matching the filename (and size, if given), or None."""
+        if not filename:
+            return None
+        if not filename.isascii():
+            # Returns the same string without copying if it is already NFC
+            filename = unicodedata.normalize('NFC', filename)
+        folded = filename.casefold()
+        
+        rejected = None
+        for literal, glob_matcher, index in self._checks:
+            if literal is not None:
+                if literal not in folded:
+                    continue
+            elif glob_matcher.match(folded) is None:
+                continue
+            if rejected is not None and index in rejected:
+                continue
+            rule = self.rules[index]
+            if rule.accepts(os.path.splitext(folded)[1], size):
+                return rule
+            # Name matched but extension or size did not - try lower-priority rules
+            rejected = rejected or set()
+            rejected.add(index)
+        return None
+
+
+_rule_engine = RuleEngine(FilenameRule.from_config(entry) for entry in DEFAULT_RULES)
+
+
+def get_rule_engine():
+    """Return the active filename rule engine."""
+    return _rule_engine
+
+
+def set_rule_engine(engine):
+    """Replace the active filename rule engine (e.g. with rules from the config file)."""
+    global _rule_engine
+    _rule_engine = engine
+
+
+def load_rule_engine(rules_config):
+    """Build the rule engine from the 'rules' config entry, falling back to DEFAULT_RULES if it is invalid."""
+    if rules_config:
+        try:
+            return RuleEngine.from_config(rules_config)
+        except (KeyError, TypeError, ValueError, re.error) as e:
+            logger.error("Invalid filename rules in config, using defaults: %s", e)
+    return RuleEngine.from_config(DEFAULT_RULES)
+
+
+def should_process_file(filename):
+    """Check if filename matches criteria for processing."""
+    return get_rule_engine().classify(filename) is not None
+
+
+def is_temporary_file(filename):
+    """Hidden files and browser partial downloads (renamed to their final name when complete)."""
+    return filename.startswith('.') or filename.endswith('.tmp') or filename.endswith('.crdownload')
+
+
+def get_document_type(filename):
+    """Document type (matching rule name) of a file, used to group drafts. None if no rule matches."""
+    rule = get_rule_engine().classify(filename)
+    return rule.name if rule is not None else None
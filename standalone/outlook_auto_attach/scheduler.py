@@ -0,0 +1,167 @@
+"""Worker pool with a delay queue, shared by the pipeline stages."""
+
+import time
+import heapq
+import logging
+import contextvars
+import itertools
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WorkScheduler:
+    """Delay queue (timer heap) feeding a fixed-size pool of worker threads, with a bounded queue."""
+    
+    def __init__(self, workers=2, max_pending=500, name="Worker"):
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.name = name
+        self._heap = []  # (due_time, sequence, context, func, args, background)
+        self._background = 0  # Queued background jobs
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        self._accepting = False
+        self._active = 0
+        # Counters for measuring throughput under bursts
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.peak_pending = 0
+        self.peak_active = 0
+    
+    def start(self):
+        """Start the worker threads."""
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+            self._accepting = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{i + 1}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+        return self
+    
+    def submit(self, func, *args, delay=0.0, block=True, timeout=5.0, background=False, reschedule=False):
+        """Schedule func(*args) on a worker after `delay` seconds; False if shutting down or the queue stayed full."""
+        due_time = time.monotonic() + max(0.0, delay)
+        # The job runs in a copy of the submitter's context (keeps the log correlation id)
+        context = contextvars.copy_context()
+        # Jobs rescheduling themselves from a worker are allowed while draining
+        from_worker = threading.current_thread() in self._threads
+        with self._cond:
+            deadline = time.monotonic() + timeout if block and timeout is not None else None
+            while True:
+                if not self._running or not (self._accepting or from_worker):
+                    self.rejected += 1
+                    return False
+                if len(self._heap) < self.max_pending or (reschedule and from_worker):
+                    break
+                if not block or from_worker:
+                    self.rejected += 1
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.rejected += 1
+                    return False
+                self._cond.wait(remaining)
+            
+            heapq.heappush(self._heap, (due_time, next(self._sequence), context, func, args, background))
+            self._background += background
+            self.submitted += 1
+            self.peak_pending = max(self.peak_pending, len(self._heap))
+            self._cond.notify_all()
+        return True
+    
+    def pending(self):
+        """Number of jobs waiting in the queue (not counting running jobs)."""
+        with self._cond:
+            return len(self._heap)
+    
+    def busy(self):
+        """True while a job is running or due to run (delayed jobs not yet due don't count)."""
+        with self._cond:
+            return self._active > 0 or bool(self._heap and self._heap[0][0] <= time.monotonic())
+    
+    def stats(self):
+        """Snapshot of queue and throughput counters."""
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': len(self._heap),
+                'active': self._active,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'peak_pending': self.peak_pending,
+                'peak_active': self.peak_active,
+            }
+    
+    def shutdown(self, drain=True, timeout=10.0):
+        """Stop the workers; with drain=True queued and running jobs get up to `timeout` seconds first."""
+        with self._cond:
+            if not self._running:
+                return
+            self._accepting = False
+            self._cond.notify_all()
+            if drain:
+                deadline = time.monotonic() + timeout
+                while len(self._heap) > self._background or self._active:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            if len(self._heap) > self._background:
+                logger.warning("Dropping %s queued job(s) on shutdown", len(self._heap) - self._background)
+            self._heap.clear()
+            self._background = 0
+            self._running = False
+            self._cond.notify_all()
+        
+        current = threading.current_thread()
+        for thread in self._threads:
+            if thread is not current:
+                thread.join(timeout=1.0)
+        self._threads = []
+    
+    def _worker(self):
+        """Worker loop: wait for the earliest job to become due and run it."""
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running:
+                        return
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    wait_time = self._heap[0][0] - time.monotonic()
+                    if wait_time <= 0:
+                        break
+                    self._cond.wait(wait_time)
+                
+                _, _, context, func, args, background = heapq.heappop(self._heap)
+                self._background -= background
+                self._active += 1
+                self.peak_active = max(self.peak_active, self._active)
+                # A queue slot was freed - wake up blocked submitters
+                self._cond.notify_all()
+            
+            failed = False
+            try:
+                context.run(func, *args)
+            except Exception as e:
+                failed = True
+                logger.error("Error in background job %s: %s", getattr(func, '__name__', func), e, exc_info=True)
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    self.completed += 1
+                    if failed:
+                        self.failed += 1
+                    self._cond.notify_all()
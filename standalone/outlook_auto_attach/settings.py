@@ -0,0 +1,123 @@
+"""Platform paths and settings (DEFAULT_CONFIG, overridden by the JSON config file)."""
+
+import os
+import json
+import logging
+import platform
+
+logger = logging.getLogger(__name__)
+
+
+SYSTEM = platform.system()
+
+# Log folder (also holds the config, journal and stats) - platform-specific paths
+if SYSTEM == 'Windows':
+    LOG_DIR = os.path.join(os.path.expanduser("~"), "AppData", "Local", "OutlookAutoAttach")
+else:  # macOS
+    LOG_DIR = os.path.join(os.path.expanduser("~"), "Library", "Logs", "OutlookAutoAttach")
+
+os.makedirs(LOG_DIR, exist_ok=True)
+LOG_FILE = os.path.join(LOG_DIR, "outlook-auto-attach.log")
+CONFIG_FILE = os.path.join(LOG_DIR, "config.json")
+JOURNAL_FILE = os.path.join(LOG_DIR, "dedup-journal.sqlite3")
+WATERMARK_FILE = os.path.join(LOG_DIR, "catch-up-watermark.json")
+STATS_FILE = os.path.join(LOG_DIR, "stats.json")
+STATS_PROMETHEUS_FILE = os.path.join(LOG_DIR, "stats.prom")
+
+
+# Defaults for settings that can be overridden in CONFIG_FILE
+DEFAULT_CONFIG = {
+    'workers': 2,  # Number of worker threads processing files
+    'queue_size': 500,  # Max files waiting to be processed before backpressure
+    'queue_block_timeout': 5.0,  # Seconds a watcher event may wait for a free queue slot
+    'completion_first_delay': 0.05,  # Seconds before the first download-complete check
+    'completion_max_delay': 2.0,  # Upper bound for the backoff between checks
+    'completion_deadline': 1800.0,  # Give up on a file that is still being written after this many seconds
+    'drain_timeout': 10.0,  # Seconds to let queued work finish when quitting
+    'processed_index_size': 10000,  # Max number of recently seen files remembered for duplicate detection
+    'processed_index_ttl': 86400.0,  # Seconds a seen file is remembered
+    'duplicate_policy': 'skip',  # Identical content already drafted: 'skip', 'reuse' (draft the archived copy) or 'allow'
+    'duplicate_window_days': 30,  # Identical content older than this is processed again
+    'journal_retention_days': 365,  # Journal entries older than this are pruned at startup
+    'archive_dir': None,  # Where processed files are moved (default: ~/Desktop/businessnxtdocs)
+    'archive_shard': 'month',  # Archive subfolders: 'month' (YYYY/MM), 'day' (YYYY/MM/DD) or 'flat'
+    'archive_retention_days': None,  # Delete archived files older than this (None = keep forever)
+    'archive_compact_after_months': None,  # Bundle each month older than this into one zip (None = never)
+    'archive_cleanup_interval': 3600.0,  # Seconds between archive cleanup passes
+    'archive_cleanup_rate': 20.0,  # Max files per second moved, bundled or deleted by the cleanup
+    'mail_timeout': 30.0,  # Seconds to wait for Outlook to open a draft
+    'mail_retry_base_delay': 5.0,  # Seconds before retrying a failed draft, doubling (with jitter) per attempt...
+    'mail_retry_max_delay': 600.0,  # ...up to this
+    'mail_breaker_threshold': 3,  # Consecutive failed drafts before calls to Outlook are paused...
+    'mail_breaker_reset': 30.0,  # ...for this many seconds, then one trial draft (doubling while it fails)
+    'mail_warm_up': True,  # Connect to (and if needed start) Outlook in the background at startup
+    'mail_probe_interval': 300.0,  # Seconds between cheap checks that Outlook is still reachable (0 = off)
+    'mac_script_bridge': True,  # macOS: keep one osascript helper running instead of one per draft
+    'coalesce_window': 1.0,  # Seconds to collect files of the same type into one draft (0 = one draft per file)
+    'coalesce_max_attachments': 10,  # Max files attached to one coalesced draft
+    'coalesce_max_bytes': 20 * 1024 * 1024,  # Max total attachment size of one coalesced draft
+    # Files over this size are zipped (or split) in worker processes before drafting (0 = off)
+    'large_attachment_max_bytes': 0,
+    'large_attachment_mode': 'zip',  # 'zip' (split the zip if still too large) or 'split'
+    'large_attachment_workers': 1,  # Worker processes for zipping/splitting
+    'large_attachment_compress_level': 6,  # Deflate level 1 (fast) .. 9 (small)
+    'large_attachment_retention_days': 7,  # Prepared zips/parts are deleted after this many days
+    'rules': None,  # Filename rules (list of objects, see DEFAULT_RULES); None uses the defaults
+    'catch_up': True,  # Queue matching files that arrived while the app was not running
+    'stats_interval': 60.0,  # Seconds between writes of stats.json / stats.prom to the log folder (0 = off)
+    'log_level': 'INFO',  # DEBUG, INFO, WARNING or ERROR
+    'log_format': 'text',  # 'text' or 'json' (one JSON object per line, with the correlation id of each download)
+    'log_max_bytes': 5 * 1024 * 1024,  # Rotate the log file at this size...
+    'log_rotate_when': None,  # ...or by time instead, e.g. 'midnight'
+    'log_backup_count': 5,  # Rotated log files to keep
+    # Folders to watch: paths or objects {"path", "recursive", "max_depth", "rules", "archive_dir"}
+    # ("downloads" = the Downloads folder); None watches the Downloads folder only
+    'watch_roots': None,
+    'watch_all_profiles': False,  # Windows: "downloads" means the Downloads folder of every user profile
+    'watch_mode': 'auto',  # 'native', 'polling', or 'auto' (native, switching to polling if it keeps failing)
+    'polling_fast_interval': 1.0,  # Polling: seconds between scans right after activity...
+    'polling_slow_interval': 10.0,  # ...growing up to this while the folders are idle
+    'observer_restart_max_delay': 60.0,  # Upper bound for the backoff between observer restarts
+    # Diagnostics tray menu (thread dump, memory snapshot, CPU profile; SIGUSR1/SIGUSR2 when headless).
+    # Also enabled by the environment variable OUTLOOK_AUTO_ATTACH_DIAGNOSTICS=1
+    'diagnostics': False,
+    'diagnostics_profile_seconds': 30.0,  # Length of a CPU profile
+    # Draft recipient and subject from the order/customer number in the filename or PDF text (opt-in:
+    # starts a PDF extraction process pool). Patterns are regular expressions with the named groups
+    # 'order' and/or 'customer'
+    'prefill_drafts': False,
+    'prefill_patterns': [
+        r'(?i)\border\w*[\s:#._-]*(?:nr|nummer|no|number)?[\s:#._-]*(?P<order>\d{4,})',
+        r'(?i)\b(?:kund|customer)\w*[\s:#._-]*(?:nr|nummer|no|number)?[\s:#._-]*(?P<customer>\d{3,})',
+    ],
+    'prefill_pdf_text': True,  # Also read the text layer of PDFs if the filename is not enough
+    'prefill_pdf_pages': 2,  # Text of the first pages only...
+    'prefill_pdf_max_bytes': 4 * 1024 * 1024,  # ...within the start of the file
+    'prefill_time_budget': 2.0,  # Seconds to wait for the PDF text before drafting without it
+    'prefill_max_in_flight': 4,  # PDFs read at the same time; more are drafted without their text
+    'prefill_subject_template': "{document_type} {order}",  # Fields: document_type, order, customer, name
+    # Customer -> recipient: CSV (customer,email[,subject][,name]) or SQLite (table recipients) export
+    'recipients_file': None,
+    'recipients_refresh_interval': 60.0,  # Seconds between checks of recipients_file for changes
+    # Only one watcher per user; another launch hands its command (process/stats/quit) to the running one
+    'single_instance': True,
+    'instance_connect_timeout': 5.0,  # Seconds a second launch waits for the running instance to answer
+}
+
+
+def load_config(config_path=CONFIG_FILE):
+    """Load settings from the JSON config file, falling back to defaults for missing keys."""
+    config = dict(DEFAULT_CONFIG)
+    if not os.path.exists(config_path):
+        return config
+    
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            user_config = json.load(f)
+        if isinstance(user_config, dict):
+            config.update(user_config)
+        else:
+            logger.warning("Ignoring config file, expected a JSON object: %s", config_path)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read config file %s, using defaults: %s", config_path, e)
+    return config
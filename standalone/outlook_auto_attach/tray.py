@@ -0,0 +1,158 @@
+"""System tray/menu bar icon."""
+
+import os
+import sys
+import logging
+import subprocess
+import zlib
+import threading
+from functools import partial
+
+from .settings import LOG_DIR, LOG_FILE, STATS_FILE, SYSTEM
+
+logger = logging.getLogger(__name__)
+
+
+TRAY_ICON_SIZE = 64
+
+
+def create_tray_icon():
+    """Create system tray icon."""
+    # Try to load the logo file (next to the application script, one level above this package)
+    script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    logo_path = os.path.join(script_dir, "ct_food_app_logo.png")
+    
+    # If running from PyInstaller bundle, check in the bundle
+    if hasattr(sys, '_MEIPASS'):  # Running from PyInstaller bundle
+        logo_path = os.path.join(sys._MEIPASS, "ct_food_app_logo.png")
+    elif SYSTEM == 'Darwin':
+        # On macOS, if running from .app bundle, check Resources
+        app_bundle = os.path.dirname(os.path.dirname(os.path.dirname(script_dir)))
+        if app_bundle.endswith('.app'):
+            resources_path = os.path.join(app_bundle, "Contents", "Resources", "ct_food_app_logo.png")
+            if os.path.exists(resources_path):
+                logo_path = resources_path
+    
+    # Imported here so the watcher can start before the GUI libraries are loaded
+    from PIL import Image, ImageDraw
+    
+    # Try to load the logo
+    if os.path.exists(logo_path):
+        try:
+            return load_cached_icon(logo_path, Image)
+        except Exception as e:
+            logger.warning("Could not load logo, using default: %s", e)
+    
+    # Fallback: Create a simple icon
+    image = Image.new('RGBA', (TRAY_ICON_SIZE, TRAY_ICON_SIZE), color=(255, 255, 255, 0))
+    draw = ImageDraw.Draw(image)
+    # Draw a blue circle (Outlook color)
+    draw.ellipse([8, 8, 56, 56], fill=(0, 120, 212), outline=(0, 90, 180), width=2)
+    # Draw 'O' for Outlook (simple text without font dependency)
+    draw.text((22, 18), 'O', fill='white')
+    return image
+
+
+def load_cached_icon(logo_path, Image, cache_dir=LOG_DIR):
+    """The logo resized for the tray, cached in cache_dir by a checksum of the logo."""
+    with open(logo_path, 'rb') as f:
+        checksum = zlib.crc32(f.read())
+    cache_path = os.path.join(cache_dir, f"tray-icon-{TRAY_ICON_SIZE}-{checksum:08x}.png")
+    if os.path.exists(cache_path):
+        try:
+            image = Image.open(cache_path)
+            image.load()
+            return image
+        except OSError as e:
+            logger.debug("Cached tray icon unreadable, recreating it: %s", e)
+    
+    image = Image.open(logo_path).resize((TRAY_ICON_SIZE, TRAY_ICON_SIZE), Image.Resampling.LANCZOS)
+    try:
+        image.save(cache_path)
+    except OSError as e:
+        logger.debug("Could not cache tray icon: %s", e)
+    return image
+
+
+def setup_tray_icon(supervisor, metrics=None, diagnostics=None, profile_seconds=30.0):
+    """Setup system tray/menu bar icon with menu."""
+    import pystray
+    
+    def on_quit(icon, item):
+        logger.info("Shutting down...")
+        # main() leaves its loop and shuts everything down in order (queued files are drained there)
+        supervisor.request_stop()
+        icon.stop()
+    
+    def show_log(icon, item):
+        """Open the log file in default text editor."""
+        try:
+            if SYSTEM == 'Windows':
+                os.startfile(LOG_FILE)
+            else:  # macOS
+                subprocess.run(['open', LOG_FILE])
+        except Exception as e:
+            logger.error("Error opening log file: %s", e)
+            # Fallback: open the folder
+            open_log_folder(icon, item)
+    
+    def open_log_folder(icon, item):
+        """Open the log file folder in File Explorer/Finder."""
+        try:
+            if SYSTEM == 'Windows':
+                # Open folder and select the log file
+                subprocess.run(['explorer', '/select,', LOG_FILE], check=False)
+            else:  # macOS
+                subprocess.run(['open', '-R', LOG_FILE], check=False)
+        except Exception as e:
+            logger.error("Error opening log folder: %s", e)
+    
+    def show_statistics(icon, item):
+        """Write the current statistics and open them in the default viewer."""
+        try:
+            metrics.write()
+            if SYSTEM == 'Windows':
+                os.startfile(STATS_FILE)
+            else:  # macOS
+                subprocess.run(['open', STATS_FILE])
+        except Exception as e:
+            logger.error("Error opening statistics: %s", e)
+    
+    def open_report(path):
+        if SYSTEM == 'Windows':
+            os.startfile(path)
+        else:  # macOS
+            subprocess.run(['open', path])
+    
+    def diagnostics_action(action):
+        def run(icon, item):
+            # Reports can take a moment - don't block the menu
+            def report():
+                try:
+                    path = action()
+                    if path:
+                        open_report(path)
+                except Exception as e:
+                    logger.error("Diagnostics failed: %s", e, exc_info=True)
+            threading.Thread(target=report, name="diagnostics", daemon=True).start()
+        return run
+    
+    diagnostics_menu = None
+    if diagnostics is not None:
+        diagnostics_menu = pystray.Menu(
+            pystray.MenuItem("Thread Dump", diagnostics_action(diagnostics.thread_dump)),
+            pystray.MenuItem("Memory Snapshot", diagnostics_action(diagnostics.memory_snapshot)),
+            pystray.MenuItem(f"CPU Profile ({profile_seconds:.0f} s)",
+                             diagnostics_action(partial(diagnostics.cpu_profile, profile_seconds, wait=True))),
+        )
+    
+    menu = pystray.Menu(
+        pystray.MenuItem("View Log File", show_log),
+        pystray.MenuItem("Statistics", show_statistics, visible=metrics is not None),
+        pystray.MenuItem("Diagnostics", diagnostics_menu, visible=diagnostics is not None),
+        pystray.MenuItem("Open Log Folder", open_log_folder),
+        pystray.MenuItem("Quit", on_quit)
+    )
+    
+    icon = pystray.Icon("CT Food Outlook", create_tray_icon(), "CT Food Outlook - Auto attach Orderbekräftelse files to Outlook", menu)
+    return icon
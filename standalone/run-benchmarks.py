@@ -0,0 +1,1525 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for Outlook Auto Attach.
+Imports the outlook_auto_attach package and measures individual pipeline stages
+with synthetic workloads. Every benchmark prints a JSON report to stdout so results can be
+compared across versions. Correctness is covered by the tests in tests/, whose fakes (mail
+backends, COM objects, osascript helper, browser) are shared with the benchmarks.
+
+Usage:
+    python run-benchmarks.py burst --files 500 --workers 2
+"""
+
+import os
+import sys
+import json
+import time
+import math
+import shutil
+import re
+import random
+import argparse
+import unicodedata
+import subprocess
+import tempfile
+import threading
+import itertools
+import logging
+import importlib
+import types
+
+from watchdog.observers import Observer
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_SCRIPT = os.path.join(SCRIPT_DIR, "outlook-auto-attach-standalone.py")
+
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "tests"))
+from fakes import (RecordingMailBackend, FlakyMailBackend, FakeOutlookApplication, STUB_HELPER,  # noqa: E402
+                   BrowserSimulator, synthetic_pdf)
+
+# Subcommand name -> (function, help, [(flags, add_argument options)]), in definition order
+BENCHMARKS = {}
+
+
+def benchmark(name, help, *options):
+    """Register the decorated function as the subcommand `name`; options are option(...) values."""
+    def register(func):
+        BENCHMARKS[name] = (func, help, options)
+        return func
+    return register
+
+
+def option(*flags, **kwargs):
+    """A command line option of a benchmark, as passed to add_argument."""
+    return flags, kwargs
+
+
+# Modules of the outlook_auto_attach package the benchmarks drive
+APP_MODULES = ('settings', 'rules', 'archive', 'large_attachments', 'prefill', 'mail', 'scheduler', 'completion',
+               'journal', 'drafts', 'catchup', 'metrics', 'diagnostics', 'handler', 'observer', 'folders', 'batch',
+               'instance')
+
+
+def load_app():
+    """The names defined by the application modules, as one namespace (app.WorkScheduler etc.)."""
+    # pystray needs a display on Linux - the benchmarks never show the tray icon
+    os.environ.setdefault('PYSTRAY_BACKEND', 'dummy')
+    sys.path.insert(0, SCRIPT_DIR)
+    app = types.SimpleNamespace(logger=logging.getLogger('outlook_auto_attach'))
+    for name in APP_MODULES:
+        module = importlib.import_module(f"outlook_auto_attach.{name}")
+        for attr, value in vars(module).items():
+            # Classes and functions defined there, and its constants
+            if not attr.startswith('_') and (getattr(value, '__module__', None) == module.__name__ or attr.isupper()):
+                setattr(app, attr, value)
+    app.logger.setLevel('WARNING')
+    return app
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def timing_ms(seconds, pcts=(50, 95), digits=1, prefix=''):
+    """{'<prefix>p50_ms': ..., ...} for a list of durations in seconds, plus '<prefix>max_ms'."""
+    report = {f'{prefix}p{pct}_ms': round(percentile(seconds, pct) * 1000, digits) if seconds else None
+              for pct in pcts}
+    report[f'{prefix}max_ms'] = round(max(seconds) * 1000, digits) if seconds else None
+    return report
+
+
+def rss_kb():
+    """Current and peak resident set size of this process in KB (Linux; None where unavailable)."""
+    current = peak = None
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1])
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1])
+    except OSError:
+        pass
+    return current, peak
+
+
+def downloads_pipeline(app, root, scheduler, backend=None, **options):
+    """A DownloadsHandler for root/Downloads archiving into root/archive, drafting to a RecordingMailBackend."""
+    downloads = os.path.join(root, "Downloads")
+    os.makedirs(downloads, exist_ok=True)
+    backend = backend if backend is not None else RecordingMailBackend()
+    handler = app.DownloadsHandler(downloads, scheduler=scheduler, mail_backend=backend,
+                                   archive_dir=os.path.join(root, "archive"), **options)
+    return handler, backend
+
+
+class ThreadSampler:
+    """Samples the live thread count in the background to find the peak."""
+    
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            self._stop.wait(self.interval)
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+@benchmark('burst', "Burst of file events through the worker pool",
+           option('--files', type=int, default=500),
+           option('--workers', type=int, default=2),
+           option('--queue-size', type=int, default=500),
+           option('--delay', type=float, default=0.2, help="Delay before the first completion check"),
+           option('--work-ms', type=float, default=2.0, help="Simulated processing time per file"),
+           option('--block-timeout', type=float, default=30.0),
+           option('--timeout', type=float, default=120.0),
+           option('--compare-legacy', action='store_true', help="Also run thread-per-event mode"))
+def bench_burst(args):
+    """Synthetic burst of file-created events through DownloadsHandler and the worker pool."""
+    app = load_app()
+    from watchdog.events import FileCreatedEvent
+    
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(folder, f"Orderbekräftelse-{i}.pdf")
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-1.4\n')
+            paths.append(path)
+        
+        work_time = args.work_ms / 1000.0
+        done = threading.Event()
+        completed = []
+        lock = threading.Lock()
+        
+        def fake_process(file_path):
+            time.sleep(work_time)
+            with lock:
+                completed.append(file_path)
+                if len(completed) == len(paths):
+                    done.set()
+        
+        results = {}
+        baseline_threads = threading.active_count()
+        
+        # Current pipeline: one scheduler feeding a fixed worker pool
+        scheduler = app.WorkScheduler(workers=args.workers, max_pending=args.queue_size).start()
+        detector = app.DownloadCompletionDetector(first_delay=args.delay)
+        handler = app.DownloadsHandler(folder, scheduler=scheduler, detector=detector,
+                                       queue_block_timeout=args.block_timeout)
+        handler.process_file = fake_process
+        with ThreadSampler() as sampler:
+            start = time.perf_counter()
+            for path in paths:
+                handler.on_created(FileCreatedEvent(path))
+            done.wait(timeout=args.timeout)
+            elapsed = time.perf_counter() - start
+        scheduler.shutdown(drain=False)
+        results['worker_pool'] = {
+            'files': len(paths),
+            'completed': len(completed),
+            'seconds': round(elapsed, 4),
+            'files_per_second': round(len(completed) / elapsed, 1) if elapsed else None,
+            'peak_threads': sampler.peak - baseline_threads,
+            'scheduler': scheduler.stats(),
+        }
+        
+        # Previous behaviour for comparison: one sleeping thread per event
+        if args.compare_legacy:
+            completed.clear()
+            done.clear()
+            
+            def legacy_job(file_path):
+                time.sleep(args.delay)
+                fake_process(file_path)
+            
+            with ThreadSampler() as sampler:
+                start = time.perf_counter()
+                for path in paths:
+                    threading.Thread(target=legacy_job, args=(path,), daemon=True).start()
+                done.wait(timeout=args.timeout)
+                elapsed = time.perf_counter() - start
+            results['thread_per_event'] = {
+                'files': len(paths),
+                'completed': len(completed),
+                'seconds': round(elapsed, 4),
+                'files_per_second': round(len(completed) / elapsed, 1) if elapsed else None,
+                'peak_threads': sampler.peak - baseline_threads,
+            }
+    
+    return results
+
+
+@benchmark('index', "Processed-file index cost vs. number of tracked entries",
+           option('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000, 100000]),
+           option('--events', type=int, default=20000))
+def bench_index(args):
+    """Per-event cost of the processed-file index as the number of tracked entries grows."""
+    app = load_app()
+    results = []
+    for size in args.sizes:
+        index = app.ProcessedFileIndex(max_entries=size, ttl=3600)
+        folder = os.path.join(tempfile.gettempdir(), "bench-index")
+        for i in range(size):
+            index.claim(os.path.join(folder, f"old-{i}.pdf"), float(i))
+        
+        # Steady state: each new event claims a new path and evicts the oldest entry
+        paths = [os.path.join(folder, f"new-{i}.pdf") for i in range(args.events)]
+        start = time.perf_counter()
+        for path in paths:
+            index.claim(path, 1.0)
+        claim_ns = (time.perf_counter() - start) / len(paths) * 1e9
+        
+        # Duplicate events for paths that are already tracked
+        start = time.perf_counter()
+        for path in paths[-min(len(paths), size):]:
+            index.claim(path, 1.0)
+        duplicate_ns = (time.perf_counter() - start) / min(len(paths), size) * 1e9
+        
+        results.append({
+            'tracked_entries': len(index),
+            'claim_ns_per_event': round(claim_ns),
+            'duplicate_ns_per_event': round(duplicate_ns),
+        })
+    return results
+
+
+def parse_size(text):
+    """Parse sizes such as 1K, 10M, 500M."""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper()
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+@benchmark('transfer', "Archive transfer vs. copy2 + sleep + remove",
+           option('--sizes', nargs='+', default=['1K', '1M', '10M', '100M', '500M']),
+           option('--repeat', type=int, default=3, help="Runs per size (median is reported)"),
+           option('--source-dir', help="Folder for source files (default: system temp)"),
+           option('--dest-dir', help="Archive folder, e.g. on another filesystem (default: same as source)"))
+def bench_transfer(args):
+    """Moving a file into the archive: copy2 + sleep + remove vs. transfer_file."""
+    app = load_app()
+    results = []
+    
+    def make_file(path, size):
+        block = os.urandom(min(size, 4 * 1024 * 1024)) or b''
+        with open(path, 'wb') as f:
+            remaining = size
+            while remaining > 0:
+                f.write(block[:remaining])
+                remaining -= len(block[:remaining])
+    
+    def legacy(source, dest):
+        shutil.copy2(source, dest)
+        time.sleep(0.3)
+        os.remove(source)
+    
+    methods = {
+        'copy2_sleep_remove': legacy,
+        'transfer_rename_hash': lambda source, dest: app.transfer_file(source, dest),
+        'transfer_copy_hash': lambda source, dest: app.transfer_file(source, dest, allow_rename=False),
+        'transfer_copy_kernel': lambda source, dest: app.transfer_file(
+            source, dest, compute_hash=False, allow_rename=False),
+    }
+    source_root = args.source_dir or tempfile.gettempdir()
+    dest_root = args.dest_dir or source_root
+    
+    with tempfile.TemporaryDirectory(dir=source_root) as source_dir, \
+            tempfile.TemporaryDirectory(dir=dest_root) as dest_dir:
+        for size_text in args.sizes:
+            size = parse_size(size_text)
+            row = {'size': size_text, 'bytes': size}
+            for name, method in methods.items():
+                timings = []
+                for i in range(args.repeat):
+                    source = os.path.join(source_dir, f"Orderbekräftelse-{i}.pdf")
+                    dest = os.path.join(dest_dir, f"{name}-{size_text}-{i}.pdf")
+                    make_file(source, size)
+                    start = time.perf_counter()
+                    method(source, dest)
+                    timings.append(time.perf_counter() - start)
+                    os.remove(dest)
+                row[f"{name}_ms"] = timing_ms(timings, pcts=(50,), digits=2)['p50_ms']
+            results.append(row)
+    return {'source_dir': source_root, 'dest_dir': dest_root, 'sizes': results}
+
+
+@benchmark('com-session', "Outlook COM session with a fake COM object",
+           option('--drafts', type=int, default=200),
+           option('--threads', type=int, default=4, help="Threads submitting drafts concurrently"),
+           option('--connect-ms', type=float, default=300.0, help="Simulated GetActiveObject/Dispatch time"),
+           option('--display-ms', type=float, default=2.0, help="Simulated CreateItem + Display time"),
+           option('--proxy-lifetime', type=int, default=50, help="Drafts before the fake proxy dies"))
+def bench_com_session(args):
+    """Outlook COM session queueing, reconnect and per-draft latency against a fake COM object."""
+    app = load_app()
+    connect_delay = args.connect_ms / 1000.0
+    
+    def connect():
+        # Attaching to / launching Outlook is the expensive part the session avoids repeating
+        time.sleep(connect_delay)
+        return FakeOutlookApplication(display_ms=args.display_ms, lifetime=args.proxy_lifetime)
+    
+    session = app.OutlookComSession(connect=connect, com_init=lambda: None, com_uninit=lambda: None)
+    latencies = []
+    lock = threading.Lock()
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "Orderbekräftelse.pdf")
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4\n')
+        
+        def client(count):
+            for _ in range(count):
+                start = time.perf_counter()
+                success, _ = session.open_draft([path])
+                with lock:
+                    latencies.append((time.perf_counter() - start, success))
+        
+        per_thread = args.drafts // args.threads
+        threads = [threading.Thread(target=client, args=(per_thread,)) for _ in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    session.close()
+    
+    return {
+        'drafts': len(latencies),
+        'succeeded': sum(1 for _, success in latencies if success),
+        'connects': session.connects,
+        'seconds': round(elapsed, 3),
+        'first_draft_ms': round(latencies[0][0] * 1000, 2) if latencies else None,
+        **timing_ms([latency for latency, _ in latencies], digits=2, prefix='draft_'),
+    }
+
+
+@benchmark('bridge', "osascript bridge protocol against a stub helper",
+           option('--drafts', type=int, default=200),
+           option('--helper-ms', type=float, default=1.0, help="Simulated Outlook time per draft"),
+           option('--timeout', type=float, default=10.0))
+def bench_bridge(args):
+    """osascript bridge round-trip latency against a stub helper vs. one helper process per draft."""
+    app = load_app()
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        stub = os.path.join(folder, "stub_helper.py")
+        with open(stub, 'w') as f:
+            f.write(STUB_HELPER)
+        # Quotes and backslashes in the name used to break the generated AppleScript
+        attachment = os.path.join(folder, 'Orderbekräftelse "12345" \\ kopia.pdf')
+        with open(attachment, 'wb') as f:
+            f.write(b'%PDF-1.4\n')
+        command = [sys.executable, stub]
+        os.environ['STUB_DELAY_MS'] = str(args.helper_ms)
+        
+        # Long-lived helper (restarts after a hang or crash are covered by tests/test_osascript_bridge.py)
+        os.environ['STUB_MODE'] = 'ok'
+        bridge = app.OsascriptBridge(command=command, timeout=args.timeout)
+        bridge.open_draft([attachment])  # Start the helper outside the measurement
+        timings = []
+        for _ in range(args.drafts):
+            start = time.perf_counter()
+            success, message = bridge.open_draft([attachment, attachment])
+            timings.append(time.perf_counter() - start)
+            assert success, message
+        bridge.close()
+        results['bridge'] = {'drafts': len(timings), **timing_ms(timings, digits=2), 'helper_starts': bridge.starts}
+        
+        # One helper process per draft, like the previous osascript-per-file approach
+        timings = []
+        for i in range(min(args.drafts, 50)):
+            start = time.perf_counter()
+            request = json.dumps({'id': i, 'attachments': [attachment]}) + "\n"
+            subprocess.run(command, input=request, capture_output=True, text=True, timeout=args.timeout)
+            timings.append(time.perf_counter() - start)
+        results['process_per_draft'] = {'drafts': len(timings), **timing_ms(timings, digits=2)}
+    return results
+
+
+@benchmark('coalesce', "Drafts opened for a burst, with and without coalescing",
+           option('--files', type=int, default=30),
+           option('--file-kb', type=int, default=64),
+           option('--windows', type=float, nargs='+', default=[0.0, 0.5, 2.0]),
+           option('--max-attachments', type=int, default=10),
+           option('--mail-ms', type=float, default=50.0, help="Simulated time to open one draft"))
+def bench_coalesce(args):
+    """Burst of mixed Inköpsorder/Orderbekräftelse files: drafts opened with and without coalescing."""
+    app = load_app()
+    results = []
+    for window in args.windows:
+        groupings = []
+        for run in range(2):  # Run twice to check that grouping is deterministic
+            with tempfile.TemporaryDirectory() as folder:
+                scheduler = app.WorkScheduler(workers=1).start()
+                handler, backend = downloads_pipeline(
+                    app, folder, scheduler, RecordingMailBackend(latency=args.mail_ms / 1000.0),
+                    coalesce_window=window, coalesce_max_attachments=args.max_attachments
+                )
+                names = []
+                for i in range(args.files):
+                    document = "Inköpsorder" if i % 3 == 0 else "Orderbekräftelse"
+                    path = os.path.join(handler.downloads_folder, f"{document} {i:04d}.pdf")
+                    with open(path, 'wb') as f:
+                        f.write(b'%PDF-1.4\n' + os.urandom(args.file_kb * 1024))
+                    names.append(path)
+                start = time.perf_counter()
+                for path in names:
+                    handler.process_file(path)
+                scheduler.shutdown(drain=True, timeout=30)
+                elapsed = time.perf_counter() - start
+                groupings.append([
+                    [os.path.basename(path).split('-')[0] for path in draft['attachments']]
+                    for draft in backend.drafts
+                ])
+        sizes = [len(group) for group in groupings[0]]
+        results.append({
+            'window_seconds': window,
+            'files': args.files,
+            'drafts': len(sizes),
+            'max_attachments_per_draft': max(sizes) if sizes else 0,
+            'seconds': round(elapsed, 3),
+            'deterministic': groupings[0] == groupings[1],
+        })
+    return results
+
+
+def make_filename_corpus(count, seed=1234):
+    """Realistic Downloads filenames: mostly unrelated files, some order documents (NFC and NFD)."""
+    rng = random.Random(seed)
+    unrelated = ["setup-{}.exe", "IMG_{}.jpg", "Screenshot {}.png", "report-{}.xlsx", "archive-{}.zip",
+                 "Faktura {}.pdf", "invoice_{}.pdf", "presentation ({}).pptx", "node-v{}.pkg"]
+    matching = ["Orderbekräftelse {}.pdf", "Inköpsorder {}.pdf", "ORDERBEKRÄFTELSE_{}.PDF",
+                "inkopsorder-{}.pdf", "Orderbekräftelse ({}).pdf"]
+    corpus = []
+    for i in range(count):
+        if rng.random() < 0.2:
+            name = rng.choice(matching).format(rng.randint(10000, 99999))
+            if rng.random() < 0.5:
+                name = unicodedata.normalize('NFD', name)  # As delivered by macOS
+        else:
+            name = rng.choice(unrelated).format(rng.randint(1, 99999))
+        corpus.append(name)
+    return corpus
+
+
+def legacy_classify(filename):
+    """Previous should_process_file + file type check (lowercase copy, repeated substring scans)."""
+    if not filename:
+        return None
+    filename_lower = filename.lower()
+    has_orderbekraeftelse = 'orderbekräftelse' in filename_lower or 'orderbekr' in filename_lower
+    has_inkopsorder = 'inköpsorder' in filename_lower or 'inkopsorder' in filename_lower
+    if not (has_orderbekraeftelse or has_inkopsorder):
+        return None
+    original_name_lower = filename.lower()
+    if 'inköpsorder' in original_name_lower or 'inkopsorder' in original_name_lower:
+        return "Inköpsorder"
+    return "Orderbekräftelse"
+
+
+@benchmark('classify', "Filename classification throughput",
+           option('--files', type=int, default=100000))
+def bench_classify(args):
+    """Classify a filename corpus with the rule engine vs. the previous hard-coded checks."""
+    app = load_app()
+    corpus = make_filename_corpus(args.files)
+    engine = app.get_rule_engine()
+    
+    start = time.perf_counter()
+    legacy = [legacy_classify(name) for name in corpus]
+    legacy_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    classified = [engine.classify(name) for name in corpus]
+    engine_seconds = time.perf_counter() - start
+    
+    # Alternative design: every pattern in one case-insensitive regex with a group per rule
+    combined = re.compile('(?P<r0>inköpsorder|inkopsorder)|(?P<r1>orderbekräftelse|orderbekr)', re.IGNORECASE)
+    start = time.perf_counter()
+    for name in corpus:
+        combined.search(unicodedata.normalize('NFC', name))
+    regex_seconds = time.perf_counter() - start
+    
+    engine_names = [rule.name if rule else None for rule in classified]
+    return {
+        'files': len(corpus),
+        'matching_files': sum(1 for name in engine_names if name),
+        'legacy_ns_per_file': round(legacy_seconds / len(corpus) * 1e9),
+        'rule_engine_ns_per_file': round(engine_seconds / len(corpus) * 1e9),
+        'combined_regex_ns_per_file': round(regex_seconds / len(corpus) * 1e9),
+        # NFD names the old checks only caught through the 'orderbekr' fallback, or missed
+        'legacy_disagreements': sum(1 for a, b in zip(legacy, engine_names) if a != b),
+    }
+
+
+@benchmark('reject', "Watcher callback cost with early rejection",
+           option('--events', type=int, default=100000))
+def bench_reject(args):
+    """Cost of watcher callbacks for a mixed stream of events, most of them for unrelated files."""
+    app = load_app()
+    from watchdog.events import FileCreatedEvent
+    corpus = make_filename_corpus(args.events)
+    folder = os.path.join(tempfile.gettempdir(), "bench-reject")
+    events = [FileCreatedEvent(os.path.join(folder, name)) for name in corpus]
+    
+    scheduler = app.WorkScheduler(workers=1, max_pending=len(events) + 1).start()
+    handler = app.DownloadsHandler(folder, scheduler=scheduler)
+    handler._enqueue = lambda file_path: True  # Measure the callback only, not the processing
+    start = time.perf_counter()
+    for event in events:
+        handler.on_created(event)
+    elapsed = time.perf_counter() - start
+    scheduler.shutdown(drain=False)
+    return {
+        'events': len(events),
+        'ns_per_event': round(elapsed / len(events) * 1e9),
+        'dedup_entries': len(handler.processed_files),
+        'counters': handler.metrics.counts(),
+    }
+
+
+@benchmark('catchup', "Startup catch-up scan of a large Downloads folder",
+           option('--entries', type=int, default=50000, help="Files already in the folder"),
+           option('--new-files', type=int, default=50, help="Files that arrived while not running"),
+           option('--repeat', type=int, default=5, help="Runs (median is reported)"))
+def bench_catchup(args):
+    """Startup catch-up scan of a large Downloads folder vs. listing it and stat-ing every entry."""
+    app = load_app()
+    root = tempfile.mkdtemp(prefix="bench-catchup-")
+    folder = os.path.join(root, "Downloads")
+    os.makedirs(folder)
+    try:
+        # Existing files, all older than the watermark
+        for i, name in enumerate(make_filename_corpus(args.entries)):
+            open(os.path.join(folder, f"{i}-{name}"), 'wb').close()
+        scanner = app.CatchUpScanner(state_path=os.path.join(root, "watermark.json"))
+        scanner.scan(folder)  # First run only sets the watermark
+        time.sleep(0.05)
+        
+        # Downloads that arrived while the app was not running
+        new_names = make_filename_corpus(args.new_files, seed=99)
+        for i, name in enumerate(new_names):
+            open(os.path.join(folder, f"new-{i}-{name}"), 'wb').close()
+        engine = app.get_rule_engine()
+        expected = sum(1 for name in new_names if engine.classify(name) is not None)
+        
+        scan_times, naive_times = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            found = app.CatchUpScanner(state_path=scanner.state_path).scan(folder)
+            scan_times.append(time.perf_counter() - start)
+            
+            # Naive approach: stat every entry, then match the name
+            start = time.perf_counter()
+            watermark = scanner.watermark(folder)
+            naive = []
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                if app.CatchUpScanner.arrival_time(stat) >= watermark and engine.classify(name) is not None:
+                    naive.append(path)
+            naive_times.append(time.perf_counter() - start)
+        
+        return {
+            'entries': args.entries + args.new_files,
+            'new_matching_files': expected,
+            'found': len(found),
+            'scan_ms': timing_ms(scan_times, pcts=(50,))['p50_ms'],
+            'listdir_stat_ms': timing_ms(naive_times, pcts=(50,))['p50_ms'],
+            'repeat': args.repeat,
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@benchmark('e2e', "Download-complete to draft latency through the real observer",
+           option('--phases', nargs='+', help="Only run these phases (default: all)"),
+           option('--single-files', type=int, default=20, help="Files per sequential rename phase"),
+           option('--gap-ms', type=float, default=50.0, help="Pause between sequential downloads"),
+           option('--slow-files', type=int, default=5, help="Concurrent slow writers"),
+           option('--chunk-pause-ms', type=float, default=20.0, help="Slow writer pause per 64 KB chunk"),
+           option('--burst', type=int, default=300, help="Files in the burst phase"),
+           option('--size', default='256K', help="Size of each download"),
+           option('--workers', type=int, default=2),
+           option('--queue-size', type=int, default=500),
+           option('--coalesce-window', type=float, default=0.0),
+           option('--mail-latency-ms', type=float, default=0.0, help="Simulated time to open a draft"),
+           option('--timeout', type=float, default=120.0))
+def bench_e2e(args):
+    """
+    End-to-end latency from a download being complete to its draft being opened, through the real
+    Observer, DownloadsHandler, worker pool, archive move and dedup journal, with a recording mail backend.
+    """
+    app = load_app()
+    root = tempfile.mkdtemp(prefix="bench-e2e-")
+    # Keep the original name in the archive so drafts can be matched to downloads
+    rules = app.RuleEngine.from_config([dict(rule, output_template="{stem}{ext}") for rule in app.DEFAULT_RULES])
+    scheduler = app.WorkScheduler(workers=args.workers, max_pending=args.queue_size).start()
+    journal = app.DedupJournal(db_path=os.path.join(root, "journal.sqlite3"))
+    handler, backend = downloads_pipeline(
+        app, root, scheduler, RecordingMailBackend(latency=args.mail_latency_ms / 1000.0),
+        queue_block_timeout=args.timeout, journal=journal, coalesce_window=args.coalesce_window, rules=rules
+    )
+    observer = Observer()
+    observer.schedule(handler, handler.downloads_folder, recursive=False)
+    observer.start()
+    simulator = BrowserSimulator(handler.downloads_folder, parse_size(args.size))
+    
+    def drafted_at():
+        """stem -> time its draft was opened."""
+        times = {}
+        for draft in list(backend.drafts):
+            for path in draft['attachments']:
+                times.setdefault(os.path.splitext(os.path.basename(path))[0], draft['time'])
+        return times
+    
+    def run_phase(name, work):
+        """Run one workload and wait for all of its drafts."""
+        baseline_threads = threading.active_count()
+        with ThreadSampler() as sampler:
+            start = time.perf_counter()
+            stems = work()
+            deadline = time.monotonic() + args.timeout
+            while time.monotonic() < deadline:
+                drafted = drafted_at()
+                if all(stem in drafted for stem in stems):
+                    break
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+        drafted = drafted_at()
+        latencies = [drafted[stem] - simulator.completed[stem] for stem in stems if stem in drafted]
+        done = [drafted[stem] for stem in stems if stem in drafted]
+        return name, {
+            'files': len(stems),
+            'drafted': len(latencies),
+            **timing_ms(latencies, pcts=(50, 95, 99)),
+            'seconds': round(elapsed, 3),
+            'files_per_second': round(len(done) / (max(done) - start), 1) if done else None,
+            'peak_threads': sampler.peak - baseline_threads,
+        }
+    
+    def sequential(count, download):
+        def work():
+            stems = []
+            for _ in range(count):
+                stems.append(download())
+                time.sleep(args.gap_ms / 1000.0)
+            return stems
+        return work
+    
+    def concurrent(count, download):
+        def work():
+            stems = []
+            writers = [threading.Thread(target=lambda: stems.append(download())) for _ in range(count)]
+            for writer in writers:
+                writer.start()
+            for writer in writers:
+                writer.join()
+            return stems
+        return work
+    
+    pause = args.chunk_pause_ms / 1000.0
+    phases = [
+        ('crdownload_rename', sequential(args.single_files, simulator.rename_download)),
+        ('tmp_rename', sequential(args.single_files, lambda: simulator.rename_download('.tmp'))),
+        ('slow_writers', concurrent(args.slow_files, lambda: simulator.slow_download(pause))),
+        ('slow_crdownload', concurrent(args.slow_files, lambda: simulator.rename_download(pause=pause))),
+        # Hundreds of downloads finishing back to back (e.g. "download all attachments")
+        ('burst', lambda: [simulator.rename_download() for _ in range(args.burst)]),
+    ]
+    results = {}
+    try:
+        for name, work in phases:
+            if args.phases and name not in args.phases:
+                continue
+            name, report = run_phase(name, work)
+            results[name] = report
+    finally:
+        observer.stop()
+        observer.join()
+        scheduler.shutdown(drain=False)
+        handler.coalescer.flush_all()
+        journal.close()
+        shutil.rmtree(root, ignore_errors=True)
+    
+    current_rss, peak_rss = rss_kb()
+    results['process'] = {
+        'drafts_opened': len(backend.drafts),
+        'rss_kb': current_rss,
+        'peak_rss_kb': peak_rss,
+        'events': handler.metrics.counts(),
+        'stages': handler.metrics.snapshot()['stages'],
+        'scheduler': scheduler.stats(),
+    }
+    return results
+
+
+@benchmark('startup', "Headless app startup: import and watcher-ready timings",
+           option('--repeat', type=int, default=5, help="Runs (median is reported)"))
+def bench_startup(args):
+    """
+    Start the app headless in a fresh process (temporary HOME) and read its startup timings
+    (module import, watcher ready) from the log, plus the time to import the GUI libraries
+    that headless mode and the deferred tray setup keep off the critical path.
+    """
+    pattern = re.compile(r"Startup: (\w+) after ([\d.]+) ms")
+    runs = []
+    for _ in range(args.repeat):
+        home = tempfile.mkdtemp(prefix="bench-startup-")
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, APP_SCRIPT, '--headless'], env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        marks = {}
+        try:
+            for line in process.stderr:
+                match = pattern.search(line)
+                if match:
+                    marks[match.group(1)] = float(match.group(2))
+                    if match.group(1) == 'watcher_ready':
+                        marks['process_to_watcher_ready'] = round((time.perf_counter() - start) * 1000, 1)
+                        break
+        finally:
+            process.terminate()
+            process.communicate(timeout=30)
+            shutil.rmtree(home, ignore_errors=True)
+        runs.append(marks)
+    
+    gui_import = subprocess.run(
+        [sys.executable, '-c', "import time; t = time.perf_counter(); import PIL.Image, PIL.ImageDraw; "
+                               "print((time.perf_counter() - t) * 1000)"],
+        capture_output=True, text=True, check=True)
+    
+    def median(name):
+        values = sorted(run[name] for run in runs if name in run)
+        return values[len(values) // 2] if values else None
+    
+    return {
+        'runs': len(runs),
+        'imported_ms': median('imported'),
+        'watcher_ready_ms': median('watcher_ready'),
+        'process_to_watcher_ready_ms': median('process_to_watcher_ready'),
+        'deferred_pil_import_ms': round(float(gui_import.stdout), 1),
+    }
+
+
+def open_handles():
+    """Open file descriptors of this process (Linux; None where unavailable)."""
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+@benchmark('roots', "Resource use of one pipeline vs. number of watched folders",
+           option('--roots', type=int, nargs='+', default=[1, 5, 20, 50, 100]),
+           option('--subfolders', type=int, default=5, help="Subfolders per root (watched when recursive)"),
+           option('--recursive', action='store_true'),
+           option('--workers', type=int, default=2))
+def bench_roots(args):
+    """Threads, handles and memory of one shared pipeline as the number of watched folders grows."""
+    app = load_app()
+    results = []
+    for count in args.roots:
+        base = tempfile.mkdtemp(prefix="bench-roots-")
+        try:
+            roots = []
+            for i in range(count):
+                root = os.path.join(base, f"root-{i}")
+                for j in range(args.subfolders):
+                    os.makedirs(os.path.join(root, f"sub-{j}"))
+                os.makedirs(root, exist_ok=True)
+                roots.append(app.WatchRoot(root, recursive=args.recursive, max_depth=1))
+            
+            threads_before, handles_before, (rss_before, _) = threading.active_count(), open_handles(), rss_kb()
+            backend = RecordingMailBackend()
+            scheduler = app.WorkScheduler(workers=args.workers).start()
+            detector = app.DownloadCompletionDetector()
+            processed_files = app.ProcessedFileIndex()
+            observer = Observer()
+            handlers = []
+            start = time.perf_counter()
+            for root in roots:
+                handler = app.DownloadsHandler(root.path, scheduler=scheduler, detector=detector,
+                                               processed_files=processed_files, mail_backend=backend,
+                                               archive_dir=os.path.join(base, "archive"), coalesce_window=0.0,
+                                               max_depth=root.max_depth)
+                observer.schedule(handler, root.path, recursive=root.recursive)
+                handlers.append(handler)
+            observer.start()
+            setup_ms = (time.perf_counter() - start) * 1000
+            
+            # One download into the last root, to check the pipeline still responds
+            written = time.perf_counter()
+            with open(os.path.join(roots[-1].path, "Orderbekräftelse 1.pdf"), 'wb') as f:
+                f.write(b'%PDF-1.4\n')
+            deadline = time.monotonic() + 10
+            while not backend.drafts and time.monotonic() < deadline:
+                time.sleep(0.005)
+            latency_ms = (backend.drafts[0]['time'] - written) * 1000 if backend.drafts else None
+            
+            threads_after, handles_after, (rss_after, _) = threading.active_count(), open_handles(), rss_kb()
+            observer.stop()
+            observer.join()
+            scheduler.shutdown(drain=False)
+            results.append({
+                'roots': count,
+                'watched_folders': count * (1 + (args.subfolders if args.recursive else 0)),
+                'setup_ms': round(setup_ms, 1),
+                'threads': threads_after - threads_before,
+                'handles': handles_after - handles_before if handles_before is not None else None,
+                'rss_kb': rss_after - rss_before if rss_before is not None else None,
+                'draft_latency_ms': round(latency_ms, 1) if latency_ms is not None else None,
+            })
+        finally:
+            shutil.rmtree(base, ignore_errors=True)
+    return results
+
+
+@benchmark('supervisor', "Observer restart and polling fallback in-process",
+           option('--backoff', type=float, default=0.1, help="Initial restart backoff (seconds)"),
+           option('--check-interval', type=float, default=0.05, help="Main loop check interval"),
+           option('--samples', type=int, default=5, help="Files per adaptive polling measurement"))
+def bench_supervisor(args):
+    """
+    Observer supervision in-process: kill the running observer, fault the native observer until
+    the supervisor falls back to polling, and measure the adaptive poller's detection latency.
+    """
+    app = load_app()
+    root = tempfile.mkdtemp(prefix="bench-supervisor-")
+    scheduler = app.WorkScheduler().start()
+    handler, backend = downloads_pipeline(
+        app, root, scheduler, coalesce_window=0.0,
+        catch_up_scanner=app.CatchUpScanner(os.path.join(root, "watermark.json"))
+    )
+    downloads = handler.downloads_folder
+    handler.catch_up()  # Sets the watermark
+    counter = itertools.count()
+    
+    def download():
+        with open(os.path.join(downloads, f"Orderbekräftelse {next(counter)}.pdf"), 'wb') as f:
+            f.write(b'%PDF-1.4\n')
+        return len(backend.drafts) + 1
+    
+    def wait_for_drafts(count, supervisor, timeout=30.0):
+        """Drive the supervisor like the main loop until count drafts exist; returns seconds."""
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        while len(backend.drafts) < count and time.monotonic() < deadline:
+            supervisor.check()
+            time.sleep(args.check_interval)
+        return round(time.perf_counter() - start, 3) if len(backend.drafts) >= count else None
+    
+    def run_supervisor(factory, mode):
+        return app.ObserverSupervisor(
+            [(handler, downloads, False)], observer_factory=factory, mode=mode,
+            on_restart=lambda: scheduler.submit(handler.catch_up, block=False),
+            backoff_initial=args.backoff, backoff_max=args.backoff * 8, max_failures=3
+        ).start()
+    
+    results = {}
+    try:
+        # 1. The native observer dies; a file arrives before it is restarted
+        supervisor = run_supervisor(lambda polling: app.create_observer(polling, 0.2, 2.0), 'auto')
+        supervisor.observer.stop()
+        supervisor.observer.join()
+        results['killed'] = {
+            'recovered_seconds': wait_for_drafts(download(), supervisor),
+            'restarts': supervisor.restarts,
+            'polling': supervisor.polling,
+        }
+        supervisor.stop()
+        
+        # 2. The native observer cannot start (e.g. the share is unreachable) until polling takes over
+        class FaultyObserver(Observer):
+            def start(self):
+                raise OSError("simulated watcher failure")
+        
+        factory = lambda polling: app.create_observer(True, 0.2, 2.0) if polling else FaultyObserver()
+        start = time.perf_counter()
+        supervisor = run_supervisor(factory, 'auto')
+        while not supervisor.check():
+            time.sleep(args.check_interval)
+        switched = time.perf_counter() - start
+        results['faulted'] = {
+            'switched_to_polling_seconds': round(switched, 3),
+            'polling': supervisor.polling,
+            'first_file_seconds': wait_for_drafts(download(), supervisor),
+        }
+        
+        # 3. Adaptive interval: detection right after activity vs. after an idle period
+        emitter = next(iter(supervisor.observer.emitters))
+        emitter.idle_after = 1.0
+        active, idle = [], []
+        for _ in range(args.samples):
+            active.append(wait_for_drafts(download(), supervisor))
+            time.sleep(0.3)
+        for _ in range(args.samples):
+            time.sleep(4.0)
+            idle_interval = emitter.timeout
+            idle.append(wait_for_drafts(download(), supervisor))
+        results['adaptive_polling'] = {
+            'fast_interval': emitter.fast_interval,
+            'slow_interval': emitter.slow_interval,
+            'interval_when_idle': round(idle_interval, 2),
+            'detect_after_activity_mean_seconds': round(sum(active) / len(active), 3),
+            'detect_when_idle_mean_seconds': round(sum(idle) / len(idle), 3),
+        }
+        supervisor.stop()
+    finally:
+        scheduler.shutdown(drain=False)
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+@benchmark('archive', "Archive sharding, index lookups and monthly zip bundles",
+           option('--files', type=int, default=20000, help="Files in the legacy flat archive"),
+           option('--file-size', type=int, default=8192),
+           option('--months', type=int, default=24, help="Archive dates spread over this many months"),
+           option('--lookups', type=int, default=1000),
+           option('--compact-after', type=int, default=3, help="Bundle months older than this"),
+           option('--rate', type=float, default=200.0, help="Files per second for the rate-limited pass"))
+def bench_archive(args):
+    """
+    Legacy flat archive folder: sharding it into YYYY/MM, index lookups vs. walking the folders,
+    and bundling old months into zips.
+    """
+    app = load_app()
+    root = tempfile.mkdtemp(prefix="bench-archive-")
+    archive = os.path.join(root, "businessnxtdocs")
+    os.makedirs(archive)
+    try:
+        # Archive copies spread over the last `months` months, like years of flat create_unique_file_copy output
+        rng = random.Random(7)
+        now = time.time()
+        payload = b"%PDF-1.4\n" + bytes(rng.getrandbits(8) for _ in range(256)) * (args.file_size // 256)
+        names = []
+        for i, name in enumerate(make_filename_corpus(args.files)):
+            name = f"{i:06d}-{name}"
+            path = os.path.join(archive, name)
+            with open(path, 'wb') as f:
+                f.write(payload + str(i).encode())
+            archived_at = now - rng.uniform(0, args.months * 30 * 86400)
+            os.utime(path, (archived_at, archived_at))
+            names.append(name)
+        flat_bytes = sum(entry.stat().st_size for entry in os.scandir(archive))
+        
+        start = time.perf_counter()
+        flat_listing = len(os.listdir(archive))
+        flat_list_ms = (time.perf_counter() - start) * 1000
+        
+        index = app.ArchiveIndex(os.path.join(root, "index.sqlite3"))
+        maintainer = app.ArchiveMaintainer(index, [archive], files_per_second=0)
+        start = time.perf_counter()
+        migrated = maintainer.run_once()['migrated']
+        migrate_s = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        top_listing = len(os.listdir(archive))
+        top_list_ms = (time.perf_counter() - start) * 1000
+        
+        # Look up copies by original name: index vs. walking the shards
+        targets = rng.sample(names, min(args.lookups, len(names)))
+        start = time.perf_counter()
+        found_index = sum(len(index.find(original_name=name)) for name in targets)
+        index_us = (time.perf_counter() - start) / len(targets) * 1e6
+        walk_targets = targets[:10]
+        start = time.perf_counter()
+        found_walk = 0
+        for name in walk_targets:
+            for folder, _, files in os.walk(archive):
+                found_walk += name in files
+        walk_ms = (time.perf_counter() - start) / len(walk_targets) * 1000
+        
+        compactor = app.ArchiveMaintainer(index, [archive], compact_after_months=args.compact_after,
+                                          files_per_second=0)
+        start = time.perf_counter()
+        bundled = compactor.run_once()['bundled']
+        compact_s = time.perf_counter() - start
+        bundles = [os.path.join(folder, name) for folder, _, files in os.walk(archive)
+                   for name in files if re.fullmatch(r'\d{4}-\d{2}(-\d+)?\.zip', name)]
+        archive_bytes = sum(os.path.getsize(os.path.join(folder, name))
+                            for folder, _, files in os.walk(archive) for name in files)
+        
+        # Rate-limited pass: how long the same kind of work is spread out in the background
+        throttled = app.ArchiveMaintainer(index, [archive], retention_days=0, files_per_second=args.rate)
+        start = time.perf_counter()
+        deleted = throttled.run_once()
+        throttled_s = time.perf_counter() - start
+        index.close()
+        
+        return {
+            'files': args.files,
+            'months': args.months,
+            'flat_entries': flat_listing,
+            'flat_listdir_ms': round(flat_list_ms, 2),
+            'migrated': migrated,
+            'migrate_files_per_s': round(migrated / migrate_s),
+            'top_level_entries_after': top_listing,
+            'top_level_listdir_ms': round(top_list_ms, 3),
+            'lookup_found': found_index,
+            'lookup_index_us': round(index_us, 1),
+            'lookup_walk_ms': round(walk_ms, 1),
+            'lookup_walk_found': found_walk,
+            'compact_after_months': args.compact_after,
+            'bundled': bundled,
+            'bundles': len(bundles),
+            'compact_files_per_s': round(bundled / compact_s) if bundled else None,
+            'bytes_before': flat_bytes,
+            'bytes_after_compaction': archive_bytes,
+            'retention_rate': args.rate,
+            'retention_deleted': deleted['deleted'] + deleted['bundles_deleted'],
+            'retention_pass_s': round(throttled_s, 2),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@benchmark('retry', "Failed drafts during an Outlook outage: retries and circuit breaker",
+           option('--drafts', type=int, default=40),
+           option('--outage', type=float, default=4.0, help="Seconds Outlook is unreachable"),
+           option('--fail-ms', type=float, default=200.0, help="Time a failing draft call blocks a worker"),
+           option('--base-delay', type=float, default=0.1, help="First retry delay (seconds)"),
+           option('--max-delay', type=float, default=1.0, help="Retry delay cap (seconds)"),
+           option('--threshold', type=int, default=3, help="Failures before the circuit opens"),
+           option('--reset', type=float, default=0.2, help="Seconds the circuit stays open at first"))
+def bench_retry(args):
+    """Drafts during an Outlook outage: retry queue with and without the circuit breaker."""
+    app = load_app()
+    app.logger.setLevel('CRITICAL')  # Every failed attempt is logged
+    results = []
+    for variant, threshold in (('no_breaker', 10 ** 9), ('breaker', args.threshold)):
+        with tempfile.TemporaryDirectory() as folder:
+            backend = FlakyMailBackend(fail_latency=args.fail_ms / 1000.0)
+            scheduler = app.WorkScheduler(workers=2).start()
+            breaker = app.CircuitBreaker("Outlook", failure_threshold=threshold, reset_timeout=args.reset,
+                                         max_reset_timeout=args.max_delay)
+            outbox = app.DraftOutbox(scheduler, mail_backend=backend, breaker=breaker,
+                                     db_path=os.path.join(folder, "retry.sqlite3"),
+                                     retry_base_delay=args.base_delay, retry_max_delay=args.max_delay)
+            interval = args.outage / args.drafts
+            for i in range(args.drafts):
+                path = os.path.join(folder, f"Orderbekräftelse {i:04d}.pdf")
+                open(path, 'wb').close()
+                item = {'path': path, 'filename': os.path.basename(path), 'size': 0}
+                scheduler.submit(outbox.send, "Orderbekräftelse", [item], delay=i * interval)
+            
+            time.sleep(args.outage)
+            backend.up.set()
+            recovered_at = time.perf_counter()
+            deadline = recovered_at + 30
+            while len(backend.drafts) < args.drafts and time.perf_counter() < deadline:
+                time.sleep(0.01)
+            done_at = time.perf_counter()
+            stats = outbox.stats()
+            scheduler.shutdown(drain=True, timeout=5)
+            outbox.close()
+            results.append({
+                'variant': variant,
+                'drafts': args.drafts,
+                'delivered': len(backend.drafts),
+                'failed_backend_calls': backend.failed_calls,
+                'worker_seconds_blocked': round(backend.blocked_seconds, 2),
+                'circuit_opened': stats['opened'],
+                'refused_by_breaker': stats['refused'],
+                'recovery_to_all_delivered_s': round(done_at - recovered_at, 2),
+            })
+    return results
+
+
+@benchmark('warmup', "Cold vs. warm first draft with the background warm-up",
+           option('--connect-ms', type=float, default=1500.0, help="Simulated Outlook start/attach time"),
+           option('--probes', type=int, default=50))
+def bench_warmup(args):
+    """First draft after startup, cold vs. with the background warm-up, for the COM session and the bridge."""
+    app = load_app()
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        stub = os.path.join(folder, "stub_helper.py")
+        with open(stub, 'w') as f:
+            f.write(STUB_HELPER)
+        os.environ['STUB_MODE'] = 'ok'
+        os.environ['STUB_DELAY_MS'] = '1'
+        attachment = os.path.join(folder, "Orderbekräftelse.pdf")
+        with open(attachment, 'wb') as f:
+            f.write(b'%PDF-1.4\n')
+        
+        def com_backend():
+            def connect():
+                time.sleep(args.connect_ms / 1000.0)  # Dispatch("Outlook.Application") starting Outlook
+                return FakeOutlookApplication(display_ms=1.0)
+            return app.OutlookComSession(connect=connect, com_init=lambda: None, com_uninit=lambda: None)
+        
+        def bridge_backend():
+            return app.OsascriptBridge(command=[sys.executable, stub])
+        
+        for backend_name, make_backend in (('outlook-com', com_backend), ('osascript-bridge', bridge_backend)):
+            for warm in (False, True):
+                backend = make_backend()
+                scheduler = app.WorkScheduler(workers=2).start()
+                outbox = app.DraftOutbox(scheduler, mail_backend=backend)
+                if warm:
+                    outbox.warm_up(probe_interval=0)
+                    deadline = time.perf_counter() + 30
+                    while outbox.warm_up_ms is None and time.perf_counter() < deadline:
+                        time.sleep(0.005)
+                outbox.send("Orderbekräftelse", [{'path': attachment, 'filename': "Orderbekräftelse.pdf"}])
+                probes = []
+                for _ in range(args.probes):
+                    start = time.perf_counter()
+                    backend.probe()
+                    probes.append(time.perf_counter() - start)
+                results.append({
+                    'backend': backend_name,
+                    'warm_up': warm,
+                    'warm_up_ms': outbox.warm_up_ms,
+                    'first_draft_ms': outbox.first_draft_ms,
+                    'first_draft_warm': outbox.first_draft_warm,
+                    'probe_median_ms': timing_ms(probes, pcts=(50,), digits=3)['p50_ms'],
+                })
+                scheduler.shutdown(drain=True, timeout=5)
+                outbox.close()
+                backend.close()
+    return results
+
+
+@benchmark('batch', "Batch subcommand throughput vs. number of parallel jobs",
+           option('--files', type=int, default=2000),
+           option('--file-kb', type=int, default=64),
+           option('--jobs', type=int, nargs='+', default=[1, 2, 4, 8]),
+           option('--mail-ms', type=float, default=5.0, help="Simulated time to open one draft"),
+           option('--source-dir', help="Create the export folders here (another file system forces copies)"),
+           option('--dry-run', action='store_true'))
+def bench_batch(args):
+    """Batch subcommand throughput (classification, archive transfer, coalesced drafts) vs. parallel jobs."""
+    root = tempfile.mkdtemp(prefix="bench-batch-")
+    # The batch run uses the journal and archive under the home folder - keep them in the temp folder
+    os.environ['HOME'] = root
+    app = load_app()
+    os.makedirs(app.LOG_DIR, exist_ok=True)
+    # Exports on another file system (e.g. /dev/shm) make the archive step a real copy instead of a rename
+    source_base = tempfile.mkdtemp(prefix="bench-batch-src-", dir=args.source_dir)
+    results = []
+    try:
+        for jobs in args.jobs:
+            export = os.path.join(source_base, f"export-{jobs}")
+            os.makedirs(export)
+            for i in range(args.files):
+                document = "Inköpsorder" if i % 4 else "Orderbekräftelse"
+                with open(os.path.join(export, f"{document} {jobs}-{i:05d}.pdf"), 'wb') as f:
+                    f.write(b'%PDF-1.4\n' + os.urandom(args.file_kb * 1024))
+            backend = RecordingMailBackend(latency=args.mail_ms / 1000.0)
+            app.set_mail_backend(backend)
+            summary = app.run_batch([export], dict(app.DEFAULT_CONFIG), jobs=jobs, dry_run=args.dry_run)
+            results.append({
+                'jobs': jobs,
+                'files': summary['files'],
+                'seconds': summary['seconds'],
+                'files_per_second': summary['files_per_second'],
+                'megabytes_per_second': summary['megabytes_per_second'],
+                'drafts': summary['drafts'],
+                'outcomes': summary['outcomes'],
+                'archive_p95_ms': summary['stages'].get('archive', {}).get('p95_ms'),
+            })
+    finally:
+        shutil.rmtree(source_base, ignore_errors=True)
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+@benchmark('diagnostics', "Profiler overhead and dump/snapshot times",
+           option('--seconds', type=float, default=3.0),
+           option('--intervals', type=float, nargs='+', default=[1.0, 10.0, 50.0],
+                  help="Sample intervals in milliseconds"))
+def bench_diagnostics(args):
+    """Cost of the on-demand diagnostics: profiler overhead on a CPU-bound loop, dump and snapshot times."""
+    app = load_app()
+    results = []
+    
+    def spin(seconds):
+        # Pure-Python work the sampler has to interrupt, like classification of a large catch-up scan
+        iterations = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            sum(i * i for i in range(200))
+            iterations += 1
+        return iterations
+    
+    results.append({'disabled': {'tracemalloc_imported': 'tracemalloc' in sys.modules,
+                                 'enabled_by_default': app.Diagnostics.enabled(dict(app.DEFAULT_CONFIG))}})
+    with tempfile.TemporaryDirectory() as folder:
+        metrics = app.Metrics()
+        worker = threading.Thread(target=spin, args=(args.seconds * 3 + 10,), name="Worker-1", daemon=True)
+        worker.start()
+        baseline = spin(args.seconds)
+        for interval in args.intervals:
+            diagnostics = app.Diagnostics(folder, metrics, sample_interval=interval / 1000.0)
+            diagnostics.cpu_profile(args.seconds)
+            time.sleep(0.01)
+            profiled = spin(args.seconds)
+            while diagnostics._profile_lock.locked():
+                time.sleep(0.01)
+            results.append({
+                'sample_interval_ms': interval,
+                'iterations_baseline': baseline,
+                'iterations_profiled': profiled,
+                'overhead_percent': round(100.0 * (baseline - profiled) / max(1, baseline), 1),
+            })
+        diagnostics = app.Diagnostics(folder, metrics)
+        timings = {}
+        for name, action in (('thread_dump', diagnostics.thread_dump),
+                             ('first_memory_snapshot', diagnostics.memory_snapshot),
+                             ('memory_snapshot', diagnostics.memory_snapshot)):
+            start = time.perf_counter()
+            action()
+            timings[f'{name}_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        timings['reports'] = sorted(os.listdir(folder))[:8]
+        results.append(timings)
+    return results
+
+
+@benchmark('instance', "Single-instance lock and IPC hand-off between processes",
+           option('--launches', type=int, default=4, help="Processes started at the same time"),
+           option('--requests', type=int, default=200),
+           option('--repeat', type=int, default=3, help="Timed second launches"))
+def bench_instance(args):
+    """
+    Single-instance lock and IPC hand-off with real processes (temporary HOME): several launches
+    at once must leave exactly one watcher, later launches hand their command over and exit.
+    """
+    home = tempfile.mkdtemp(prefix="bench-instance-")
+    os.environ['HOME'] = home
+    os.environ['USERPROFILE'] = home
+    app = load_app()
+    env = dict(os.environ)
+    launches = []
+    try:
+        # Concurrent launches: all but one lose the lock and exit after the hand-off
+        start = time.perf_counter()
+        for _ in range(args.launches):
+            launches.append(subprocess.Popen([sys.executable, APP_SCRIPT, '--headless'], env=env,
+                                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        exited = []
+        deadline = time.perf_counter() + 30
+        while len(exited) < args.launches - 1 and time.perf_counter() < deadline:
+            exited = [process for process in launches if process.poll() is not None]
+            time.sleep(0.01)
+        contention_seconds = time.perf_counter() - start
+        running = [process for process in launches if process.poll() is None]
+        
+        # Round trips from this process, like a second launch after its imports
+        round_trips = {}
+        for command in ('ping', 'stats'):
+            timings = []
+            for _ in range(args.requests):
+                request_start = time.perf_counter()
+                reply = app.send_instance_command(command)
+                assert reply['ok'], reply
+                timings.append(time.perf_counter() - request_start)
+            round_trips[command] = timing_ms(timings, digits=3)
+        
+        # A whole second launch (interpreter start, imports, hand-off) vs. the running one
+        second = []
+        for _ in range(args.repeat):
+            launch_start = time.perf_counter()
+            subprocess.run([sys.executable, APP_SCRIPT, '--headless'], env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+            second.append(time.perf_counter() - launch_start)
+        
+        quit_start = time.perf_counter()
+        app.send_instance_command('quit')
+        for process in running:
+            process.wait(timeout=30)
+        quit_seconds = time.perf_counter() - quit_start
+        
+        return {
+            'launches': args.launches,
+            'left_running': len(running),
+            'exit_codes': sorted(process.returncode for process in launches),
+            'contention_seconds': round(contention_seconds, 2),
+            'round_trip': round_trips,
+            **timing_ms(second, pcts=(50,), prefix='second_launch_'),
+            'quit_to_exit_ms': round(quit_seconds * 1000, 1),
+        }
+    finally:
+        for process in launches:
+            if process.poll() is None:
+                process.terminate()
+                process.wait(timeout=30)
+        shutil.rmtree(home, ignore_errors=True)
+
+
+@benchmark('large', "Zipping/splitting oversized attachments: process pool vs. threads",
+           option('--files', type=int, default=4),
+           option('--file-mb', type=int, default=40, help="Size of each file in MB"),
+           option('--max-mb', type=int, default=20, help="Attachment size limit in MB"),
+           option('--mode', choices=('zip', 'split'), default='zip'),
+           option('--workers', type=int, default=2))
+def bench_large(args):
+    """
+    Oversized attachments: the large-attachment stage (process pool, streamed) vs. zipping the same
+    files on worker threads, measured by the stall of a thread standing in for the watcher/mail
+    threads, the pure-Python work it gets done, and the peak memory of the app process.
+    """
+    app = load_app()
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        sources = []
+        for i in range(args.files):
+            path = os.path.join(folder, f"Orderbekräftelse {i:03d}.pdf")
+            with open(path, 'wb') as f:
+                # Scans: mostly incompressible image data plus some text
+                for _ in range(args.file_mb):
+                    f.write(os.urandom(768 * 1024) + b'BT /F1 12 Tf (Order) Tj ET\n' * 10000)
+            sources.append(path)
+        
+        def ticker(stop, gaps, work):
+            last = time.perf_counter()
+            while not stop.is_set():
+                sum(i * i for i in range(200))
+                work[0] += 1
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+        
+        for variant in ('threads', 'process-pool'):
+            output = os.path.join(folder, variant)
+            os.makedirs(output)
+            stop = threading.Event()
+            gaps, work = [], [0]
+            tick = threading.Thread(target=ticker, args=(stop, gaps, work), daemon=True)
+            tick.start()
+            start = time.perf_counter()
+            if variant == 'threads':
+                stats = {'parts': 0, 'bytes_out': 0}
+                lock = threading.Lock()
+                
+                def prepare(path):
+                    result = app.prepare_large_attachment(path, output, os.path.basename(path), mode=args.mode,
+                                                          max_bytes=args.max_mb * 1024 * 1024)
+                    with lock:
+                        stats['parts'] += len(result['parts'])
+                        stats['bytes_out'] += sum(size for _, size in result['parts'])
+                workers = [threading.Thread(target=prepare, args=(path,)) for path in sources]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+            else:
+                stage = app.LargeAttachmentStage(args.max_mb * 1024 * 1024, mode=args.mode, output_dir=output,
+                                                 workers=args.workers)
+                for path in sources:
+                    stage.submit(path, os.path.basename(path), lambda parts: None)
+                stage.close()
+                stats = stage.stats()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            tick.join()
+            bytes_in = sum(os.path.getsize(path) for path in sources)
+            results.append({
+                'variant': variant,
+                'files': len(sources),
+                'megabytes_in': round(bytes_in / 1e6, 1),
+                'seconds': round(elapsed, 3),
+                'parts': stats['parts'],
+                'compression_ratio': round(stats['bytes_out'] / bytes_in, 3),
+                'other_thread_iterations_per_second': round(work[0] / elapsed),
+                'other_thread_max_stall_ms': round(max(gaps) * 1000, 1),
+                'other_thread_p99_stall_ms': round(percentile(gaps, 99) * 1000, 2),
+                'peak_rss_kb': rss_kb()[1],
+            })
+    return results
+
+
+@benchmark('prefill', "Order number extraction and recipient index lookups",
+           option('--files', type=int, default=200, help="Synthetic PDFs in the corpus"),
+           option('--pages', type=int, default=5),
+           option('--image-kb', type=int, nargs='+', default=[0, 200, 1000],
+                  help="Sizes of the scanned image in front of the text (chosen at random)"),
+           option('--customers', type=int, default=50),
+           option('--recipients', type=int, default=100000, help="Rows in the recipient CSV"),
+           option('--appended', type=int, default=1000, help="Rows appended before the refresh"),
+           option('--lookups', type=int, default=200000))
+def bench_prefill(args):
+    """
+    Draft prefill: order/customer number extraction from filenames and the PDF text layer (worker
+    process, time budget) on a corpus of synthetic PDFs, and the recipient index (load, incremental
+    refresh, lookups).
+    """
+    app = load_app()
+    config = dict(app.DEFAULT_CONFIG)
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        corpus = []
+        rng = random.Random(7)
+        for i in range(args.files):
+            order, customer = 100000 + i, 1000 + i % args.customers
+            in_name = i % 2 == 0
+            name = f"Orderbekräftelse {order} kundnr {customer}.pdf" if in_name else f"Scan {i:05d}.pdf"
+            path = os.path.join(folder, name)
+            with open(path, 'wb') as f:
+                f.write(synthetic_pdf(order, customer, pages=args.pages, image_kb=rng.choice(args.image_kb)))
+            corpus.append((path, name, {'order': str(order), 'customer': str(customer)}, in_name))
+        
+        metrics = app.Metrics()
+        scheduler = app.WorkScheduler(workers=1, name="Prefill").start()
+        extractor = app.OrderExtractor(config['prefill_patterns'], scheduler=scheduler,
+                                       budget=config['prefill_time_budget'],
+                                       max_pages=config['prefill_pdf_pages'], metrics=metrics)
+        extractor.extract(corpus[1][0], corpus[1][1], lambda fields: None)  # Start the worker process
+        extractor.wait()
+        timings = {'filename': [], 'text': []}
+        correct = 0
+        for path, name, expected, in_name in corpus:
+            # One at a time: the time from extract() to the callback, as the draft sees it
+            delivered = []
+            start = time.perf_counter()
+            extractor.extract(path, name, delivered.append)
+            extractor.wait()
+            timings['filename' if in_name else 'text'].append(time.perf_counter() - start)
+            correct += delivered == [expected]
+        extractor.close()
+        scheduler.shutdown()
+        counts = metrics.counts()
+        results['extraction'] = {
+            'files': len(corpus),
+            'correct': correct,
+            'timeouts': counts.get('extract_timeout', 0),
+            **timing_ms(timings['filename'], digits=3, prefix='filename_'),
+            **timing_ms(timings['text'], digits=3, prefix='text_'),
+        }
+        
+        recipients_file = os.path.join(folder, "recipients.csv")
+        with open(recipients_file, 'w', encoding='utf-8') as f:
+            f.write("customer;email;subject;name\n")
+            for customer in range(args.recipients):
+                f.write(f"{1000 + customer};inkop{customer}@example.se;Order {{order}} - {{name}};Kund {customer}\n")
+        index = app.RecipientIndex(recipients_file, metrics=metrics)
+        start = time.perf_counter()
+        index.refresh()
+        load_seconds = time.perf_counter() - start
+        time.sleep(0.01)
+        with open(recipients_file, 'a', encoding='utf-8') as f:
+            for customer in range(args.recipients, args.recipients + args.appended):
+                f.write(f"{1000 + customer};inkop{customer}@example.se;;\n")
+        start = time.perf_counter()
+        mode = index.refresh()
+        append_seconds = time.perf_counter() - start
+        
+        keys = [str(1000 + rng.randrange(args.recipients + args.appended)) for _ in range(args.lookups)]
+        start = time.perf_counter()
+        found = sum(index.lookup(key) is not None for key in keys)
+        lookup_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for key in keys[:10000]:
+            app.draft_prefill("Orderbekräftelse", {'order': '123456', 'customer': key}, index)
+        prefill_seconds = time.perf_counter() - start
+        results['recipients'] = {
+            'entries': len(index),
+            'full_load_ms': round(load_seconds * 1000, 1),
+            'append_refresh': mode,
+            'append_refresh_ms': round(append_seconds * 1000, 1),
+            'lookup_ns': round(lookup_seconds / len(keys) * 1e9),
+            'lookups_found': found,
+            'draft_prefill_us': round(prefill_seconds / min(len(keys), 10000) * 1e6, 2),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outlook Auto Attach benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    for name, (func, help, options) in BENCHMARKS.items():
+        subparser = subparsers.add_parser(name, help=help)
+        for flags, kwargs in options:
+            subparser.add_argument(*flags, **kwargs)
+        subparser.set_defaults(func=func)
+    
+    args = parser.parse_args()
+    results = {'benchmark': args.benchmark, 'python': sys.version.split()[0], 'results': args.func(args)}
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""Shared fixtures; the app's log folder is put in a temporary home before any app module is imported."""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+STANDALONE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_SCRIPT = os.path.join(STANDALONE_DIR, "outlook-auto-attach-standalone.py")
+
+# Log folder, journal and archive are derived from the home folder when the app is imported
+os.environ['HOME'] = os.environ['USERPROFILE'] = tempfile.mkdtemp(prefix="outlook-auto-attach-tests-")
+# pystray needs a display on Linux - the tests never show the tray icon
+os.environ.setdefault('PYSTRAY_BACKEND', 'dummy')
+# The test modules import the app's modules from the package next to the tests folder
+sys.path.insert(0, STANDALONE_DIR)
+
+
+@pytest.fixture
+def scheduler():
+    from outlook_auto_attach.scheduler import WorkScheduler
+    scheduler = WorkScheduler(workers=2).start()
+    yield scheduler
+    scheduler.shutdown(drain=False)
+
+
+def wait_for(condition, timeout=5.0, interval=0.005):
+    """Poll condition() until it is true; returns its last value."""
+    import time
+    deadline = time.monotonic() + timeout
+    while True:
+        value = condition()
+        if value or time.monotonic() > deadline:
+            return value
+        time.sleep(interval)
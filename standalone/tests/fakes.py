@@ -0,0 +1,220 @@
+"""Fakes for the parts of the app that talk to Outlook, osascript or a browser."""
+
+import itertools
+import os
+import threading
+import time
+import zlib
+
+
+class RecordingMailBackend:
+    """Fake mail backend that records every draft instead of opening Outlook."""
+    
+    name = 'recording'
+    
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.drafts = []
+        self._lock = threading.Lock()
+    
+    def open_draft(self, attachments, to=None, subject=None, body=None, on_done=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.drafts.append({'time': time.perf_counter(), 'attachments': list(attachments),
+                                'to': to, 'subject': subject})
+        return True, "Recorded"
+    
+    def warm_up(self):
+        return True, "Recorded"
+    
+    def probe(self):
+        return True, "Recorded"
+    
+    def close(self):
+        pass
+
+
+class FlakyMailBackend(RecordingMailBackend):
+    """Fake mail backend that fails slowly (like a hung Outlook or an osascript timeout) until `up` is set."""
+    
+    name = 'flaky'
+    
+    def __init__(self, fail_latency=0.0):
+        super().__init__()
+        self.fail_latency = fail_latency
+        self.up = threading.Event()
+        self.failed_calls = 0
+        self.blocked_seconds = 0.0
+    
+    def open_draft(self, attachments, to=None, subject=None, body=None, on_done=None):
+        if not self.up.is_set():
+            time.sleep(self.fail_latency)
+            with self._lock:
+                self.failed_calls += 1
+                self.blocked_seconds += self.fail_latency
+            return False, "Outlook is not responding"
+        return super().open_draft(attachments, to, subject, body)
+    
+    def warm_up(self):
+        return self.probe()
+    
+    def probe(self):
+        return (True, "Up") if self.up.is_set() else (False, "Down")
+
+
+class PendingMailBackend(RecordingMailBackend):
+    """Fake mail backend whose drafts outlast the timeout (PENDING) until finish() reports their result."""
+    
+    name = 'pending'
+    
+    def __init__(self):
+        super().__init__()
+        self.waiting = []  # on_done of each pending draft
+    
+    def open_draft(self, attachments, to=None, subject=None, body=None, on_done=None):
+        with self._lock:
+            self.waiting.append(on_done)
+        return None, "Draft still opening in Outlook"  # mail.PENDING
+    
+    def finish(self, success, message="Finished"):
+        with self._lock:
+            waiting, self.waiting = self.waiting, []
+        for on_done in waiting:
+            on_done(success, message)
+
+
+class FakeOutlookApplication:
+    """Stand-in for the Outlook.Application COM proxy. Dies (like a restarted Outlook) after `lifetime` drafts."""
+    
+    Version = "16.0.0.0"
+    
+    def __init__(self, display_ms=1.0, lifetime=None, gate=None):
+        self.display_ms = display_ms
+        self.lifetime = lifetime
+        self.gate = gate  # Display() waits for this event, like a modal dialog in Outlook
+        self.created = 0
+        self.displayed = []
+    
+    def CreateItem(self, item_type):
+        if self.lifetime is not None and self.created >= self.lifetime:
+            raise RuntimeError("The RPC server is unavailable.")
+        self.created += 1
+        return FakeMailItem(self)
+
+
+class FakeMailItem:
+    def __init__(self, application):
+        self.application = application
+        self.Attachments = self
+        self.files = []
+        self.To = self.Subject = self.Body = None
+    
+    def Add(self, path):
+        self.files.append(path)
+    
+    def Display(self):
+        if self.application.gate is not None:
+            self.application.gate.wait()
+        time.sleep(self.application.display_ms / 1000.0)
+        self.application.displayed.append(self)
+
+
+# Line protocol of the osascript bridge helper (OSASCRIPT_BRIDGE_SCRIPT), in Python.
+# STUB_MODE: ok, hang (never answers) or crash (exits on the first request)
+STUB_HELPER = """
+import os, sys, json, time
+mode = os.environ.get('STUB_MODE', 'ok')
+delay = float(os.environ.get('STUB_DELAY_MS', '1')) / 1000.0
+log = os.environ.get('STUB_LOG')
+print(json.dumps({'ready': True}), flush=True)
+for line in sys.stdin:
+    request = json.loads(line)
+    if log:
+        with open(log, 'a') as f:
+            f.write(json.dumps(request) + '\\n')
+    if mode == 'hang':
+        time.sleep(3600)
+    if mode == 'crash':
+        sys.exit(1)
+    time.sleep(delay)
+    ok = request.get('probe') or all(isinstance(path, str) for path in request['attachments'])
+    print(json.dumps({'id': request['id'], 'ok': ok}), flush=True)
+"""
+
+
+class BrowserSimulator:
+    """
+    Writes downloads the way browsers do and records when each one was complete under its
+    final name (the moment a user would expect the draft to start).
+    """
+    
+    def __init__(self, folder, size, chunk_size=64 * 1024):
+        self.folder = folder
+        self.size = size
+        self.chunk_size = chunk_size
+        self.completed = {}  # stem -> perf_counter time the final file was complete
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+    
+    def _new_stem(self, kind):
+        return f"Orderbekräftelse {kind}-{next(self._counter):05d}"
+    
+    def _write(self, path, pause=0.0):
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4\n')
+            written = 9
+            while written < self.size:
+                chunk = os.urandom(min(self.chunk_size, self.size - written))
+                f.write(chunk)
+                f.flush()
+                written += len(chunk)
+                if pause:
+                    time.sleep(pause)
+    
+    def _done(self, stem):
+        with self._lock:
+            self.completed[stem] = time.perf_counter()
+    
+    def rename_download(self, suffix='.crdownload', pause=0.0):
+        """Chrome/Edge (.crdownload) or generic (.tmp): write under a temporary name, then rename."""
+        stem = self._new_stem(suffix.strip('.'))
+        final_path = os.path.join(self.folder, stem + '.pdf')
+        temp_path = final_path + suffix if suffix == '.crdownload' else os.path.join(self.folder, stem + suffix)
+        self._write(temp_path, pause)
+        os.rename(temp_path, final_path)
+        self._done(stem)
+        return stem
+    
+    def slow_download(self, pause):
+        """A writer streaming straight into the final name (no temporary file)."""
+        stem = self._new_stem('slow')
+        self._write(os.path.join(self.folder, stem + '.pdf'), pause)
+        self._done(stem)
+        return stem
+
+
+def synthetic_pdf(order, customer, pages=3, image_kb=0, compress=True):
+    """A small but well-formed PDF: one content stream per page (order/customer on page 1), optional image."""
+    objects = []
+    for page in range(pages):
+        if page == 0:
+            lines = [b"(Orderbekr\\344ftelse) Tj", b"T* [(Ordernummer: )-20(%d)] TJ" % order,
+                     b"T* (Kundnummer: %d) Tj" % customer]
+        else:
+            lines = [b"T* (Rad %d: Artikel %d, 12 st) Tj" % (row, page * 100 + row) for row in range(40)]
+        content = b"BT /F1 10 Tf 72 720 Td 12 TL " + b"\n".join(lines) + b" ET"
+        if compress:
+            content = zlib.compress(content)
+            objects.append(b"<</Length %d /Filter /FlateDecode>>stream\n" % len(content) + content + b"\nendstream")
+        else:
+            objects.append(b"<</Length %d>>stream\n" % len(content) + content + b"\nendstream")
+    if image_kb:
+        image = os.urandom(image_kb * 1024)
+        # Scanned page in front of the text, as many scanners write it
+        objects.insert(0, b"<</Type /XObject /Subtype /Image /Filter /DCTDecode /Length %d>>stream\n" % len(image)
+                       + image + b"\nendstream")
+    body = b"%PDF-1.4\n"
+    for number, obj in enumerate(objects, 1):
+        body += b"%d 0 obj " % number + obj + b" endobj\n"
+    return body + b"%%EOF\n"
@@ -0,0 +1,59 @@
+"""Moving files into the archive: one pass over the data, on one filesystem or across two."""
+
+import errno
+import hashlib
+import os
+
+import pytest
+
+from outlook_auto_attach.archive import transfer_file
+
+CONTENT = b"%PDF-1.4\n" + os.urandom(3 * 1024 * 1024)
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "Downloads" / "Orderbekräftelse.pdf"
+    path.parent.mkdir()
+    path.write_bytes(CONTENT)
+    os.utime(path, (1_600_000_000, 1_600_000_000))
+    return path
+
+
+@pytest.fixture
+def dest(tmp_path):
+    folder = tmp_path / "businessnxtdocs"
+    folder.mkdir()
+    return folder / "Orderbekräftelse_2024.pdf"
+
+
+def test_same_filesystem_is_a_rename(source, dest):
+    assert transfer_file(str(source), str(dest)) == (DIGEST, len(CONTENT), 'rename')
+    assert not source.exists()
+    assert dest.read_bytes() == CONTENT
+
+
+@pytest.mark.parametrize('compute_hash', [True, False])
+def test_cross_device_move_copies_then_removes(source, dest, monkeypatch, compute_hash):
+    def rename(src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+    monkeypatch.setattr(os, 'rename', rename)
+    
+    digest, size, method = transfer_file(str(source), str(dest), compute_hash=compute_hash)
+    assert (digest, size, method) == (DIGEST if compute_hash else None, len(CONTENT), 'copy')
+    assert not source.exists()
+    assert dest.read_bytes() == CONTENT
+    assert os.stat(dest).st_mtime == 1_600_000_000
+    assert os.listdir(dest.parent) == [dest.name]  # No .part file left behind
+
+
+def test_failed_copy_keeps_the_original(source, dest, monkeypatch):
+    def replace(src, dst):
+        raise OSError(errno.ENOSPC, "No space left on device")
+    monkeypatch.setattr(os, 'replace', replace)
+    
+    with pytest.raises(OSError):
+        transfer_file(str(source), str(dest), allow_rename=False)
+    assert source.read_bytes() == CONTENT
+    assert os.listdir(dest.parent) == []
@@ -0,0 +1,88 @@
+"""Archive upkeep: flat copies moved into month shards, expired copies deleted, old months zipped."""
+
+import os
+import time
+import zipfile
+from datetime import datetime
+
+import pytest
+
+from outlook_auto_attach.archive import ArchiveIndex, ArchiveMaintainer
+
+DAY = 86400
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ArchiveIndex(str(tmp_path / "index.sqlite"))
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "businessnxtdocs"
+    root.mkdir()
+    return root
+
+
+def maintainer(index, root, **kwargs):
+    return ArchiveMaintainer(index, [str(root)], files_per_second=0, **kwargs)
+
+
+def archived(index, root, name, days_ago):
+    """A copy archived days_ago into its month shard, as the handler leaves it."""
+    when = time.time() - days_ago * DAY
+    folder = root / datetime.fromtimestamp(when).strftime("%Y/%m")
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / name
+    path.write_bytes(b"%PDF-1.4\n" + name.encode())
+    index.add(name, None, path.stat().st_size, str(root), str(path), when)
+    return path
+
+
+def test_flat_copies_are_moved_into_month_shards(index, root):
+    old = root / "Orderbekräftelse-1.pdf"
+    old.write_bytes(b"%PDF-1.4\n")
+    mtime = datetime(2023, 5, 17, 12).timestamp()
+    os.utime(old, (mtime, mtime))
+    (root / ".Orderbekräftelse-2.pdf.part").write_bytes(b"")
+    
+    assert maintainer(index, root).run_once()['migrated'] == 1
+    moved = root / "2023" / "05" / "Orderbekräftelse-1.pdf"
+    assert moved.exists() and not old.exists()
+    [entry] = index.find(original_name="Orderbekräftelse-1.pdf")
+    assert (entry['path'], entry['archived_at']) == (str(moved), mtime)
+    assert maintainer(index, root).run_once()['migrated'] == 0
+
+
+def test_expired_copies_are_deleted(index, root):
+    expired = archived(index, root, "old.pdf", days_ago=400)
+    kept = archived(index, root, "new.pdf", days_ago=1)
+    
+    counts = maintainer(index, root, retention_days=365).run_once()
+    assert counts['deleted'] == 1
+    assert not expired.exists() and not expired.parent.exists()  # Empty shard removed too
+    assert kept.exists()
+    assert [entry['original_name'] for entry in index.find()] == ["new.pdf"]
+
+
+def test_old_months_are_bundled_into_one_zip(index, root):
+    first = archived(index, root, "a.pdf", days_ago=100)
+    second = archived(index, root, "b.pdf", days_ago=100)
+    recent = archived(index, root, "c.pdf", days_ago=0)
+    
+    assert maintainer(index, root, compact_after_months=2).run_once()['bundled'] == 2
+    month = datetime.fromtimestamp(time.time() - 100 * DAY)
+    bundle = root / f"{month:%Y}" / f"{month:%Y-%m}.zip"
+    with zipfile.ZipFile(bundle) as z:
+        assert sorted(z.namelist()) == ["a.pdf", "b.pdf"]
+        assert z.read("a.pdf") == b"%PDF-1.4\na.pdf"
+    assert not first.exists() and not second.exists() and recent.exists()
+    entry = index.find(original_name="a.pdf")[0]
+    assert (entry['path'], entry['member']) == (str(bundle), "a.pdf")
+    
+    # Bundles expire as a whole once their newest member is past retention
+    counts = maintainer(index, root, retention_days=50).run_once()
+    assert counts['bundles_deleted'] == 1 and not bundle.exists()
+    assert [entry['original_name'] for entry in index.find()] == ["c.pdf"]
@@ -0,0 +1,88 @@
+"""Batch mode: existing files through the pipeline, a dry run of the same checks, and the exit status."""
+
+import argparse
+import hashlib
+import json
+import os
+
+from outlook_auto_attach import mail
+from outlook_auto_attach.settings import DEFAULT_CONFIG
+from outlook_auto_attach.journal import DedupJournal
+from outlook_auto_attach.batch import run_batch
+from outlook_auto_attach.cli import batch_main
+
+from fakes import RecordingMailBackend, synthetic_pdf
+
+NAME = "Orderbekräftelse 123456 kundnr 1001.pdf"
+CONTENT = synthetic_pdf(123456, 1001)
+
+
+def drafted_before(tmp_path, copy_exists):
+    """A download whose content the journal lists as drafted, with or without its archived copy."""
+    copy = tmp_path / "archived.pdf"
+    if copy_exists:
+        copy.write_bytes(CONTENT)
+    content_hash = hashlib.sha256(CONTENT).hexdigest()
+    journal = DedupJournal()
+    journal.record(content_hash, len(CONTENT), NAME, str(copy), DedupJournal.PENDING)
+    journal.set_outcome(content_hash, DedupJournal.DRAFTED)
+    journal.close()
+    path = tmp_path / NAME
+    path.write_bytes(CONTENT)
+    return str(path)
+
+
+def dry_run_outcome(path, policy):
+    config = dict(DEFAULT_CONFIG, duplicate_policy=policy)
+    return run_batch([path], config, dry_run=True)['results'][0]['outcome']
+
+
+def test_dry_run_reports_duplicates_like_processing(tmp_path):
+    path = drafted_before(tmp_path, copy_exists=True)
+    assert dry_run_outcome(path, 'skip') == 'duplicate'
+    assert dry_run_outcome(path, 'reuse') == 'duplicate'
+    assert dry_run_outcome(path, 'allow') == 'would_archive'
+
+
+def test_dry_run_reuse_without_archived_copy_would_archive(tmp_path):
+    # Processing drafts it as a new file when the copy to reuse is gone - the dry run must say so too
+    path = drafted_before(tmp_path, copy_exists=False)
+    assert dry_run_outcome(path, 'reuse') == 'would_archive'
+
+
+def test_batch_archives_and_drafts_matching_files(tmp_path, monkeypatch):
+    backend = RecordingMailBackend()
+    monkeypatch.setattr(mail, '_mail_backend', backend)
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    for order in (7001, 7002):
+        (inputs / f"Orderbekräftelse {order}.pdf").write_bytes(synthetic_pdf(order, 1001))
+    (inputs / "holiday.jpg").write_bytes(b"JPEG")
+    config = dict(DEFAULT_CONFIG, archive_dir=str(tmp_path / "archive"))
+    
+    summary = run_batch([str(inputs), str(tmp_path / "missing.pdf")], config, jobs=2)
+    assert summary['outcomes'] == {'drafted': 2, 'no_match': 1, 'missing': 1}
+    assert summary['failed'] == 1
+    # Coalesced into one draft with both archived copies
+    [draft] = backend.drafts
+    archived = sorted(entry['archived'] for entry in summary['results'] if entry['outcome'] == 'drafted')
+    assert sorted(draft['attachments']) == archived
+    assert all(path.startswith(str(tmp_path / "archive")) and os.path.exists(path) for path in archived)
+    assert sorted(os.listdir(inputs)) == ["holiday.jpg"]
+
+
+def test_exit_status_reports_failed_files(tmp_path):
+    path = tmp_path / "Orderbekräftelse 7101.pdf"
+    path.write_bytes(synthetic_pdf(7101, 1001))
+    output = tmp_path / "summary.json"
+    config = dict(DEFAULT_CONFIG, archive_dir=str(tmp_path / "archive"))
+    
+    def batch(*inputs):
+        args = argparse.Namespace(inputs=[str(item) for item in inputs], jobs=2, dry_run=True, coalesce=True,
+                                  recursive=False, output=str(output))
+        status = batch_main(args, config)
+        with open(output, encoding='utf-8') as f:
+            return status, json.load(f)['outcomes']
+    
+    assert batch(path) == (0, {'would_archive': 1})
+    assert batch(path, tmp_path / "missing.pdf") == (1, {'would_archive': 1, 'missing': 1})
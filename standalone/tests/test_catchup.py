@@ -0,0 +1,94 @@
+"""Catch-up watermark: files picked up but never handled are found again after a restart."""
+
+import os
+import time
+
+from outlook_auto_attach.catchup import CatchUpScanner
+from outlook_auto_attach.handler import DownloadsHandler
+
+from conftest import wait_for
+from fakes import RecordingMailBackend
+
+
+def download(folder, name, offset):
+    """A matching file whose arrival time is `offset` seconds from now (mtime wins over ctime)."""
+    path = os.path.join(str(folder), name)
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+    arrival = time.time_ns() + offset * 1_000_000_000
+    os.utime(path, ns=(arrival, arrival))
+    return path
+
+
+def test_first_run_starts_from_now(tmp_path):
+    state = str(tmp_path / "watermark.json")
+    download(tmp_path, "Orderbekräftelse 1 kundnr 1.pdf", -100)
+    assert CatchUpScanner(state).scan(str(tmp_path)) == []
+    
+    later = download(tmp_path, "Orderbekräftelse 2 kundnr 1.pdf", 100)
+    assert CatchUpScanner(state).scan(str(tmp_path)) == [later]
+
+
+def test_older_failed_file_is_found_after_restart(tmp_path):
+    state = str(tmp_path / "watermark.json")
+    scanner = CatchUpScanner(state)
+    scanner.scan(str(tmp_path))
+    older = download(tmp_path, "Orderbekräftelse 1 kundnr 1.pdf", 100)
+    newer = download(tmp_path, "Orderbekräftelse 2 kundnr 1.pdf", 200)
+    older_stat, newer_stat = os.stat(older), os.stat(newer)
+    scanner.track(str(tmp_path), older, older_stat)
+    scanner.track(str(tmp_path), newer, newer_stat)
+    
+    # The newer file is drafted, the older one fails and stays open
+    scanner.handled(str(tmp_path), newer, newer_stat)
+    assert scanner.watermark(str(tmp_path)) <= CatchUpScanner.arrival_time(older_stat)
+    assert older in CatchUpScanner(state).scan(str(tmp_path))
+    
+    # Once the older file is handled too, the mark moves past both
+    scanner.handled(str(tmp_path), older, older_stat)
+    assert CatchUpScanner(state).scan(str(tmp_path)) == []
+
+
+def test_released_file_does_not_hold_the_mark(tmp_path):
+    state = str(tmp_path / "watermark.json")
+    scanner = CatchUpScanner(state)
+    scanner.scan(str(tmp_path))
+    gone = download(tmp_path, "Orderbekräftelse 1 kundnr 1.pdf", 100)
+    kept = download(tmp_path, "Orderbekräftelse 2 kundnr 1.pdf", 200)
+    scanner.track(str(tmp_path), gone, os.stat(gone))
+    scanner.track(str(tmp_path), kept, os.stat(kept))
+    scanner.handled(str(tmp_path), kept, os.stat(kept))
+    os.remove(gone)
+    scanner.release(str(tmp_path), gone)
+    
+    assert CatchUpScanner(state).scan(str(tmp_path)) == []
+
+
+def test_download_that_failed_before_a_restart_is_drafted_after_it(scheduler, tmp_path):
+    downloads = tmp_path / "Downloads"
+    downloads.mkdir()
+    state = str(tmp_path / "watermark.json")
+    backend = RecordingMailBackend()
+    
+    def run(fail=False):
+        handler = DownloadsHandler(str(downloads), scheduler=scheduler, mail_backend=backend,
+                                   archive_dir=str(tmp_path / "businessnxtdocs"),
+                                   catch_up_scanner=CatchUpScanner(state))
+        if fail:
+            def process_file(file_path, received=None):
+                raise OSError("disk full")
+            handler.process_file = process_file
+        return handler
+    
+    first = run(fail=True)
+    assert first.catch_up() == 0  # First run: starts from now
+    path = download(downloads, "Orderbekräftelse 1 kundnr 1.pdf", 0)
+    assert first._accept_event(path) and first._enqueue(path)
+    assert wait_for(lambda: first.metrics.counts().get('failed_processing') == 1)
+    
+    # Restarted: the failed download is caught up and drafted, then not again
+    second = run()
+    assert second.catch_up() == 1
+    assert wait_for(lambda: backend.drafts, timeout=10.0)
+    assert wait_for(lambda: not scheduler.busy())
+    assert run().catch_up() == 0
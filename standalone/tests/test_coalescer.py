@@ -0,0 +1,60 @@
+"""Burst coalescing: related downloads share one draft, within the window and the size limits."""
+
+import threading
+
+from outlook_auto_attach.drafts import DraftCoalescer
+from outlook_auto_attach.handler import DownloadsHandler
+
+from conftest import wait_for
+from fakes import RecordingMailBackend
+
+
+def collector():
+    sent = []
+    
+    def send(group_key, items):
+        sent.append((group_key, [item['path'] for item in items], threading.current_thread().name))
+    return sent, send
+
+
+def test_files_of_a_group_within_the_window_share_a_draft(scheduler):
+    sent, send = collector()
+    coalescer = DraftCoalescer(send, scheduler=scheduler, window=0.1)
+    for path in ("a1", "a2", "a3"):
+        coalescer.add('order', path, 100)
+    coalescer.add('invoice', "b1", 100)
+    assert coalescer.pending() == 4
+    assert wait_for(lambda: len(sent) == 2)
+    assert sorted((key, paths) for key, paths, _ in sent) == [('invoice', ["b1"]), ('order', ["a1", "a2", "a3"])]
+    # The end-of-window flush runs on the scheduler, not in add()
+    assert all(thread.startswith(scheduler.name) for _, _, thread in sent)
+    assert coalescer.pending() == 0
+
+
+def test_full_groups_are_sent_without_waiting_for_the_window(scheduler):
+    sent, send = collector()
+    coalescer = DraftCoalescer(send, scheduler=scheduler, window=60.0, max_attachments=2,
+                               max_total_bytes=1000)
+    for path in ("a1", "a2", "a3"):
+        coalescer.add('order', path, 100)
+    assert [paths for _, paths, _ in sent] == [["a1", "a2"]]
+    # A file that would go over the size limit starts a new group
+    coalescer.add('order', "a4", 950)
+    assert [paths for _, paths, _ in sent] == [["a1", "a2"], ["a3"]]
+    coalescer.flush_all()
+    assert [paths for _, paths, _ in sent] == [["a1", "a2"], ["a3"], ["a4"]]
+    assert (coalescer.groups_sent, coalescer.files_sent) == (3, 4)
+
+
+def test_burst_of_downloads_becomes_one_draft_per_document_type(scheduler, tmp_path):
+    downloads = tmp_path / "Downloads"
+    downloads.mkdir()
+    backend = RecordingMailBackend()
+    handler = DownloadsHandler(str(downloads), scheduler=scheduler, mail_backend=backend,
+                               archive_dir=str(tmp_path / "businessnxtdocs"), coalesce_window=0.2)
+    for name in ("Orderbekräftelse 1.pdf", "Inköpsorder 1.pdf", "Orderbekräftelse 2.pdf", "Orderbekräftelse 3.pdf"):
+        path = downloads / name
+        path.write_bytes(b"%PDF-1.4\n" + name.encode())
+        assert handler.process_file(str(path))[0] == 'archived'
+    assert wait_for(lambda: len(backend.drafts) == 2)
+    assert sorted(len(draft['attachments']) for draft in backend.drafts) == [1, 3]
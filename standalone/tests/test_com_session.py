@@ -0,0 +1,91 @@
+import threading
+
+from outlook_auto_attach.mail import PENDING, OutlookComSession
+
+from conftest import wait_for
+from fakes import FakeOutlookApplication
+
+
+def make_session(outlook, timeout=5.0):
+    connects = []
+    
+    def connect():
+        connects.append(outlook)
+        return outlook
+    session = OutlookComSession(connect=connect, com_init=lambda: None, com_uninit=lambda: None,
+                                timeout=timeout)
+    return session, connects
+
+
+def attachment(tmp_path, name="Orderbekräftelse.pdf"):
+    path = tmp_path / name
+    path.write_bytes(b'%PDF-1.4\n')
+    return str(path)
+
+
+def test_drafts_run_on_one_thread_with_one_connection(tmp_path):
+    outlook = FakeOutlookApplication(display_ms=0)
+    session, connects = make_session(outlook)
+    threads_seen = set()
+    original = session._create_draft
+    
+    def create_draft(job):
+        threads_seen.add(threading.current_thread().name)
+        return original(job)
+    session._create_draft = create_draft
+    
+    path = attachment(tmp_path)
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(session.open_draft([path], to="a@b.se",
+                                                                                 subject="Order 1")))
+               for _ in range(5)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    session.close()
+    assert results == [(True, "Outlook opened successfully")] * 5
+    assert len(outlook.displayed) == 5
+    assert len(connects) == 1
+    assert threads_seen == {"OutlookCOM"}
+    assert outlook.displayed[0].To == "a@b.se" and outlook.displayed[0].Subject == "Order 1"
+
+
+def test_dead_proxy_is_reconnected(tmp_path):
+    outlooks = [FakeOutlookApplication(display_ms=0, lifetime=1), FakeOutlookApplication(display_ms=0)]
+    session = OutlookComSession(connect=lambda: outlooks[session.connects],
+                                com_init=lambda: None, com_uninit=lambda: None)
+    path = attachment(tmp_path)
+    assert session.open_draft([path])[0]
+    assert session.open_draft([path])[0]
+    session.close()
+    assert session.connects == 2
+    assert [len(outlook.displayed) for outlook in outlooks] == [1, 1]
+
+
+def test_timed_out_queued_draft_is_not_opened_later(tmp_path):
+    gate = threading.Event()
+    outlook = FakeOutlookApplication(display_ms=0, gate=gate)
+    session, _ = make_session(outlook, timeout=0.2)
+    path = attachment(tmp_path)
+    
+    results = {}
+    late = []
+    first = threading.Thread(target=lambda: results.setdefault(
+        'first', session.open_draft([path], on_done=lambda *result: late.append(result))))
+    first.start()
+    # The first draft is stuck in Display() - the second one waits in the queue behind it
+    assert wait_for(lambda: outlook.created == 1)
+    results['second'] = session.open_draft([path])
+    first.join()
+    assert late == []
+    gate.set()
+    session.close()
+    
+    # Started but not finished: pending, neither drafted nor failed until Outlook is done with it
+    assert results['first'] == (PENDING, "Draft still opening in Outlook")
+    assert late == [(True, "Outlook opened successfully")]
+    # Never started: failed, and skipped by the COM thread so the retry is the only draft
+    assert results['second'] == (False, "Timeout opening Outlook")
+    assert outlook.created == 1
+    assert len(outlook.displayed) == 1
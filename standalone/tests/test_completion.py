@@ -0,0 +1,68 @@
+"""Download completion: drafts start once the browser is done, through the real observer."""
+
+import os
+
+import pytest
+from watchdog.observers import Observer
+
+from outlook_auto_attach.completion import DownloadCompletionDetector
+from outlook_auto_attach.handler import DownloadsHandler
+
+from conftest import wait_for
+from fakes import BrowserSimulator, RecordingMailBackend
+
+SIZE = 256 * 1024
+
+
+@pytest.fixture
+def watched(scheduler, tmp_path):
+    """(BrowserSimulator, RecordingMailBackend) for a Downloads folder watched by the app's observer."""
+    downloads = tmp_path / "Downloads"
+    downloads.mkdir()
+    backend = RecordingMailBackend()
+    handler = DownloadsHandler(str(downloads), scheduler=scheduler, mail_backend=backend,
+                               archive_dir=str(tmp_path / "businessnxtdocs"), coalesce_window=0.0)
+    observer = Observer()
+    observer.schedule(handler, str(downloads), recursive=False)
+    observer.start()
+    yield BrowserSimulator(str(downloads), SIZE), backend
+    observer.stop()
+    observer.join(timeout=5)
+
+
+@pytest.mark.parametrize('suffix', ['.crdownload', '.tmp'])
+def test_renamed_download_is_drafted_once_complete(watched, scheduler, suffix):
+    simulator, backend = watched
+    stem = simulator.rename_download(suffix)
+    assert wait_for(lambda: backend.drafts, timeout=10.0)
+    # Later events for the same download (modify, close, the rename) must not open a second draft
+    assert wait_for(lambda: not scheduler.busy())
+    (draft,) = backend.drafts
+    (path,) = draft['attachments']
+    assert path.endswith(".pdf") and os.path.getsize(path) == SIZE
+    assert draft['time'] >= simulator.completed[stem]
+
+
+def test_slow_writer_is_not_drafted_before_the_last_chunk(watched, scheduler):
+    simulator, backend = watched
+    stem = simulator.slow_download(pause=0.02)  # About 80 ms between the first and the last chunk
+    assert wait_for(lambda: backend.drafts, timeout=10.0)
+    # Later events for the same download (modify, close, the rename) must not open a second draft
+    assert wait_for(lambda: not scheduler.busy())
+    (draft,) = backend.drafts
+    assert os.path.getsize(draft['attachments'][0]) == SIZE
+    assert draft['time'] >= simulator.completed[stem]
+
+
+def test_detector_waits_for_two_equal_checks(tmp_path):
+    path = tmp_path / "Orderbekräftelse 0001.pdf"
+    path.write_bytes(b"%PDF-1.4\n")
+    detector = DownloadCompletionDetector(first_delay=0.01)
+    state = detector.start(str(path))
+    assert detector.check(state)[0] == detector.PENDING
+    with open(path, 'ab') as f:
+        f.write(b"more")
+    assert detector.check(state)[0] == detector.PENDING
+    assert detector.check(state)[0] == detector.READY
+    path.unlink()
+    assert detector.check(detector.start(str(path)))[0] == detector.GONE
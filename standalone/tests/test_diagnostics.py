@@ -0,0 +1,87 @@
+"""Diagnostics: thread dumps, memory snapshots and sampling profiles of the running app."""
+
+import os
+import threading
+import tracemalloc
+
+import pytest
+
+from outlook_auto_attach.metrics import Metrics
+from outlook_auto_attach.diagnostics import DIAGNOSTICS_ENV, Diagnostics
+
+from conftest import wait_for
+
+
+@pytest.fixture
+def diagnostics(tmp_path):
+    metrics = Metrics()
+    metrics.increment('archived')
+    return Diagnostics(output_dir=str(tmp_path / "diagnostics"), metrics=metrics, sample_interval=0.002)
+
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    
+    def checksum_loop():
+        while not stop.is_set():
+            sum(range(1000))
+    thread = threading.Thread(target=checksum_loop, name="busy-worker", daemon=True)
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+def read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_diagnostics_are_opt_in(monkeypatch):
+    monkeypatch.delenv(DIAGNOSTICS_ENV, raising=False)
+    assert not Diagnostics.enabled({'diagnostics': False})
+    assert Diagnostics.enabled({'diagnostics': True})
+    monkeypatch.setenv(DIAGNOSTICS_ENV, '1')
+    assert Diagnostics.enabled({})
+
+
+def test_thread_dump_has_every_thread_and_the_statistics(diagnostics, busy_thread):
+    report = read(diagnostics.thread_dump())
+    assert "--- busy-worker" in report and "checksum_loop" in report
+    assert '"archived": 1' in report
+
+
+def test_memory_snapshot_reports_growth_since_the_previous_one(diagnostics):
+    was_tracing = tracemalloc.is_tracing()
+    try:
+        first = read(diagnostics.memory_snapshot())
+        assert was_tracing or "this snapshot is the baseline" in first
+        grown = [bytearray(1024) for _ in range(2000)]
+        second = read(diagnostics.memory_snapshot())
+        assert "growth since the previous snapshot" in second
+        assert "test_diagnostics.py" in second
+        del grown
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+
+def test_cpu_profile_finds_the_busy_thread(diagnostics, busy_thread):
+    path = diagnostics.cpu_profile(0.3, wait=True)
+    report = read(path)
+    assert "checksum_loop (test_diagnostics.py" in report
+    collapsed = read(os.path.splitext(path)[0] + ".collapsed")
+    assert any(line.startswith("busy-worker;") for line in collapsed.splitlines())
+
+
+def test_one_cpu_profile_at_a_time(diagnostics):
+    assert diagnostics.cpu_profile(0.3) is None  # Runs in the background
+    assert diagnostics.cpu_profile(0.3, wait=True) is None  # Refused while the first one runs
+    
+    def reports():
+        if not os.path.isdir(diagnostics.output_dir):
+            return []
+        return [name for name in os.listdir(diagnostics.output_dir) if name.endswith(".txt")]
+    assert wait_for(lambda: len(reports()) == 1)
+    assert len(reports()) == 1
@@ -0,0 +1,106 @@
+"""Duplicate downloads: checked before the move into the archive, and drafted like new files under 'reuse'."""
+
+import hashlib
+import os
+import time
+
+import pytest
+
+from outlook_auto_attach.settings import DEFAULT_CONFIG
+from outlook_auto_attach.prefill import OrderExtractor, RecipientIndex
+from outlook_auto_attach.journal import DedupJournal
+from outlook_auto_attach.handler import DownloadsHandler
+
+from conftest import wait_for
+from fakes import RecordingMailBackend, synthetic_pdf
+
+NAME = "Orderbekräftelse 123456 kundnr 1001.pdf"
+CONTENT = synthetic_pdf(123456, 1001)
+
+
+@pytest.fixture
+def downloads(tmp_path):
+    folder = tmp_path / "Downloads"
+    folder.mkdir()
+    return folder
+
+
+def make_handler(scheduler, tmp_path, downloads, policy, **kwargs):
+    journal = DedupJournal(str(tmp_path / "journal.sqlite"))
+    backend = RecordingMailBackend()
+    handler = DownloadsHandler(str(downloads), scheduler=scheduler, journal=journal, duplicate_policy=policy,
+                               archive_dir=str(tmp_path / "businessnxtdocs"), mail_backend=backend,
+                               coalesce_window=0.0, **kwargs)
+    return handler, backend
+
+
+def drafted(handler, backend):
+    """Process the first download and wait until its draft is recorded in the journal."""
+    outcome, archived = handler.process_file(download(handler, NAME))
+    assert outcome == 'archived'
+    content_hash = hashlib.sha256(CONTENT).hexdigest()
+    assert wait_for(lambda: (handler.journal.lookup(content_hash) or {}).get('outcome') == DedupJournal.DRAFTED)
+    assert len(backend.drafts) == 1
+    return archived
+
+
+def download(handler, name):
+    path = os.path.join(handler.downloads_folder, name)
+    with open(path, 'wb') as f:
+        f.write(CONTENT)
+    return path
+
+
+def test_skipped_duplicate_stays_in_downloads(scheduler, tmp_path, downloads):
+    handler, backend = make_handler(scheduler, tmp_path, downloads, 'skip')
+    drafted(handler, backend)
+    
+    again = download(handler, "Orderbekräftelse 123456 kundnr 1001 (1).pdf")
+    assert handler.process_file(again) == ('duplicate', None)
+    assert os.path.exists(again)
+    assert len(os.listdir(handler.downloads_folder)) == 1
+    assert len(backend.drafts) == 1
+    handler.journal.close()
+
+
+def test_reused_duplicate_gets_the_prefill_of_a_new_file(scheduler, tmp_path, downloads):
+    recipients_file = tmp_path / "recipients.csv"
+    recipients_file.write_text("customer;email\n1001;inkop@example.se\n", encoding='utf-8')
+    recipients = RecipientIndex(str(recipients_file))
+    recipients.refresh()
+    extractor = OrderExtractor(DEFAULT_CONFIG['prefill_patterns'], scheduler=scheduler)
+    handler, backend = make_handler(scheduler, tmp_path, downloads, 'reuse',
+                                    extractor=extractor, recipients=recipients)
+    archived = drafted(handler, backend)
+    
+    again = download(handler, "Orderbekräftelse 123456 kundnr 1001 (1).pdf")
+    assert handler.process_file(again) == ('duplicate', None)
+    assert os.path.exists(again)
+    assert wait_for(lambda: len(backend.drafts) == 2)
+    assert backend.drafts[1]['attachments'] == [archived]
+    assert backend.drafts[1]['to'] == backend.drafts[0]['to'] == "inkop@example.se"
+    extractor.close()
+    handler.journal.close()
+
+
+def test_duplicate_window_runs_from_the_draft_not_the_last_sighting(tmp_path, monkeypatch):
+    journal = DedupJournal(str(tmp_path / "journal.sqlite"))
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    journal.record("abc", 10, "/Downloads/a.pdf", "/archive/a.pdf", DedupJournal.PENDING)
+    journal.set_outcome("abc", DedupJournal.DRAFTED)
+    # Re-downloaded every 10 days: suppressed sightings must not keep the window open
+    for _ in range(2):
+        now[0] += 10 * 86400
+        assert journal.find_duplicate("abc", 30 * 86400) is not None
+        journal.record_duplicate("abc")
+    now[0] += 20 * 86400
+    assert journal.find_duplicate("abc", 30 * 86400) is None
+    assert journal.lookup("abc")['seen_count'] == 3
+    
+    # Drafted again: the window starts over
+    journal.record("abc", 10, "/Downloads/a (1).pdf", "/archive/a-2.pdf", DedupJournal.PENDING)
+    journal.set_outcome("abc", DedupJournal.DRAFTED)
+    now[0] += 20 * 86400
+    assert journal.find_duplicate("abc", 30 * 86400)['source_path'] == "/Downloads/a (1).pdf"
+    journal.close()
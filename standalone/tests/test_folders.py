@@ -0,0 +1,47 @@
+"""Watch roots: every configured folder once, each with its own rules and archive folder."""
+
+import os
+
+from outlook_auto_attach.settings import DEFAULT_CONFIG
+from outlook_auto_attach.folders import get_profile_downloads_folders, load_watch_roots
+
+
+def config(watch_roots):
+    return dict(DEFAULT_CONFIG, watch_roots=watch_roots, archive_dir="~/archive")
+
+
+def test_same_folder_is_watched_once(tmp_path):
+    downloads = os.path.join(os.path.expanduser("~"), "Downloads")
+    os.makedirs(downloads, exist_ok=True)
+    alias = tmp_path / "downloads-link"
+    alias.symlink_to(downloads, target_is_directory=True)
+    scans = tmp_path / "Scans"
+    scans.mkdir()
+    
+    roots = load_watch_roots(config([
+        'downloads',
+        downloads + os.sep,
+        str(alias),
+        {'path': str(scans), 'recursive': True, 'max_depth': 2, 'archive_dir': str(tmp_path / "scans-archive"),
+         'rules': [{'name': 'Scan', 'globs': ['scan-*.pdf']}]},
+        str(scans),
+    ]))
+    assert [root.path for root in roots] == [os.path.normpath(downloads), str(scans)]
+    assert roots[0].rules is None and roots[0].archive_dir == "~/archive"
+    assert (roots[1].recursive, roots[1].max_depth) == (True, 2)
+    assert roots[1].rules.classify("scan-001.pdf").name == 'Scan'
+    assert roots[1].archive_dir == str(tmp_path / "scans-archive")
+
+
+def test_invalid_and_missing_roots_fall_back_to_downloads(tmp_path):
+    invalid = [{'nopath': True}, str(tmp_path / "missing"), {'path': str(tmp_path), 'rules': [{}]}]
+    roots = load_watch_roots(config(invalid))
+    assert [root.path for root in roots] == [os.path.normpath(os.path.join(os.path.expanduser("~"), "Downloads"))]
+
+
+def test_profile_downloads_folders(tmp_path):
+    for profile, folder in [("anna", "Downloads"), ("bengt", "Hämtade filer"), ("Public", "Downloads"),
+                            ("Default", "Downloads"), ("cecilia", "Desktop")]:
+        (tmp_path / profile / folder).mkdir(parents=True)
+    found = sorted(get_profile_downloads_folders(str(tmp_path)))
+    assert found == [str(tmp_path / "anna" / "Downloads"), str(tmp_path / "bengt" / "Hämtade filer")]
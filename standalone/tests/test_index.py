@@ -0,0 +1,53 @@
+"""Processed-file index: duplicate events are ignored until the entry expires or is evicted."""
+
+import types
+
+import pytest
+
+from outlook_auto_attach import journal
+from outlook_auto_attach.journal import ProcessedFileIndex
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock of the journal module, moved by hand."""
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(journal, 'time', types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_same_path_and_mtime_is_claimed_once(clock):
+    index = ProcessedFileIndex()
+    assert index.claim("a.pdf", 1.0)
+    assert not index.claim("a.pdf", 1.0)
+    # A new file under the same name
+    assert index.claim("a.pdf", 2.0)
+    index.discard("a.pdf")
+    assert "a.pdf" not in index
+    assert index.claim("a.pdf", 2.0)
+
+
+def test_entries_expire_after_ttl(clock):
+    index = ProcessedFileIndex(ttl=60.0)
+    index.claim("a.pdf", 1.0)
+    clock.now += 59.0
+    assert "a.pdf" in index
+    clock.now += 1.0
+    assert "a.pdf" not in index
+    assert index.claim("a.pdf", 1.0)
+    
+    # Expired entries are dropped on the next claim
+    clock.now += 60.0
+    index.claim("b.pdf", 1.0)
+    assert len(index) == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    index = ProcessedFileIndex(max_entries=2)
+    index.claim("a.pdf", 1.0)
+    index.claim("b.pdf", 1.0)
+    index.claim("a.pdf", 1.0)  # Duplicate event - a.pdf is now the most recently used
+    index.claim("c.pdf", 1.0)
+    assert len(index) == 2
+    assert "a.pdf" in index and "c.pdf" in index
+    assert "b.pdf" not in index
@@ -0,0 +1,99 @@
+"""Single instance: one lock holder, and later launches hand their command to it over IPC."""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from outlook_auto_attach.settings import SYSTEM
+from outlook_auto_attach.instance import InstanceLock, InstanceServer, send_instance_command
+
+from conftest import APP_SCRIPT, wait_for
+
+
+def test_second_lock_fails_until_the_first_is_released(tmp_path):
+    path = str(tmp_path / "instance.lock")
+    first, second = InstanceLock(path), InstanceLock(path)
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+@pytest.fixture
+def server():
+    folder = tempfile.mkdtemp(prefix="ipc-")  # Short path: Unix socket addresses are limited to ~100 bytes
+    address = None if SYSTEM == 'Windows' else os.path.join(folder, "instance.sock")
+    info_path = os.path.join(folder, "instance.json")
+    server = InstanceServer({'ping': lambda: {'ok': True, 'pid': os.getpid()},
+                             'echo': lambda **args: {'ok': True, 'args': args}},
+                            address=address, info_path=info_path).start()
+    yield server
+    server.stop()
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+def test_commands_are_answered_by_the_running_instance(server):
+    assert send_instance_command('ping', info_path=server.info_path) == {'ok': True, 'pid': os.getpid()}
+    reply = send_instance_command('echo', {'paths': ["a.pdf"]}, info_path=server.info_path)
+    assert reply == {'ok': True, 'args': {'paths': ["a.pdf"]}}
+    assert not send_instance_command('nope', info_path=server.info_path)['ok']
+    assert server.handled == 3
+
+
+def test_wrong_key_is_rejected(server):
+    with open(server.info_path, encoding='utf-8') as f:
+        info = json.load(f)
+    info['authkey'] = os.urandom(32).hex()
+    forged = server.info_path + ".forged"
+    with open(forged, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    with pytest.raises(OSError):
+        send_instance_command('ping', timeout=0.2, info_path=forged)
+    assert send_instance_command('ping', info_path=server.info_path)['ok']
+
+
+def test_second_launch_hands_over_and_quit_stops_the_first():
+    # The IPC socket lives in the log folder under HOME - keep the path short
+    home = Path(tempfile.mkdtemp(prefix="home-"))
+    (home / "Downloads").mkdir()
+    env = dict(os.environ, HOME=str(home), USERPROFILE=str(home))
+    info_path = home / "Library" / "Logs" / "OutlookAutoAttach" / "instance.json"
+    first = subprocess.Popen([sys.executable, APP_SCRIPT, '--headless'], env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        assert wait_for(info_path.exists, timeout=30.0)
+        document = home / "Orderbekräftelse 1.pdf"
+        document.write_bytes(b"%PDF-1.4\n")
+        second = subprocess.run([sys.executable, APP_SCRIPT, '--headless', 'process', str(document)], env=env,
+                                capture_output=True, text=True, timeout=30)
+        assert second.returncode == 0, second.stderr
+        assert json.loads(second.stdout) == {'ok': True, 'files': {str(document): 'queued'}}
+        assert first.poll() is None
+        
+        # A batch would race the watcher for the same files - it is handed over too
+        other = home / "Orderbekräftelse 2.pdf"
+        other.write_bytes(b"%PDF-1.4\n")
+        batch = subprocess.run([sys.executable, APP_SCRIPT, 'batch', str(other)], env=env,
+                               capture_output=True, text=True, timeout=30)
+        assert batch.returncode == 0, batch.stderr
+        assert json.loads(batch.stdout) == {'ok': True, 'files': {str(other): 'queued'}}
+        
+        quit_ = subprocess.run([sys.executable, APP_SCRIPT, '--headless', 'quit'], env=env,
+                               capture_output=True, text=True, timeout=30)
+        assert quit_.returncode == 0, quit_.stderr
+        start = time.monotonic()
+        assert first.wait(timeout=30) == 0
+        assert time.monotonic() - start < 15
+    finally:
+        if first.poll() is None:
+            first.kill()
+            first.wait()
+        shutil.rmtree(home, ignore_errors=True)
@@ -0,0 +1,25 @@
+"""Large attachments: zipped in the process pool, handed on from a scheduler worker."""
+
+import os
+import threading
+import zipfile
+
+from outlook_auto_attach.large_attachments import LargeAttachmentStage
+
+
+def test_zipped_parts_are_handed_on_from_a_scheduler_worker(scheduler, tmp_path):
+    source = tmp_path / "Scan.pdf"
+    source.write_bytes(b"%PDF-1.4\n" + b"0123456789abcdef" * 16384)  # 256 KB, compresses well
+    stage = LargeAttachmentStage(64 * 1024, output_dir=str(tmp_path / "large"), scheduler=scheduler)
+    handed_on = []
+    stage.submit(str(source), source.name, lambda parts: handed_on.append((parts, threading.current_thread().name)))
+    assert stage.wait(30)
+    stage.close()
+    
+    (parts, thread_name), = handed_on
+    assert thread_name.startswith(scheduler.name)
+    assert len(parts) == 1 and parts[0]['filename'].endswith(".zip")
+    with zipfile.ZipFile(parts[0]['path']) as bundle:
+        assert bundle.read(bundle.namelist()[0]) == source.read_bytes()
+    assert os.path.getsize(parts[0]['path']) == parts[0]['size'] < 64 * 1024
+    assert stage.stats()['files'] == 1
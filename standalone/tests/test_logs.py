@@ -0,0 +1,63 @@
+"""Logging: JSON lines through the background listener, tagged with the correlation id of the download."""
+
+import json
+import logging
+
+import pytest
+
+from outlook_auto_attach.logs import log_context, setup_logging
+
+from conftest import wait_for
+
+logger = logging.getLogger("outlook_auto_attach.test")
+
+
+@pytest.fixture
+def log_lines(tmp_path):
+    """Log as JSON lines into a temporary file; returns a function reading the lines written so far."""
+    root = logging.getLogger()
+    saved = list(root.handlers), root.level
+    log_file = tmp_path / "app.log"
+    listener = setup_logging(level='DEBUG', log_format='json', log_file=str(log_file))
+    running = [True]
+    
+    def log_lines():
+        listener.stop()  # Flushes the queue
+        running[0] = False
+        with open(log_file, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    yield log_lines
+    if running[0]:
+        listener.stop()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in saved[0]:
+        root.addHandler(handler)
+    root.setLevel(saved[1])
+
+
+def test_records_are_json_with_correlation_id_and_traceback(log_lines):
+    logger.info("Outside any download")
+    with log_context("abcd1234"):
+        logger.info("Processing file: %s", "Orderbekräftelse 1.pdf")
+        try:
+            raise ValueError("broken PDF")
+        except ValueError:
+            logger.exception("Error processing file")
+    
+    outside, processing, error = log_lines()
+    assert outside['correlation_id'] == '-'
+    assert (processing['correlation_id'], processing['level']) == ("abcd1234", 'INFO')
+    assert processing['message'] == "Processing file: Orderbekräftelse 1.pdf"
+    assert error['message'] == "Error processing file"
+    assert error['exception'].startswith("Traceback") and "ValueError: broken PDF" in error['exception']
+
+
+def test_correlation_id_follows_work_to_the_scheduler(log_lines, scheduler):
+    done = []
+    with log_context("feed0001"):
+        scheduler.submit(lambda: (logger.info("On a worker"), done.append(True)))
+    assert wait_for(lambda: done)
+    [record] = log_lines()
+    assert record['correlation_id'] == "feed0001"
+    assert record['thread'] != "MainThread"
@@ -0,0 +1,54 @@
+"""Metrics: counters and per-stage latency histograms, exported as JSON and Prometheus text."""
+
+import json
+
+from outlook_auto_attach.metrics import Metrics
+
+
+def test_snapshot_summarizes_stages_in_milliseconds():
+    metrics = Metrics(buckets=(0.001, 0.01, 0.1))
+    for seconds in [0.0005] * 90 + [0.05] * 9 + [2.0]:
+        metrics.observe('archive', seconds)
+    metrics.increment('archived')
+    metrics.increment('archived', 2)
+    
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == {'archived': 3}
+    stage = snapshot['stages']['archive']
+    assert stage['count'] == 100
+    # Percentiles are bucket bounds, capped at the largest value seen
+    assert (stage['p50_ms'], stage['p95_ms'], stage['p99_ms'], stage['max_ms']) == (1.0, 100.0, 100.0, 2000.0)
+    assert stage['mean_ms'] == round((0.0005 * 90 + 0.05 * 9 + 2.0) / 100 * 1000, 2)
+
+
+def test_gauges_keep_numbers_only_and_survive_failing_sources():
+    metrics = Metrics()
+    metrics.register_gauges('scheduler', lambda: {'pending': 3, 'running': True, 'name': "Worker"})
+    metrics.register_gauges('broken', lambda: 1 / 0)
+    assert metrics.snapshot()['gauges'] == {'scheduler_pending': 3}
+
+
+def test_prometheus_histogram_is_cumulative():
+    metrics = Metrics(buckets=(0.001, 0.01))
+    metrics.observe('draft', 0.0005)
+    metrics.observe('draft', 0.005)
+    metrics.observe('draft', 1.0)
+    metrics.increment('drafted')
+    lines = metrics.to_prometheus().splitlines()
+    assert 'outlook_auto_attach_events_total{event="drafted"} 1' in lines
+    assert 'outlook_auto_attach_stage_seconds_bucket{stage="draft",le="0.001"} 1' in lines
+    assert 'outlook_auto_attach_stage_seconds_bucket{stage="draft",le="0.01"} 2' in lines
+    assert 'outlook_auto_attach_stage_seconds_bucket{stage="draft",le="+Inf"} 3' in lines
+    assert 'outlook_auto_attach_stage_seconds_count{stage="draft"} 3' in lines
+
+
+def test_write_replaces_both_files(tmp_path):
+    metrics = Metrics()
+    metrics.increment('accepted')
+    json_path, prometheus_path = str(tmp_path / "stats.json"), str(tmp_path / "stats.prom")
+    metrics.write(json_path, prometheus_path)
+    with open(json_path, encoding='utf-8') as f:
+        assert json.load(f)['counters'] == {'accepted': 1}
+    with open(prometheus_path, encoding='utf-8') as f:
+        assert 'event="accepted"' in f.read()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["stats.json", "stats.prom"]
@@ -0,0 +1,80 @@
+"""osascript bridge: one helper process for many drafts, restarted after it hangs or crashes."""
+
+import json
+import sys
+
+import pytest
+
+from outlook_auto_attach.mail import PENDING, OsascriptBridge
+
+from conftest import wait_for
+from fakes import STUB_HELPER
+
+
+@pytest.fixture
+def bridge_for(tmp_path, monkeypatch):
+    """bridge_for(mode, timeout) -> an OsascriptBridge talking to the stub helper in that mode."""
+    stub = tmp_path / "stub_helper.py"
+    stub.write_text(STUB_HELPER, encoding='utf-8')
+    monkeypatch.setenv('STUB_LOG', str(tmp_path / "requests.jsonl"))
+    bridges = []
+    
+    def bridge_for(mode, timeout=5.0):
+        monkeypatch.setenv('STUB_MODE', mode)
+        bridge = OsascriptBridge(command=[sys.executable, str(stub)], timeout=timeout)
+        bridges.append(bridge)
+        return bridge
+    yield bridge_for
+    for bridge in bridges:
+        bridge.close()
+
+
+@pytest.fixture
+def attachment(tmp_path):
+    # Quotes and backslashes in the name used to break the generated AppleScript
+    path = tmp_path / 'Orderbekräftelse "12345" \\ kopia.pdf'
+    path.write_bytes(b"%PDF-1.4\n")
+    return str(path)
+
+
+def test_drafts_share_one_helper_process(bridge_for, attachment, tmp_path):
+    bridge = bridge_for('ok')
+    for _ in range(5):
+        assert bridge.open_draft([attachment, attachment], to="inkop@example.se", subject="Order 123456")[0]
+    assert bridge.starts == 1
+    assert bridge.drafts == 5
+    requests = [json.loads(line) for line in (tmp_path / "requests.jsonl").read_text(encoding='utf-8').splitlines()]
+    assert len(requests) == 5
+    assert requests[0]['attachments'] == [attachment, attachment]
+    assert (requests[0]['to'], requests[0]['subject']) == ("inkop@example.se", "Order 123456")
+
+
+def test_late_answer_is_passed_on(bridge_for, attachment, monkeypatch):
+    monkeypatch.setenv('STUB_DELAY_MS', '500')
+    bridge = bridge_for('ok', timeout=0.2)
+    late = []
+    # Written to the helper before the timeout: Outlook still opens it, so it must not count as failed
+    result = bridge.open_draft([attachment], on_done=lambda *answer: late.append(answer))
+    assert result == (PENDING, "Draft still opening in Outlook")
+    assert wait_for(lambda: late == [(True, "Outlook opened successfully")])
+    assert (bridge.starts, bridge.drafts, bridge.failures) == (1, 1, 0)
+
+
+def test_hung_helper_is_killed_and_restarted(bridge_for, attachment, monkeypatch):
+    bridge = bridge_for('hang', timeout=0.5)
+    late = []
+    assert bridge.open_draft([attachment], on_done=lambda *answer: late.append(answer))[0] is PENDING
+    monkeypatch.setenv('STUB_MODE', 'ok')
+    # Timing out behind a late draft: the helper is hung, both drafts fail
+    assert bridge.open_draft([attachment]) == (False, "Timeout opening Outlook")
+    assert wait_for(lambda: late == [(False, "osascript helper exited")])
+    assert bridge.open_draft([attachment])[0]
+    assert bridge.starts == 2
+
+
+def test_crashed_helper_fails_the_draft_in_flight_and_is_restarted(bridge_for, attachment, monkeypatch):
+    bridge = bridge_for('crash')
+    assert not bridge.open_draft([attachment])[0]
+    monkeypatch.setenv('STUB_MODE', 'ok')
+    assert bridge.open_draft([attachment])[0]
+    assert (bridge.starts, bridge.drafts, bridge.failures) == (2, 1, 1)
@@ -0,0 +1,122 @@
+"""Draft outbox: retries with backoff behind a circuit breaker, and results that arrive late."""
+
+import time
+
+import pytest
+
+from outlook_auto_attach.mail import PENDING
+from outlook_auto_attach.journal import DedupJournal
+from outlook_auto_attach.drafts import CircuitBreaker, DraftOutbox
+
+from conftest import wait_for
+from fakes import FlakyMailBackend, PendingMailBackend
+
+CONTENT_HASH = "0" * 64
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = DedupJournal(str(tmp_path / "journal.sqlite"))
+    journal.record(CONTENT_HASH, 9, "Orderbekräftelse.pdf", "Orderbekräftelse.pdf", DedupJournal.PENDING)
+    yield journal
+    journal.close()
+
+
+def make_outbox(scheduler, journal, tmp_path):
+    path = tmp_path / "Orderbekräftelse.pdf"
+    path.write_bytes(b"%PDF-1.4\n")
+    results = []
+    outbox = DraftOutbox(scheduler, journal=journal, mail_backend=PendingMailBackend(),
+                         on_result=lambda items, success, message: results.append(success))
+    item = {'path': str(path), 'filename': path.name, 'content_hash': CONTENT_HASH}
+    return outbox, item, results
+
+
+def test_pending_draft_is_drafted_when_outlook_finishes(scheduler, journal, tmp_path):
+    outbox, item, results = make_outbox(scheduler, journal, tmp_path)
+    assert outbox.send("Orderbekräftelse", [item]) is PENDING
+    # Neither drafted nor queued for a retry that would open it twice
+    assert journal.lookup(CONTENT_HASH)['outcome'] == DedupJournal.PENDING
+    assert (outbox.pending(), results) == (0, [])
+    
+    outbox.mail_backend.finish(True)
+    assert journal.lookup(CONTENT_HASH)['outcome'] == DedupJournal.DRAFTED
+    assert (outbox.pending(), results) == (0, [True])
+    assert outbox.metrics.counts()['drafted'] == 1
+    outbox.close()
+
+
+def test_pending_draft_that_fails_is_queued_for_retry(scheduler, journal, tmp_path):
+    outbox, item, results = make_outbox(scheduler, journal, tmp_path)
+    assert outbox.send("Orderbekräftelse", [item]) is PENDING
+    
+    outbox.mail_backend.finish(False, "Outlook closed")
+    assert journal.lookup(CONTENT_HASH)['outcome'] == DedupJournal.DRAFT_FAILED
+    assert (outbox.pending(), results) == (1, [False])
+    outbox.close()
+
+
+def test_breaker_opens_after_repeated_failures_and_backs_off():
+    breaker = CircuitBreaker("Outlook", failure_threshold=2, reset_timeout=0.2, max_reset_timeout=1.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+    
+    time.sleep(0.25)
+    assert breaker.allow()  # One trial call
+    assert breaker.state == CircuitBreaker.HALF_OPEN and not breaker.allow()
+    breaker.record_failure()
+    assert 0.2 < breaker.retry_in() <= 0.4  # Failed trial: the pause doubles
+    
+    time.sleep(0.45)
+    assert breaker.allow()
+    assert breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.stats()['refused'] == 2
+
+
+def test_backoff_is_exponential_with_jitter_and_capped(scheduler):
+    outbox = DraftOutbox(scheduler, retry_base_delay=1.0, retry_max_delay=10.0)
+    for attempts, step in [(1, 1.0), (2, 2.0), (3, 4.0), (5, 10.0), (20, 10.0)]:
+        assert all(step / 2 <= outbox._backoff(attempts) <= step for _ in range(50))
+    outbox.close()
+
+
+def test_failed_draft_is_kept_across_restarts_and_retried(scheduler, tmp_path):
+    path = tmp_path / "Orderbekräftelse.pdf"
+    path.write_bytes(b"%PDF-1.4\n")
+    item = {'path': str(path), 'filename': path.name}
+    db_path = str(tmp_path / "outbox.sqlite")
+    backend = FlakyMailBackend()
+    outbox = DraftOutbox(scheduler, mail_backend=backend, db_path=db_path, retry_base_delay=60.0)
+    assert not outbox.send("Orderbekräftelse", [item])
+    assert outbox.pending() == 1
+    outbox.close()
+    
+    backend.up.set()
+    restarted = DraftOutbox(scheduler, mail_backend=backend, db_path=db_path, retry_base_delay=60.0)
+    assert restarted.resume() == 1
+    assert wait_for(lambda: restarted.pending() == 0)
+    assert [draft['attachments'] for draft in backend.drafts] == [[str(path)]]
+    assert restarted.metrics.counts()['draft_retried'] == 1
+    restarted.close()
+
+
+def test_open_breaker_queues_drafts_without_calling_the_mail_client(scheduler, tmp_path):
+    path = tmp_path / "Orderbekräftelse.pdf"
+    path.write_bytes(b"%PDF-1.4\n")
+    backend = FlakyMailBackend()
+    outbox = DraftOutbox(scheduler, mail_backend=backend, retry_base_delay=60.0,
+                         breaker=CircuitBreaker("Outlook", failure_threshold=2, reset_timeout=60.0))
+    for _ in range(4):
+        outbox.send("Orderbekräftelse", [{'path': str(path), 'filename': path.name}])
+    assert backend.failed_calls == 2
+    assert outbox.pending() == 4
+    assert outbox.metrics.counts()['draft_refused'] == 2
+    
+    # A successful probe closes the breaker and retries the queue at once
+    backend.up.set()
+    outbox._probe()
+    assert wait_for(lambda: outbox.pending() == 0)
+    assert len(backend.drafts) == 4
+    outbox.close()
@@ -0,0 +1,88 @@
+"""Order number extraction: results arrive on the scheduler, never block the caller, and are capped."""
+
+import os
+import threading
+
+import pytest
+
+from outlook_auto_attach.settings import DEFAULT_CONFIG
+from outlook_auto_attach.prefill import OrderExtractor, create_draft_prefill
+
+from conftest import wait_for
+from fakes import synthetic_pdf
+
+needs_fifo = pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason="uses a named pipe to stall the worker")
+
+
+@pytest.fixture
+def extractor(scheduler):
+    extractor = OrderExtractor(DEFAULT_CONFIG['prefill_patterns'], scheduler=scheduler, budget=1.0,
+                               max_in_flight=1)
+    yield extractor
+    extractor.close()
+
+
+def stalled_pdf(folder, name="Scan 0001.pdf"):
+    """A PDF the worker cannot read until release() writes it (opening a FIFO blocks until a writer comes)."""
+    path = os.path.join(folder, name)
+    os.mkfifo(path)
+    
+    def release():
+        with open(path, 'wb') as f:
+            f.write(synthetic_pdf(123456, 1001))
+    return path, release
+
+
+def test_text_layer_fields_are_delivered_on_a_scheduler_worker(extractor, tmp_path):
+    path = tmp_path / "Scan 0001.pdf"
+    path.write_bytes(synthetic_pdf(123456, 1001))
+    delivered = []
+    extractor.extract(str(path), path.name, lambda fields: delivered.append((fields, threading.current_thread().name)))
+    assert extractor.wait(10)
+    assert delivered[0][0] == {'order': '123456', 'customer': '1001'}
+    assert delivered[0][1] != threading.current_thread().name
+
+
+def test_filename_with_both_numbers_skips_the_pdf(extractor, tmp_path):
+    delivered = []
+    extractor.extract(str(tmp_path / "missing.pdf"), "Orderbekräftelse 123456 kundnr 1001.pdf", delivered.append)
+    assert delivered == [{'order': '123456', 'customer': '1001'}]
+
+
+@needs_fifo
+def test_slow_pdf_is_drafted_without_its_text_after_the_budget(extractor, tmp_path):
+    path, release = stalled_pdf(str(tmp_path))
+    delivered = []
+    extractor.extract(path, os.path.basename(path), delivered.append)
+    assert not delivered
+    assert wait_for(lambda: delivered, timeout=5.0) == [{}]
+    assert extractor.metrics.counts()['extract_timeout'] == 1
+    release()
+    # The late worker result is dropped, not delivered a second time
+    assert wait_for(lambda: extractor._in_flight == 0, timeout=10.0) is True
+    assert delivered == [{}]
+
+
+@needs_fifo
+def test_pdfs_beyond_the_cap_are_drafted_without_their_text(extractor, tmp_path):
+    path, release = stalled_pdf(str(tmp_path))
+    first, second = [], []
+    extractor.extract(path, os.path.basename(path), first.append)
+    other = tmp_path / "Scan 0002.pdf"
+    other.write_bytes(synthetic_pdf(654321, 1002))
+    extractor.extract(str(other), other.name, second.append)
+    # Answered at once instead of queueing behind the stalled worker
+    assert second == [{}]
+    assert extractor.metrics.counts()['extract_busy'] == 1
+    release()
+    assert extractor.wait(10)
+    assert first == [{'order': '123456', 'customer': '1001'}]
+
+
+def test_prefill_is_off_unless_configured(scheduler):
+    assert create_draft_prefill(dict(DEFAULT_CONFIG), scheduler) == (None, None)
+    extractor, recipients = create_draft_prefill(dict(DEFAULT_CONFIG, prefill_drafts=True), scheduler)
+    try:
+        assert isinstance(extractor, OrderExtractor) and recipients is None
+    finally:
+        extractor.close()
@@ -0,0 +1,40 @@
+"""Recipient index refresh: appended CSV rows, and SQLite changes that only touch the -wal file."""
+
+import sqlite3
+
+from outlook_auto_attach.prefill import RecipientIndex
+
+
+def test_appended_csv_rows_are_read_incrementally(tmp_path):
+    source = tmp_path / "recipients.csv"
+    source.write_text("customer;email\n1001;a@example.se\n", encoding='utf-8')
+    index = RecipientIndex(str(source))
+    assert index.refresh() == 'reloaded'
+    with open(source, 'a', encoding='utf-8') as f:
+        f.write("1002;b@example.se\n")
+    assert index.refresh() == 'incremental'
+    assert index.lookup('1002')['email'] == "b@example.se"
+
+
+def test_sqlite_changes_in_the_wal_are_seen_and_deleted_customers_dropped(tmp_path):
+    source = tmp_path / "recipients.sqlite"
+    writer = sqlite3.connect(source)
+    writer.execute("PRAGMA journal_mode=WAL")
+    writer.execute("CREATE TABLE recipients (customer TEXT, email TEXT, updated INTEGER)")
+    writer.executemany("INSERT INTO recipients VALUES (?, ?, 1)", [('1001', "a@example.se"), ('1002', "b@example.se")])
+    writer.commit()
+    index = RecipientIndex(str(source))
+    try:
+        assert index.refresh() == 'reloaded'
+        assert len(index) == 2
+        
+        # The writer keeps its connection open, so nothing is checkpointed into the database file
+        writer.execute("DELETE FROM recipients WHERE customer = '1001'")
+        writer.execute("UPDATE recipients SET email = 'new@example.se', updated = 2 WHERE customer = '1002'")
+        writer.commit()
+        assert index.refresh() == 'reloaded'
+        assert index.lookup('1001') is None
+        assert index.lookup('1002')['email'] == "new@example.se"
+        assert index.refresh() == 'unchanged'
+    finally:
+        writer.close()
@@ -0,0 +1,48 @@
+"""Early rejection: events for files that can never match are dropped in the watcher callback."""
+
+import os
+
+import pytest
+from watchdog.events import FileCreatedEvent, FileMovedEvent
+
+from outlook_auto_attach.handler import DownloadsHandler
+
+from fakes import RecordingMailBackend
+
+
+@pytest.fixture
+def handler(scheduler, tmp_path):
+    handler = DownloadsHandler(str(tmp_path), scheduler=scheduler, max_depth=1, mail_backend=RecordingMailBackend())
+    handler.queued = []
+    handler._enqueue = handler.queued.append
+    return handler
+
+
+def created(handler, *parts):
+    handler.on_created(FileCreatedEvent(os.path.join(handler.downloads_folder, *parts)))
+
+
+def test_non_matching_and_temporary_files_are_not_queued(handler):
+    created(handler, "holiday.jpg")
+    created(handler, "Orderbekräftelse 1.pdf.crdownload")
+    created(handler, ".Orderbekräftelse 1.pdf")
+    created(handler, "a", "b", "Orderbekräftelse 1.pdf")  # Deeper than max_depth
+    assert handler.queued == []
+    counts = handler.metrics.counts()
+    assert (counts['rejected_name'], counts['rejected_temporary'], counts['rejected_depth']) == (1, 2, 1)
+
+
+def test_matching_file_is_queued_once(handler):
+    created(handler, "a", "Orderbekräftelse 1.pdf")
+    created(handler, "a", "Orderbekräftelse 1.pdf")
+    path = os.path.join(handler.downloads_folder, "a", "Orderbekräftelse 1.pdf")
+    assert handler.queued == [path]
+    assert handler.metrics.counts()['rejected_duplicate_event'] == 1
+
+
+def test_renamed_partial_download_is_queued(handler):
+    partial = os.path.join(handler.downloads_folder, "Orderbekräftelse 2.pdf.crdownload")
+    final = os.path.join(handler.downloads_folder, "Orderbekräftelse 2.pdf")
+    handler.on_created(FileCreatedEvent(partial))
+    handler.on_moved(FileMovedEvent(partial, final))
+    assert handler.queued == [final]
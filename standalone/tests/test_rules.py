@@ -0,0 +1,45 @@
+"""Filename rules: Unicode-normalized, case-insensitive matching in priority order."""
+
+import unicodedata
+
+import pytest
+
+from outlook_auto_attach.rules import DEFAULT_RULES, FilenameRule, RuleEngine, load_rule_engine
+
+NAME = "Orderbekräftelse 123456.pdf"
+
+
+@pytest.fixture
+def engine():
+    return RuleEngine.from_config(DEFAULT_RULES)
+
+
+@pytest.mark.parametrize('form', ['NFC', 'NFD'])
+def test_decomposed_names_match(engine, form):
+    # macOS file systems report "ä" decomposed (a + combining diaeresis)
+    name = unicodedata.normalize(form, "Inköpsorder 42.pdf")
+    assert engine.classify(name).name == 'Inköpsorder'
+    assert engine.classify(unicodedata.normalize(form, NAME).upper()).name == 'Orderbekräftelse'
+
+
+def test_decomposed_rule_patterns_match_composed_names():
+    rule = FilenameRule("Faktura", patterns=[unicodedata.normalize('NFD', "fakturaunderlag")],
+                        globs=[unicodedata.normalize('NFD', "kvitto-*-ö.pdf")])
+    engine = RuleEngine([rule])
+    assert engine.classify("FakturaUnderlag.pdf") is rule
+    assert engine.classify("Kvitto-1-Ö.PDF") is rule
+    assert engine.classify("kvitto-1-o.pdf") is None
+
+
+def test_extension_and_size_fall_through_to_later_rules():
+    small = FilenameRule("Small", patterns=["order"], extensions=["pdf"], max_size=100)
+    other = FilenameRule("Other", patterns=["order"])
+    engine = RuleEngine([small, other])
+    assert engine.classify(NAME, size=10) is small
+    assert engine.classify(NAME, size=1000) is other
+    assert engine.classify("order.docx") is other
+
+
+def test_invalid_rules_fall_back_to_defaults():
+    engine = load_rule_engine([{'name': "No patterns"}])
+    assert engine.classify(NAME).name == 'Orderbekräftelse'
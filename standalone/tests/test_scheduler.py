@@ -0,0 +1,91 @@
+import threading
+import time
+
+from outlook_auto_attach.scheduler import WorkScheduler
+from outlook_auto_attach.handler import DownloadsHandler
+
+from conftest import wait_for
+
+
+def test_delayed_jobs_run_in_due_order():
+    scheduler = WorkScheduler(workers=1).start()
+    order = []
+    scheduler.submit(order.append, 'late', delay=0.05)
+    scheduler.submit(order.append, 'early', delay=0.01)
+    assert wait_for(lambda: len(order) == 2)
+    scheduler.shutdown()
+    assert order == ['early', 'late']
+
+
+def test_full_queue_rejects_after_timeout():
+    scheduler = WorkScheduler(workers=1, max_pending=1).start()
+    scheduler.submit(time.sleep, 0.5, delay=1.0)
+    assert not scheduler.submit(time.sleep, 0, timeout=0.05)
+    assert scheduler.stats()['rejected'] == 1
+    scheduler.shutdown(drain=False)
+
+
+def test_drain_waits_for_queued_jobs():
+    scheduler = WorkScheduler(workers=1).start()
+    done = []
+    scheduler.submit(done.append, 1, delay=0.05)
+    scheduler.shutdown(drain=True, timeout=2.0)
+    assert done == [1]
+
+
+class StallingDetector:
+    """Completion detector whose first checks say 'still downloading' once the work queue is full."""
+    
+    first_delay = 0.0
+    deadline = 60.0
+    
+    def __init__(self, scheduler, pending_checks=3):
+        self.scheduler = scheduler
+        self.pending_checks = pending_checks
+        self.finished = []
+    
+    def start(self, file_path):
+        return {'path': file_path, 'started': time.monotonic(), 'checks': 0}
+    
+    def check(self, state):
+        state['checks'] += 1
+        if state['checks'] > self.pending_checks:
+            return 'ready', 0.0
+        # Blocked producers fill every freed slot before the check reschedules itself
+        wait_for(lambda: self.scheduler.pending() >= self.scheduler.max_pending)
+        return 'pending', 0.01
+    
+    def finish(self, state):
+        self.finished.append(state['path'])
+    
+    def mark_closed(self, file_path):
+        pass
+
+
+def test_completion_check_is_rescheduled_when_queue_is_full(tmp_path):
+    scheduler = WorkScheduler(workers=1, max_pending=4).start()
+    detector = StallingDetector(scheduler)
+    handler = DownloadsHandler(str(tmp_path), scheduler=scheduler, detector=detector)
+    processed = []
+    handler._process_file_delayed = lambda file_path, received=None: processed.append(file_path)
+    
+    stop = threading.Event()
+    
+    def producer():
+        # A download burst: keeps the queue at its limit
+        while not stop.is_set():
+            scheduler.submit(time.sleep, 0.002, timeout=0.5)
+    
+    path = str(tmp_path / "Orderbekräftelse.pdf")
+    assert handler._enqueue(path)
+    producers = [threading.Thread(target=producer) for _ in range(3)]
+    for thread in producers:
+        thread.start()
+    try:
+        assert wait_for(lambda: processed, timeout=10.0) == [path]
+    finally:
+        stop.set()
+        for thread in producers:
+            thread.join()
+        scheduler.shutdown(drain=False)
+    assert handler.metrics.counts().get('failed_reschedule', 0) == 0
@@ -0,0 +1,41 @@
+"""Cold start: the GUI libraries load only for the tray, and the resized tray icon is cached."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from outlook_auto_attach.tray import TRAY_ICON_SIZE, load_cached_icon
+
+from conftest import STANDALONE_DIR
+
+
+def test_cli_import_leaves_the_gui_libraries_for_the_tray():
+    code = "import sys, outlook_auto_attach.cli; print(sorted({'PIL', 'pystray'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=STANDALONE_DIR, capture_output=True, text=True,
+                            timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_tray_icon_is_resized_once_and_cached_by_logo_checksum(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    logo = tmp_path / "logo.png"
+    Image.new('RGBA', (512, 512), (0, 120, 212, 255)).save(logo)
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    
+    assert load_cached_icon(str(logo), Image, cache_dir=str(cache)).size == (TRAY_ICON_SIZE, TRAY_ICON_SIZE)
+    [cached] = os.listdir(cache)
+    assert load_cached_icon(str(logo), Image, cache_dir=str(cache)).size == (TRAY_ICON_SIZE, TRAY_ICON_SIZE)
+    assert os.listdir(cache) == [cached]
+    
+    # A new logo gets its own cache entry; an unreadable one is recreated
+    Image.new('RGBA', (512, 512), (200, 0, 0, 255)).save(logo)
+    load_cached_icon(str(logo), Image, cache_dir=str(cache))
+    assert len(os.listdir(cache)) == 2
+    (cache / cached).write_bytes(b"not a png")
+    Image.new('RGBA', (512, 512), (0, 120, 212, 255)).save(logo)
+    assert load_cached_icon(str(logo), Image, cache_dir=str(cache)).getpixel((0, 0)) == (0, 120, 212, 255)
+    assert (cache / cached).read_bytes() != b"not a png"
@@ -0,0 +1,95 @@
+"""Observer supervisor: restarts a dead watcher, falls back to polling, and stops from a signal handler."""
+
+import threading
+
+import pytest
+from watchdog.events import FileSystemEventHandler
+
+from outlook_auto_attach.observer import ObserverSupervisor, create_observer
+
+from conftest import wait_for
+
+
+class RecordingHandler(FileSystemEventHandler):
+    def __init__(self):
+        self.paths = []
+    
+    def on_created(self, event):
+        self.paths.append(event.src_path)
+
+
+@pytest.fixture
+def supervised(tmp_path):
+    """supervisor(**options) watching tmp_path/Downloads with a RecordingHandler; stopped afterwards."""
+    folder = tmp_path / "Downloads"
+    folder.mkdir()
+    handler = RecordingHandler()
+    supervisors = []
+    
+    def supervisor(**options):
+        options.setdefault('backoff_initial', 0.0)
+        supervisor = ObserverSupervisor([(handler, str(folder), False)], **options)
+        supervisors.append(supervisor)
+        return supervisor.start()
+    yield supervisor, handler, folder
+    for supervisor in supervisors:
+        supervisor.stop()
+
+
+def test_dead_observer_is_restarted_and_caught_up(supervised):
+    supervisor_for, handler, folder = supervised
+    restarts = []
+    supervisor = supervisor_for(on_restart=lambda: restarts.append(True))
+    assert supervisor.check()
+    
+    supervisor.observer.stop()
+    supervisor.observer.join(timeout=5)
+    assert supervisor.check()
+    assert (supervisor.restarts, len(restarts), supervisor.polling) == (1, 1, False)
+    (folder / "Orderbekräftelse 1.pdf").write_bytes(b"%PDF-1.4\n")
+    assert wait_for(lambda: handler.paths)
+
+
+def test_native_observer_that_keeps_failing_is_replaced_by_polling(supervised):
+    supervisor_for, handler, folder = supervised
+    
+    def factory(polling):
+        if not polling:
+            raise OSError("inotify watch limit reached")
+        return create_observer(polling=True, fast_interval=0.05)
+    supervisor = supervisor_for(observer_factory=factory, max_failures=3)
+    assert supervisor.observer is None
+    assert not supervisor.check()
+    assert not supervisor.polling
+    # Third failure: switched to polling, which starts on the next check
+    assert not supervisor.check()
+    assert supervisor.polling
+    assert supervisor.check()
+    assert supervisor.stats() == {'running': 1, 'polling': 1, 'restarts': 1}
+    (folder / "Orderbekräftelse 1.pdf").write_bytes(b"%PDF-1.4\n")
+    assert wait_for(lambda: handler.paths)
+
+
+def test_request_stop_does_not_wait_for_a_check_in_progress(supervised):
+    supervisor_for, _, _ = supervised
+    supervisor = supervisor_for()
+    with supervisor._lock:
+        # As if SIGTERM arrived while the main loop was inside check()
+        stopper = threading.Thread(target=supervisor.request_stop)
+        stopper.start()
+        stopper.join(timeout=1.0)
+        assert not stopper.is_alive()
+    assert supervisor.stopped()
+    assert not supervisor.check()
+
+
+def test_watch_on_a_removed_folder_is_restored_when_it_comes_back(supervised):
+    supervisor_for, handler, folder = supervised
+    supervisor = supervisor_for(mode='native')
+    folder.rmdir()
+    # The emitter stops on its own; restarting fails until the folder is back
+    assert wait_for(lambda: not supervisor.check(), timeout=5.0)
+    folder.mkdir()
+    assert wait_for(supervisor.check, timeout=5.0)
+    (folder / "Orderbekräftelse 1.pdf").write_bytes(b"%PDF-1.4\n")
+    assert wait_for(lambda: handler.paths)
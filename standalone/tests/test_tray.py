@@ -0,0 +1,28 @@
+"""Tray menu: Quit only asks main() to stop; main's own shutdown drains the pipeline."""
+
+import pytest
+
+pystray = pytest.importorskip("pystray")
+
+from outlook_auto_attach.tray import setup_tray_icon  # noqa: E402
+
+
+class QuitOnlySupervisor:
+    """Records stop requests; stopping anything from the tray thread fails the test."""
+    
+    def __init__(self):
+        self.requests = 0
+    
+    def request_stop(self):
+        self.requests += 1
+    
+    def stop(self):
+        raise AssertionError("the tray must leave the shutdown to main()")
+
+
+def test_quit_only_requests_a_stop():
+    supervisor = QuitOnlySupervisor()
+    icon = setup_tray_icon(supervisor)
+    quit_item = next(item for item in icon.menu.items if item.text == "Quit")
+    quit_item(icon)
+    assert supervisor.requests == 1
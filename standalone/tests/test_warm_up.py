@@ -0,0 +1,57 @@
+"""Warm-up: the mail client is connected before the first draft, and probed while idle."""
+
+import threading
+
+from outlook_auto_attach.mail import OutlookComSession
+from outlook_auto_attach.drafts import DraftOutbox
+
+from conftest import wait_for
+from fakes import FakeOutlookApplication, FlakyMailBackend, RecordingMailBackend
+
+
+def test_first_draft_after_warm_up_is_warm(scheduler, tmp_path):
+    path = tmp_path / "Orderbekräftelse.pdf"
+    path.write_bytes(b"%PDF-1.4\n")
+    outbox = DraftOutbox(scheduler, mail_backend=RecordingMailBackend())
+    outbox.warm_up(probe_interval=0)
+    assert wait_for(lambda: outbox.warm_up_ms is not None)
+    assert outbox.send("Orderbekräftelse", [{'path': str(path), 'filename': path.name}])
+    stats = outbox.stats()
+    assert stats['first_draft_warm'] == 1 and stats['first_draft_ms'] is not None
+    outbox.close()
+
+
+def test_failed_warm_up_is_retried_by_the_probe(scheduler):
+    backend = FlakyMailBackend()
+    outbox = DraftOutbox(scheduler, mail_backend=backend)
+    probed = threading.Event()
+    original_probe = outbox._probe
+    
+    def probe():
+        original_probe()
+        probed.set()
+    outbox._probe = probe
+    outbox.warm_up(probe_interval=0.05)
+    assert wait_for(lambda: outbox.metrics.counts().get('warm_up_failed') == 1)
+    assert probed.wait(5.0)
+    assert outbox.metrics.counts()['probe_failed'] >= 1
+    outbox.probe_interval = 0  # Stop probing
+    outbox.close()
+
+
+def test_com_warm_up_connects_once_on_the_com_thread(tmp_path):
+    outlook = FakeOutlookApplication(display_ms=0)
+    connected_on = []
+    
+    def connect():
+        connected_on.append(threading.current_thread().name)
+        return outlook
+    session = OutlookComSession(connect=connect, com_init=lambda: None, com_uninit=lambda: None)
+    assert session.warm_up() == (True, "Outlook 16.0.0.0")
+    path = tmp_path / "Orderbekräftelse.pdf"
+    path.write_bytes(b"%PDF-1.4\n")
+    assert session.open_draft([str(path)])[0]
+    # probe() only checks the cached proxy
+    assert session.probe()[0]
+    session.close()
+    assert connected_on == ["OutlookCOM"]